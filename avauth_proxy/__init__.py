@@ -1,48 +1,143 @@
-from flask import Flask, session, redirect, url_for
-from avauth_proxy.config import Config
-from avauth_proxy.utils.config_utils import get_app_config
-from avauth_proxy.utils.logging_utils import configure_logging
-from authlib.integrations.flask_client import OAuth
-
-
-app = Flask(__name__)
-
-# Now load dynamic config
-app_config = get_app_config()
-Config.USE_OAUTH2_PROXY = app_config.get("use_oauth2_proxy", True)
-Config.ADMIN_EMAILS = app_config.get("admin_emails", [])
-
-app.secret_key = app_config.get("secret_key", Config.SECRET_KEY)
-app.config.update({
-    "SESSION_COOKIE_SECURE": app_config.get("session_cookie_secure", Config.SESSION_COOKIE_SECURE),
-    "SESSION_COOKIE_HTTPONLY": app_config.get("session_cookie_httponly", Config.SESSION_COOKIE_HTTPONLY),
-    "SESSION_COOKIE_SAMESITE": app_config.get("session_cookie_samesite", Config.SESSION_COOKIE_SAMESITE),
-})
-
-configure_logging()
-
-oauth = OAuth(app)  # OAuth instance for internal OAuth mode
-
-# Import and register blueprints
-from avauth_proxy.blueprints.auth_routes import auth_bp
-from avauth_proxy.blueprints.proxy_routes import proxy_bp
-from avauth_proxy.blueprints.metrics_routes import metrics_bp
-
-app.register_blueprint(auth_bp, url_prefix="/auth")
-app.register_blueprint(proxy_bp, url_prefix="/proxy")
-app.register_blueprint(metrics_bp, url_prefix="/metrics")
-
-print(app.url_map)
-
-# If internal OAuth is used, login endpoints are under /auth
-# If oauth2-proxy is used, authentication is handled externally.
-
-@app.route('/')
-def index():
-    # Redirect to dashboard if logged in internally, else login
-    if not Config.USE_OAUTH2_PROXY:
-        if 'user' in session:
-            return redirect(url_for('proxy.dashboard'))
-        else:
-            return redirect(url_for('auth.login'))
-    return redirect(url_for('proxy.dashboard'))
+"""
+create_app() builds the Flask app. Nothing is built at import time:
+`avauth_proxy.app` and `avauth_proxy.oauth` are a default app (and its
+OAuth registry) created on first access, and submodules such as
+utils.nginx_utils can be imported by tools without reading config.toml.
+Authlib, the app's blueprints and the WSGI fast path are only imported
+when an app is created.
+"""
+import gc
+import threading
+
+_build_lock = threading.RLock()
+_app = None
+
+
+def create_app():
+    """Build a Flask app from config.toml (Config.CONFIG_TOML_FILE)."""
+    from flask import Flask, session, redirect, url_for
+    from werkzeug.middleware.dispatcher import DispatcherMiddleware
+    from avauth_proxy.config import Config
+    from avauth_proxy.utils.config_utils import reload_config
+    from avauth_proxy.utils.logging_utils import configure_logging
+    from avauth_proxy.utils.oidc_utils import CachedOAuth
+    from avauth_proxy.utils.oauth_utils import load_oauth_providers
+    from avauth_proxy.utils.session_utils import ServerSideSessionInterface, create_session_store
+
+    app = Flask(__name__)
+
+    # Now load dynamic config. Admins, use_oauth2_proxy and providers follow
+    # later edits (see watch_utils); the secret and cookie settings below
+    # are fixed for the app's lifetime.
+    app_config = reload_config(force=True).settings
+
+    app.secret_key = app_config.get("secret_key", Config.SECRET_KEY)
+    app.config.update({
+        "SESSION_COOKIE_SECURE": app_config.get("session_cookie_secure", Config.SESSION_COOKIE_SECURE),
+        "SESSION_COOKIE_HTTPONLY": app_config.get("session_cookie_httponly", Config.SESSION_COOKIE_HTTPONLY),
+        "SESSION_COOKIE_SAMESITE": app_config.get("session_cookie_samesite", Config.SESSION_COOKIE_SAMESITE),
+    })
+
+    # Server-side sessions keep only an opaque id in the cookie
+    session_backend = app_config.get("session_backend", Config.SESSION_BACKEND)
+    if session_backend != "cookie":
+        app.session_interface = ServerSideSessionInterface(create_session_store(session_backend))
+
+    configure_logging()
+
+    # OAuth registry for internal OAuth mode; views reach it through get_oauth()
+    oauth = CachedOAuth(app)
+    app.extensions["avauth_oauth"] = oauth
+
+    # Register providers once at startup; login routes reuse the registry
+    load_oauth_providers(oauth)
+
+    # Import and register blueprints
+    from avauth_proxy.blueprints.auth_routes import auth_bp
+    from avauth_proxy.blueprints.proxy_routes import proxy_bp
+    from avauth_proxy.blueprints.metrics_routes import metrics_bp
+
+    app.register_blueprint(auth_bp, url_prefix="/auth")
+    app.register_blueprint(proxy_bp, url_prefix="/proxy")
+    app.register_blueprint(metrics_bp, url_prefix="/metrics")
+
+    # Nginx auth_request subrequests hit /auth/validate/<service_name> for every
+    # proxied request; answer them with a bare WSGI handler in front of Flask.
+    # auth_bp.validate_service stays registered as the reference implementation.
+    from avauth_proxy.utils.wsgi_utils import make_validate_app
+    app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {"/auth/validate": make_validate_app(app)})
+
+    # If internal OAuth is used, login endpoints are under /auth
+    # If oauth2-proxy is used, authentication is handled externally.
+
+    @app.route('/')
+    def index():
+        # Redirect to dashboard if logged in internally, else login
+        if not Config.USE_OAUTH2_PROXY:
+            if 'user' in session:
+                return redirect(url_for('proxy.dashboard'))
+            else:
+                return redirect(url_for('auth.login'))
+        return redirect(url_for('proxy.dashboard'))
+
+    return app
+
+
+def get_oauth(app=None):
+    """The OAuth registry of `app` (default: the current app)."""
+    if app is None:
+        from flask import current_app
+        app = current_app
+    return app.extensions["avauth_oauth"]
+
+
+def warm_app(app, timeout=10.0):
+    """
+    Build everything workers would otherwise build on their first requests,
+    so a preloading gunicorn master shares it copy-on-write: the policy
+    index, compiled Nginx and page templates, and the provider clients.
+    Then drop what must not cross fork(): open SQLite connections and
+    pooled HTTP connections of the OIDC cache (after waiting up to
+    `timeout` seconds for discovery prefetches).
+    """
+    from avauth_proxy.utils.policy_utils import get_policy_index
+    from avauth_proxy.utils.store_utils import get_proxy_store
+    from avauth_proxy.utils.template_utils import get_template_env, list_nginx_templates
+    from avauth_proxy.utils.oauth_utils import load_oauth_providers
+    from avauth_proxy.utils.oidc_utils import oidc_cache
+
+    get_policy_index()
+    env = get_template_env()
+    for name in list_nginx_templates():
+        env.get_template(name)
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    oauth = get_oauth(app)
+    for name in load_oauth_providers(oauth):
+        oauth.create_client(name)
+
+    oidc_cache.wait_idle(timeout)
+    oidc_cache.close()
+    get_proxy_store().close()
+    # Keep the garbage collector from touching (and so copying) the
+    # preloaded objects in every worker
+    gc.collect()
+    gc.freeze()
+
+
+def get_app():
+    """The default app, created on first use (`avauth_proxy.app`)."""
+    global _app
+    if _app is None:
+        with _build_lock:
+            if _app is None:
+                _app = create_app()
+    return _app
+
+
+def __getattr__(name):
+    if name == "app":
+        return get_app()
+    if name == "oauth":
+        return get_oauth(get_app())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
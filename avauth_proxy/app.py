@@ -1,5 +1,9 @@
-from avauth_proxy import app
+from avauth_proxy import get_app
+from avauth_proxy.utils.watch_utils import start_config_watcher
+
+app = get_app()
 
 if __name__ == '__main__':
     # Run in debug mode for development. In production, run via gunicorn.
+    start_config_watcher()
     app.run(host='0.0.0.0', port=5000, debug=True)
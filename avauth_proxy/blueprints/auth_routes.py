@@ -1,9 +1,19 @@
+import time
+import uuid
 from flask import Blueprint, render_template, session, redirect, url_for
 from avauth_proxy.utils.oauth_utils import load_oauth_providers
 from avauth_proxy.utils.logging_utils import log_configuration_on_error, log_event
+from avauth_proxy.utils.config_utils import get_app_config
+from avauth_proxy.utils.http_utils import ProviderUnavailableError
+from avauth_proxy.utils.oidc_utils import resolve_user_info
+from avauth_proxy.utils.session_utils import regenerate_session
+from avauth_proxy.utils.metrics_utils import auth_failures, provider_call_duration, validate_duration
 from avauth_proxy.utils.decorator_utils import log_route_error
+from avauth_proxy.utils.policy_utils import decide_access
+from avauth_proxy.utils.cache_utils import decision_cache
+from avauth_proxy.utils.acl_utils import set_identity_cookies, clear_identity_cookies
 from avauth_proxy.config import Config
-from avauth_proxy import oauth
+from avauth_proxy import get_oauth
 
 auth_bp = Blueprint("auth", __name__)
 
@@ -14,7 +24,7 @@ def login():
     if Config.USE_OAUTH2_PROXY:
         return redirect("/oauth2/sign_in")
 
-    providers = load_oauth_providers(oauth)
+    providers = load_oauth_providers(get_oauth())
     providers_list = providers.values()
     return render_template("auth/login.html", providers=providers_list)
 
@@ -24,6 +34,7 @@ def oauth_login(provider_name):
     if Config.USE_OAUTH2_PROXY:
         return "Not applicable when using oauth2-proxy", 400
 
+    oauth = get_oauth()
     providers = load_oauth_providers(oauth)
     if provider_name not in providers:
         return "Unsupported provider", 400
@@ -37,26 +48,34 @@ def authorize(provider_name):
     if Config.USE_OAUTH2_PROXY:
         return "Not applicable when using oauth2-proxy", 400
 
+    oauth = get_oauth()
     providers = load_oauth_providers(oauth)
     if provider_name not in providers:
         return "Unsupported provider", 400
 
     client = oauth.create_client(provider_name)
     try:
-        token = client.authorize_access_token()
+        with provider_call_duration.labels(provider=provider_name, operation="token").time():
+            token = client.authorize_access_token()
 
-        # For Google (OpenID Connect), we don't need to make a separate userinfo call
-        if provider_name == "google":
-            user_info = token.get('userinfo')
-            if not user_info:
-                user_info = client.parse_id_token(token)
-        else:
-            user_info = client.userinfo()
+        # OIDC providers: claims from the locally verified ID token; userinfo
+        # is only fetched when they are incomplete (or for plain OAuth2)
+        user_info = resolve_user_info(client, token, providers[provider_name])
 
+        regenerate_session(session)
         session["user"] = user_info
+        # Opaque per-login id used to key and invalidate cached decisions
+        session["sid"] = uuid.uuid4().hex
         log_event(f"Successful login for provider {provider_name}", "auth_success")
-        return redirect(url_for("proxy.dashboard"))
+        # Identity cookie Nginx can verify itself for allowlist-only services
+        return set_identity_cookies(redirect(url_for("proxy.dashboard")), user_info.get("email"))
+    except ProviderUnavailableError as e:
+        # Circuit open or provider saturated: fail fast, nothing to log in detail
+        auth_failures.inc()
+        log_event(f"Provider {provider_name} unavailable: {e}", "auth_failure")
+        return f"{provider_name} is temporarily unavailable, please retry shortly", 503
     except Exception as e:
+        auth_failures.inc()
         # Get the full configuration for logging
         config = get_app_config()
 
@@ -72,9 +91,10 @@ def logout():
     Logs out the user from the internal session if not using oauth2-proxy.
     """
     session.pop("user", None)
+    decision_cache.invalidate_session(session.pop("sid", None))
     if Config.USE_OAUTH2_PROXY:
         return redirect("/oauth2/sign_out")
-    return redirect(url_for("auth.login"))
+    return clear_identity_cookies(redirect(url_for("auth.login")))
 
 @auth_bp.route("/validate/<service_name>")
 def validate_service(service_name):
@@ -83,39 +103,7 @@ def validate_service(service_name):
     and if they're allowed for this particular service.
     Return 200 if allowed, 401 or 403 if not.
     """
-    from avauth_proxy.utils.file_utils import load_proxies
-    proxies = load_proxies()
-
-    # Find the matching service config
-    service = next((p for p in proxies if p["service_name"] == service_name), None)
-    if not service:
-        # If service not found, deny
-        return "", 403
-
-    # Check if the user is in Flask session
-    if "user" not in session:
-        # Not logged in => return 401
-        return "", 401
-
-    user_info = session["user"]  # e.g., user_info["email"]
-    user_email = user_info.get("email")
-
-    # If service has auth_required == false, then 200
-    if not service.get("auth_required", False):
-        return "", 200
-
-    # If service has a list of allowed_emails
-    allowed_emails = service.get("allowed_emails", [])
-    allowed_domains = service.get("allowed_domains", [])
-
-    # If the user email is in allowed_emails => OK
-    if user_email in allowed_emails:
-        return "", 200
-
-    # Or if domain is in allowed_domains
-    user_domain = user_email.split("@")[-1] if user_email else ""
-    if user_domain in allowed_domains:
-        return "", 200
-
-    # Otherwise 403
-    return "", 403
+    started = time.perf_counter()
+    status = decide_access(service_name, session.get("user"), session.get("sid"))
+    validate_duration.labels(path="flask", status=str(status)).observe(time.perf_counter() - started)
+    return "", status
@@ -1,15 +1,14 @@
 from flask import Blueprint
-from prometheus_client import generate_latest, Counter, Gauge
+from avauth_proxy.utils.metrics_utils import collect_metrics
 
 metrics_bp = Blueprint("metrics", __name__)
 
-# Prometheus metrics
-num_proxies = Gauge("num_proxies", "Number of active proxies")
-auth_failures = Counter("auth_failures", "Failed authentication attempts")
 
 @metrics_bp.route("/")
 def metrics():
     """
-    Prometheus scrape endpoint for metrics.
+    Prometheus scrape endpoint for metrics. Under gunicorn with
+    PROMETHEUS_MULTIPROC_DIR set, the values of all workers are aggregated.
     """
-    return generate_latest()
+    body, content_type = collect_metrics()
+    return body, 200, {"Content-Type": content_type}
@@ -1,17 +1,24 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, abort
-from avauth_proxy.utils.file_utils import load_proxies, save_proxies
-from avauth_proxy.utils.nginx_utils import generate_nginx_configs
+from flask import Blueprint, request, redirect, url_for, session, abort, jsonify, make_response, Response
+from avauth_proxy.utils.file_utils import proxies_changed
+from avauth_proxy.utils.store_utils import get_proxy_store, ProxyExistsError, ProxyNotFoundError
+from avauth_proxy.utils.reload_utils import schedule_nginx_reload, wait_for_nginx_reload
+from avauth_proxy.utils.batch_utils import BatchError, validate_operations, apply_operations
 from avauth_proxy.utils.logging_utils import log_event
 from avauth_proxy.utils.decorator_utils import log_route_error
 from avauth_proxy.config import Config
-from avauth_proxy.utils import get_available_templates, load_events
+from avauth_proxy.utils import get_available_templates
+from avauth_proxy.utils.event_utils import get_event_store
+from avauth_proxy.utils.policy_utils import get_policy_index
+from avauth_proxy.utils.stream_utils import StreamedPage, stream_page_template
 
 proxy_bp = Blueprint("proxy", __name__)
 
 @proxy_bp.before_request
 def require_admin():
-    # If user not logged in, redirect to login
+    # If user not logged in, redirect to login (JSON API: 401)
     if "user" not in session:
+        if request.endpoint and request.endpoint.startswith("proxy.api_"):
+            return jsonify(error="login required"), 401
         return redirect(url_for("auth.login"))
     user_email = session["user"].get("email")
     # If user_email is not in admin list, 403
@@ -32,9 +39,13 @@ def dashboard():
         if "user" not in session:
             return redirect(url_for("auth.login"))
 
-    proxies = load_proxies()
     templates = get_available_templates()
-    return render_template("proxy/dashboard.html", proxies=proxies, templates=templates)
+    proxies = StreamedPage(get_proxy_store().scan(
+        _page_size(), cursor=request.args.get("cursor"), search=request.args.get("q") or None,
+    ))
+    return Response(stream_page_template(
+        "proxy/dashboard.html", proxies=proxies, templates=templates, q=request.args.get("q", ""),
+    ))
 
 @proxy_bp.route("/add_proxy", methods=["POST"])
 @log_route_error()
@@ -60,21 +71,22 @@ def add_proxy():
     allowed_domains_str = request.form.get("allowed_domains", "")
     allowed_domains = [d.strip() for d in allowed_domains_str.split(",") if d.strip()]
 
-    proxies = load_proxies()
-    proxies.append({
-        "service_name": service_name,
-        "url": url_,
-        "port": port,
-        "template": template,
-        "auth_required": auth_required,
-        "allowed_emails": allowed_emails,
-        "allowed_domains": allowed_domains,
-        "custom_directives": custom_directives
-    })
-
-    save_proxies(proxies)
-    generate_nginx_configs(proxies)
-    log_event(f"Added new proxy: {service_name}", "add")
+    try:
+        get_proxy_store().create({
+            "service_name": service_name,
+            "url": url_,
+            "port": port,
+            "template": template,
+            "auth_required": auth_required,
+            "allowed_emails": allowed_emails,
+            "allowed_domains": allowed_domains,
+            "custom_directives": custom_directives
+        })
+    except ProxyExistsError as e:
+        return abort(409, str(e))
+    proxies_changed()
+    generation = schedule_nginx_reload()
+    log_event(f"Added new proxy: {service_name} (config generation {generation})", "add")
     return redirect(url_for("proxy.dashboard"))
 
 @proxy_bp.route("/remove_proxy", methods=["POST"])
@@ -87,10 +99,148 @@ def remove_proxy():
         return redirect(url_for("auth.login"))
 
     service_name = request.form["service_name"]
-    proxies = [p for p in load_proxies() if p["service_name"] != service_name]
-    save_proxies(proxies)
-    generate_nginx_configs(proxies)
-    log_event(f"Removed proxy: {service_name}", "remove")
+    try:
+        get_proxy_store().delete(service_name)
+    except ProxyNotFoundError:
+        # Already gone (e.g. a double submit)
+        return redirect(url_for("proxy.dashboard"))
+    proxies_changed()
+    generation = schedule_nginx_reload()
+    log_event(f"Removed proxy: {service_name} (config generation {generation})", "remove")
+    return redirect(url_for("proxy.dashboard"))
+
+def _page_size():
+    """Proxies per dashboard/status page: DASHBOARD_PAGE_SIZE or ?limit=, capped."""
+    try:
+        limit = int(request.args.get("limit", Config.DASHBOARD_PAGE_SIZE))
+    except ValueError:
+        limit = Config.DASHBOARD_PAGE_SIZE
+    return max(1, min(limit, Config.PROXY_API_MAX_PAGE_SIZE))
+
+def _etag(store_id, version):
+    return f"{store_id}-{version}"
+
+def _not_modified():
+    """
+    304 response if the client's ETag names the current policy version, as
+    known to this worker's policy index (no store access), else None.
+    """
+    etag = _etag(*get_policy_index().store_version)
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def _json_with_etag(body, version):
+    response = jsonify(body)
+    response.set_etag(_etag(get_proxy_store().store_id, version))
+    response.cache_control.no_cache = True
+    return response
+
+def _select_fields(proxy, fields):
+    if not fields:
+        return proxy
+    return {key: value for key, value in proxy.items() if key in fields or key == "service_name"}
+
+@proxy_bp.route("/api/proxies")
+@log_route_error()
+def api_proxies():
+    """
+    List proxies as JSON, ordered by service_name.
+
+    Query parameters: `limit` (default PROXY_API_PAGE_SIZE), `cursor` (the
+    next_cursor of the previous page), `q` (substring of service_name or
+    url) and `fields` (comma-separated; service_name is always included).
+    The ETag is the policy version, so an unchanged poll gets a 304.
+    """
+    not_modified = _not_modified()
+    if not_modified is not None:
+        return not_modified
+    try:
+        limit = int(request.args.get("limit", Config.PROXY_API_PAGE_SIZE))
+    except ValueError:
+        return jsonify(error="limit must be an integer"), 400
+    limit = max(1, min(limit, Config.PROXY_API_MAX_PAGE_SIZE))
+    fields = {f.strip() for f in request.args.get("fields", "").split(",") if f.strip()}
+
+    page = get_proxy_store().page(limit, cursor=request.args.get("cursor"), search=request.args.get("q"))
+    return _json_with_etag({
+        "proxies": [_select_fields(proxy, fields) for proxy in page.proxies],
+        "next_cursor": page.next_cursor,
+        "version": page.version,
+    }, page.version)
+
+@proxy_bp.route("/api/proxies/<service_name>")
+@log_route_error()
+def api_proxy(service_name):
+    """One proxy as JSON, with the same ETag handling as api_proxies()."""
+    not_modified = _not_modified()
+    if not_modified is not None:
+        return not_modified
+    store = get_proxy_store()
+    version, proxy = store.version(), store.get(service_name)
+    if proxy is None:
+        return jsonify(error=f"Proxy {service_name} does not exist"), 404
+    fields = {f.strip() for f in request.args.get("fields", "").split(",") if f.strip()}
+    return _json_with_etag(_select_fields(proxy, fields), version)
+
+@proxy_bp.route("/api/batch", methods=["POST"])
+@log_route_error()
+def api_batch():
+    """
+    Apply a batch of proxy operations from a JSON body:
+
+        {"operations": [{"op": "create", "proxy": {...}},
+                        {"op": "update", "service_name": "x", "proxy": {...changed fields}},
+                        {"op": "delete", "service_name": "y"}],
+         "wait": false}
+
+    Every operation is validated before any is applied (400 otherwise);
+    then all are applied in one transaction, or none if one conflicts with
+    the current proxies (409). A successful batch schedules one config
+    generation; with "wait" the response includes its outcome.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify(error="expected a JSON object"), 400
+    try:
+        result = apply_operations(validate_operations(body.get("operations")))
+    except BatchError as e:
+        invalid = not e.results or any(item["status"] == "invalid" for item in e.results)
+        return jsonify(error=str(e), results=e.results), 400 if invalid else 409
+
+    response = {"version": result.version, "generation": None, "results": result.results}
+    if result.changed:
+        proxies_changed()
+        response["generation"] = schedule_nginx_reload()
+        log_event(
+            f"Applied batch of {len(result.results)} proxy operations "
+            f"(config generation {response['generation']})", "batch"
+        )
+        if body.get("wait"):
+            try:
+                generation = wait_for_nginx_reload(response["generation"], timeout=Config.NGINX_BATCH_WAIT_TIMEOUT)
+                if generation is not None:
+                    response["nginx"] = {key: len(value) for key, value in generation._asdict().items()}
+            except TimeoutError:
+                return jsonify(response), 202
+            except Exception as e:
+                response["nginx_error"] = str(e)
+                return jsonify(response), 502
+    return jsonify(response)
+
+@proxy_bp.route("/refresh_proxies", methods=["POST"])
+@log_route_error()
+def refresh_proxies():
+    """
+    Re-render all proxy configurations and reload Nginx.
+    """
+    if not Config.USE_OAUTH2_PROXY and "user" not in session:
+        return redirect(url_for("auth.login"))
+
+    generation = schedule_nginx_reload()
+    log_event(f"Manually refreshed proxies (config generation {generation})", "refresh")
     return redirect(url_for("proxy.dashboard"))
 
 @proxy_bp.route("/status")
@@ -102,6 +252,14 @@ def status():
     if not Config.USE_OAUTH2_PROXY and "user" not in session:
         return redirect(url_for("auth.login"))
 
-    proxies = load_proxies()
-    events = load_events()
-    return render_template("proxy/status.html", proxies=proxies, events=events)
+    proxies = StreamedPage(get_proxy_store().scan(_page_size(), cursor=request.args.get("proxy_cursor")))
+    events = StreamedPage(get_event_store().scan(
+        cursor=request.args.get("cursor"),
+        code=request.args.get("code") or None,
+    ))
+    return Response(stream_page_template(
+        "proxy/status.html",
+        proxies=proxies,
+        events=events,
+        code=request.args.get("code", ""),
+    ))
@@ -0,0 +1,175 @@
+"""
+Command line tools that work without starting the app.
+
+avauth-render renders the Nginx configs of proxies_config.toml, e.g. in
+container builds and CI:
+
+    avauth-render --proxies proxies_config.toml --output build/nginx --workers 8
+
+avauth-proxies moves proxies between the proxy store and TOML files, and
+applies JSON batches of create/update/delete operations (the body of
+POST /proxy/api/batch) with a single config generation:
+
+    avauth-proxies export proxies_config.toml
+    avauth-proxies import proxies_config.toml
+    avauth-proxies apply onboarding.json
+"""
+import os
+import sys
+import json
+import tomllib
+import argparse
+from avauth_proxy.config import Config
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="avauth-render", description="Render Nginx configs from a proxies TOML file.")
+    parser.add_argument("--proxies", default=Config.PROXIES_CONFIG_FILE,
+                        help="proxies TOML file (default: %(default)s)")
+    parser.add_argument("--config", default=Config.CONFIG_TOML_FILE,
+                        help="config.toml for use_oauth2_proxy and nginx_acl_secret; "
+                             "skipped when missing (default: %(default)s)")
+    parser.add_argument("--output", default=Config.NGINX_CONFIG_DIR,
+                        help="directory for the per-service configs (default: %(default)s)")
+    parser.add_argument("--acl-map-file", default=None,
+                        help="where to write the ACL maps (default: next to --output)")
+    parser.add_argument("--templates", default=Config.NGINX_TEMPLATES_DIR,
+                        help="Nginx templates directory (default: the bundled templates)")
+    parser.add_argument("--workers", type=int, default=Config.NGINX_RENDER_WORKERS,
+                        help="render processes, 0 for one per CPU, 1 to render in-process")
+    parser.add_argument("--chunk-size", type=int, default=Config.NGINX_RENDER_CHUNK_SIZE,
+                        help="proxies per work item (default: %(default)s)")
+    parser.add_argument("--parallel-min", type=int, default=Config.NGINX_RENDER_PARALLEL_MIN,
+                        help="proxy count from which the pool is used (default: %(default)s)")
+    parser.add_argument("--reload", action="store_true", help="run `nginx -s reload` if anything changed")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    return parser
+
+
+def load_settings(path):
+    """The merged [app] and [auth] tables of config.toml, {} if it is missing."""
+    if not path or not os.path.exists(path):
+        return {}
+    from avauth_proxy.utils.config_utils import read_config_snapshot
+    return read_config_snapshot(path).settings
+
+
+def use_render_settings(path):
+    """Render with use_oauth2_proxy and nginx_acl_secret from config.toml at `path`."""
+    settings = load_settings(path)
+    Config.USE_OAUTH2_PROXY = settings.get("use_oauth2_proxy", True)
+    Config.NGINX_ACL_SECRET = settings.get("nginx_acl_secret", Config.NGINX_ACL_SECRET)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not os.path.exists(args.proxies):
+        print(f"avauth-render: {args.proxies} not found", file=sys.stderr)
+        return 2
+    with open(args.proxies, "rb") as f:
+        proxies = tomllib.load(f).get("proxies", [])
+
+    use_render_settings(args.config)
+    Config.NGINX_CONFIG_DIR = args.output
+    Config.NGINX_ACL_MAP_FILE = args.acl_map_file or os.path.join(
+        os.path.dirname(os.path.abspath(args.output)), os.path.basename(Config.NGINX_ACL_MAP_FILE)
+    )
+    Config.NGINX_TEMPLATES_DIR = args.templates
+    Config.NGINX_RENDER_CHUNK_SIZE = args.chunk_size
+    Config.NGINX_RENDER_PARALLEL_MIN = args.parallel_min
+
+    # Imported late so --help stays instant
+    from avauth_proxy.utils.nginx_utils import generate_nginx_configs
+    try:
+        result = generate_nginx_configs(proxies, workers=args.workers, reload=args.reload)
+    except RuntimeError as e:
+        print(f"avauth-render: {e}", file=sys.stderr)
+        return 1
+
+    if args.json:
+        print(json.dumps(result._asdict(), sort_keys=True))
+    else:
+        print(f"{len(proxies)} proxies: {len(result.written)} written, "
+              f"{len(result.removed)} removed, {len(result.unchanged)} unchanged")
+    return 0
+
+
+def build_proxies_parser():
+    parser = argparse.ArgumentParser(prog="avauth-proxies", description="Manage the proxy store.")
+    parser.add_argument("--store", default=None,
+                        help="proxy store database (default: PROXY_STORE_FILE, else next to PROXIES_CONFIG_FILE)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="replace the store's proxies with those of a TOML file")
+    import_parser.add_argument("file")
+    export_parser = commands.add_parser("export", help="write the store's proxies to a TOML file")
+    export_parser.add_argument("file")
+    apply_parser = commands.add_parser("apply", help="apply a JSON batch of operations (- for stdin)")
+    apply_parser.add_argument("file")
+    apply_parser.add_argument("--config", default=Config.CONFIG_TOML_FILE,
+                              help="config.toml for use_oauth2_proxy and nginx_acl_secret (default: %(default)s)")
+    apply_parser.add_argument("--no-render", action="store_true", help="only change the store")
+    apply_parser.add_argument("--no-reload", action="store_true", help="render but do not reload Nginx")
+    return parser
+
+
+def apply_batch(store, args):
+    from avauth_proxy.utils.batch_utils import BatchError, validate_operations, apply_operations
+    try:
+        if args.file == "-":
+            body = json.load(sys.stdin)
+        else:
+            with open(args.file, "r", encoding="utf-8") as f:
+                body = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"avauth-proxies: cannot read {args.file}: {e}", file=sys.stderr)
+        return 2
+    operations = body.get("operations") if isinstance(body, dict) else body
+
+    try:
+        result = apply_operations(validate_operations(operations), store)
+    except BatchError as e:
+        print(json.dumps({"error": str(e), "results": e.results}, indent=2))
+        return 1
+    output = {"version": result.version, "results": result.results}
+
+    if result.changed and not args.no_render:
+        use_render_settings(args.config)
+        from avauth_proxy.utils.nginx_utils import generate_nginx_configs
+        if Config.PROXY_STORE_EXPORT and not args.store:
+            store.export_toml(Config.PROXIES_CONFIG_FILE)
+        try:
+            generation = generate_nginx_configs(store.list(), reload=not args.no_reload)
+        except RuntimeError as e:
+            output["nginx_error"] = str(e)
+            print(json.dumps(output, indent=2))
+            return 1
+        output["nginx"] = {key: len(value) for key, value in generation._asdict().items()}
+    print(json.dumps(output, indent=2))
+    return 0
+
+
+def proxies_main(argv=None):
+    args = build_proxies_parser().parse_args(argv)
+    from avauth_proxy.utils.store_utils import ProxyStore, get_proxy_store
+    store = ProxyStore(args.store) if args.store else get_proxy_store()
+
+    if args.command == "apply":
+        return apply_batch(store, args)
+    if args.command == "import":
+        if not os.path.exists(args.file):
+            print(f"avauth-proxies: {args.file} not found", file=sys.stderr)
+            return 2
+        try:
+            version = store.import_toml(args.file)
+        except (ValueError, tomllib.TOMLDecodeError) as e:
+            print(f"avauth-proxies: {e}", file=sys.stderr)
+            return 1
+        print(f"Imported {len(store)} proxies (version {version})")
+    else:
+        version = store.write_toml(args.file)
+        print(f"Exported {len(store)} proxies (version {version})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
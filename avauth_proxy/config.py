@@ -6,17 +6,123 @@ class Config:
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = "Lax"
 
+    # Session storage: "cookie" (Flask signed cookie), "memory" (per-process
+    # LRU), "sqlite" (shared by workers on one host) or "external" (a
+    # key-value client built by SESSION_EXTERNAL_CLIENT, "module:callable")
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+    SESSION_TTL = 24 * 3600
+    SESSION_MEMORY_SIZE = 10000
+    SESSION_EXTERNAL_CLIENT = os.getenv("SESSION_EXTERNAL_CLIENT")
+
     ADMIN_EMAILS = []
 
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
     # Read CONFIG_TOML_FILE from environment or default
     CONFIG_TOML_FILE = os.getenv("CONFIG_TOML_FILE", os.path.join(os.path.dirname(BASE_DIR), "config.toml"))
+    SESSION_SQLITE_FILE = os.getenv("SESSION_SQLITE_FILE", os.path.join(os.path.dirname(BASE_DIR), "data", "sessions.db"))
+    # Seconds between stat() checks of CONFIG_TOML_FILE by cached registries
+    CONFIG_CHECK_INTERVAL = 1.0
+    # Watch config.toml, proxies_config.toml and the proxy store with
+    # watchdog in each worker (see watch_utils); changes are applied
+    # CONFIG_WATCH_DEBOUNCE seconds after the last write (at most
+    # CONFIG_WATCH_MAX_DELAY after the first). While a watcher runs, the
+    # polling above and POLICY_CHECK_INTERVAL are only a safety net every
+    # WATCH_FALLBACK_INTERVAL seconds.
+    CONFIG_WATCH = os.getenv("CONFIG_WATCH", "1") != "0"
+    CONFIG_WATCH_DEBOUNCE = 0.2
+    CONFIG_WATCH_MAX_DELAY = 1.0
+    WATCH_FALLBACK_INTERVAL = 30.0
 
     NGINX_CONFIG_DIR = "/etc/nginx/conf.d/proxies/"
+    # http-level include with per-service allowlist maps (see acl_utils)
+    NGINX_ACL_MAP_FILE = "/etc/nginx/conf.d/avauth_acl_maps.conf"
+    # Secret for the Nginx secure_link identity cookies; unset disables the maps
+    NGINX_ACL_SECRET = os.getenv("NGINX_ACL_SECRET")
+    NGINX_ACL_TTL = 3600
+    # Where Nginx reaches this app for auth_request fallbacks
+    AVAUTH_UPSTREAM = os.getenv("AVAUTH_UPSTREAM", "http://app:5000")
     NGINX_TEMPLATES_DIR = os.path.join(BASE_DIR, "nginx_templates")
+    # Jinja bytecode cache for the Nginx templates; None uses a per-user temp dir
+    NGINX_TEMPLATE_CACHE_DIR = os.getenv("NGINX_TEMPLATE_CACHE_DIR")
+    # Parallel rendering: worker processes (0 = one per CPU, 1 = never fan
+    # out), proxy count from which a generation uses the pool, and proxies
+    # rendered and written per work item
+    NGINX_RENDER_WORKERS = int(os.getenv("NGINX_RENDER_WORKERS", "0"))
+    NGINX_RENDER_PARALLEL_MIN = 2000
+    NGINX_RENDER_CHUNK_SIZE = 500
     EVENTS_LOG_FILE = os.path.join(os.path.dirname(BASE_DIR), "logs", "events.log")
+    # One sparse index entry every N events; events shown per status page
+    EVENTS_INDEX_INTERVAL = 256
+    EVENTS_PAGE_SIZE = 50
+    # Async event writer: queue bound, records per write, max seconds buffered
+    EVENTS_QUEUE_SIZE = 10000
+    EVENTS_BATCH_SIZE = 256
+    EVENTS_FLUSH_INTERVAL = 0.5
+    # events.log rotation: max bytes / max age (s) of the active segment,
+    # gzipped segments kept, seconds a rotated segment must be idle before
+    # compression, and how often writers check for segments to compress
+    EVENTS_MAX_BYTES = 16 * 1024 * 1024
+    EVENTS_MAX_AGE = 24 * 3600
+    EVENTS_MAX_SEGMENTS = 30
+    EVENTS_COMPRESS_GRACE = 5.0
+    EVENTS_MAINTENANCE_INTERVAL = 10.0
     PROXIES_CONFIG_FILE = os.path.join(os.path.dirname(BASE_DIR), "proxies_config.toml")
+    # Proxies are stored one row per service in SQLite (None: next to
+    # PROXIES_CONFIG_FILE, with a .db extension). PROXIES_CONFIG_FILE is
+    # imported on startup (and by the file watcher) if it was edited outside
+    # the app and, with PROXY_STORE_EXPORT, rewritten from the store by
+    # config generations.
+    PROXY_STORE_FILE = os.getenv("PROXY_STORE_FILE")
+    PROXY_STORE_EXPORT = True
+    # Proxies per page of GET /proxy/api/proxies: default and maximum `limit`
+    PROXY_API_PAGE_SIZE = 100
+    PROXY_API_MAX_PAGE_SIZE = 1000
+    # Proxies per page on the dashboard and status pages (?limit= overrides,
+    # up to PROXY_API_MAX_PAGE_SIZE)
+    DASHBOARD_PAGE_SIZE = 100
+
+    # Seconds between version checks of the proxy store by the policy index
+    POLICY_CHECK_INTERVAL = 1.0
+
+    # Per-worker LRU of /auth/validate decisions: max entries and TTL seconds
+    DECISION_CACHE_SIZE = 10000
+    DECISION_CACHE_TTL = 30
+
+    # Proxy mutations arriving within this many seconds share one Nginx
+    # render+reload; a pending reload is never delayed past the max delay.
+    NGINX_RELOAD_DEBOUNCE = 0.5
+    NGINX_RELOAD_MAX_DELAY = 5.0
+    # Seconds POST /proxy/api/batch with "wait" blocks for its generation
+    NGINX_BATCH_WAIT_TIMEOUT = 30.0
+
+    # OIDC discovery/JWKS cache: on-disk location, HTTP timeout (s), TTL used
+    # without Cache-Control and its clamps, seconds before expiry to refresh
+    # in the background, seconds past expiry a stale copy may still be served,
+    # and whether registering a provider warms its discovery document
+    OIDC_CACHE_DIR = os.getenv("OIDC_CACHE_DIR", os.path.join(os.path.dirname(BASE_DIR), "data", "oidc_cache"))
+    OIDC_HTTP_TIMEOUT = 5.0
+    OIDC_DEFAULT_TTL = 3600
+    OIDC_MIN_TTL = 60
+    OIDC_MAX_TTL = 7 * 24 * 3600
+    OIDC_REFRESH_AHEAD = 300
+    OIDC_STALE_TTL = 24 * 3600
+    OIDC_PREFETCH = True
+    # Claims an ID token must carry to skip the userinfo call (per provider:
+    # `required_claims` in config.toml)
+    OIDC_REQUIRED_CLAIMS = ("email",)
+
+    # Outbound provider calls (token, userinfo, metadata): connect/read
+    # timeouts (s), concurrent requests per provider, keep-alive connections
+    # per provider, seconds to wait for a free slot, and the circuit breaker
+    # (consecutive failures to open, seconds before a trial call)
+    PROVIDER_CONNECT_TIMEOUT = 3.0
+    PROVIDER_READ_TIMEOUT = 10.0
+    PROVIDER_MAX_CONCURRENCY = 16
+    PROVIDER_POOL_SIZE = 16
+    PROVIDER_QUEUE_TIMEOUT = 2.0
+    PROVIDER_BREAKER_FAILURES = 5
+    PROVIDER_BREAKER_RESET = 30.0
 
     USE_OAUTH2_PROXY = True
     OAUTH2_PROXY_URL = os.getenv("OAUTH2_PROXY_URL", "http://localhost:4180")
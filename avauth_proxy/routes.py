@@ -2,8 +2,6 @@
 
 import os
 from flask import render_template, redirect, url_for, session, request
-from werkzeug.middleware.dispatcher import DispatcherMiddleware
-from prometheus_client import generate_latest, Counter, Gauge, make_wsgi_app
 
 from . import app, oauth, oauth_providers
 from .config import Config
@@ -17,10 +15,7 @@ from .utils import (
 )
 
 # Prometheus metrics
-num_proxies = Gauge('num_proxies', 'Number of active proxies')
-auth_user_count = Gauge('auth_user_count', 'Number of authenticated users')
-auth_failures = Counter('auth_failures', 'Number of failed authentication attempts')
-event_counter = Counter('event_count', 'Number of events in the log')
+from .utils.metrics_utils import num_proxies, auth_failures, collect_metrics
 
 @app.route('/')
 def index():
@@ -55,7 +50,6 @@ def oauth_login(provider_name):
 #         token = client.authorize_access_token()
 #         user_info = client.userinfo()
 #         session['user'] = user_info
-#         auth_user_count.inc()
 #         return redirect(url_for('dashboard'))
 #     except Exception as e:
 #         auth_failures.inc()
@@ -64,7 +58,6 @@ def oauth_login(provider_name):
 @app.route('/logout')
 def logout():
     session.pop('user', None)
-    auth_user_count.dec()
     return redirect(url_for('login'))
 
 @app.route('/dashboard')
@@ -142,6 +135,5 @@ def status():
 
 @app.route('/metrics')
 def metrics():
-    return generate_latest()
-
-app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {'/metrics': make_wsgi_app()})
+    body, content_type = collect_metrics()
+    return body, 200, {'Content-Type': content_type}
@@ -0,0 +1,92 @@
+import base64
+import hashlib
+import pytest
+from unittest.mock import patch
+from avauth_proxy.config import Config
+from avauth_proxy.utils.nginx_utils import generate_nginx_configs
+from avauth_proxy.utils.acl_utils import (
+    acl_variable,
+    identity_cookies,
+    is_acl_eligible,
+    render_acl_maps,
+    sign_identity,
+)
+
+PROXIES = [
+    {"service_name": "docs", "url": "10.0.0.3", "port": "8081", "template": "oauth2_disabled.conf.j2",
+     "auth_required": True, "allowed_emails": ["alice@example.com"], "allowed_domains": ["my-company.com"]},
+    {"service_name": "legacy", "url": "10.0.0.5", "port": "8082", "template": "oauth2_disabled.conf.j2",
+     "auth_required": True, "allowed_emails": ["bob@example.com"], "nginx_acl": False},
+    {"service_name": "public", "url": "10.0.0.2", "port": "8080", "template": "oauth2_disabled.conf.j2",
+     "auth_required": False},
+]
+
+@pytest.fixture
+def acl_config(tmpdir):
+    old = (Config.NGINX_CONFIG_DIR, Config.NGINX_ACL_MAP_FILE, Config.NGINX_ACL_SECRET)
+    Config.NGINX_CONFIG_DIR = str(tmpdir.mkdir("proxies"))
+    Config.NGINX_ACL_MAP_FILE = str(tmpdir.join("avauth_acl_maps.conf"))
+    Config.NGINX_ACL_SECRET = "acl-secret"
+    yield tmpdir
+    Config.NGINX_CONFIG_DIR, Config.NGINX_ACL_MAP_FILE, Config.NGINX_ACL_SECRET = old
+
+def test_eligibility(acl_config):
+    assert [is_acl_eligible(p) for p in PROXIES] == [True, False, False]
+    Config.NGINX_ACL_SECRET = None
+    assert not is_acl_eligible(PROXIES[0])
+
+def test_render_acl_maps(acl_config):
+    maps = render_acl_maps(PROXIES)
+    variable = acl_variable("docs")
+    assert f'map "$secure_link:$cookie_avauth_email" ${variable} {{' in maps
+    assert '"1:alice@example.com" 1;' in maps
+    # Backslashes are doubled inside Nginx double-quoted strings
+    assert r'"~^1:[^@]*@my\\-company\\.com$" 1;' in maps
+    assert acl_variable("legacy") not in maps
+    assert 'default "acl-secret";' in maps
+
+def test_identity_cookie_matches_nginx_secure_link(acl_config):
+    cookies = identity_cookies("alice@example.com", now=1760000000)
+    expires = 1760000000 + Config.NGINX_ACL_TTL
+    assert cookies["avauth_exp"] == str(expires)
+    # secure_link_md5 "$avauth_exp:$cookie_avauth_email:$avauth_acl_secret"
+    expected = base64.urlsafe_b64encode(
+        hashlib.md5(f"{expires}:alice@example.com:acl-secret".encode()).digest()
+    ).decode().rstrip("=")
+    assert cookies["avauth_sig"] == expected == sign_identity("alice@example.com", expires)
+
+def test_identity_cookie_cannot_be_moved_to_another_email(acl_config):
+    now = 1760003600
+    cookies = identity_cookies("1admin@example.com", now=now)
+    # Moving the leading digit of the email into the expiry used to keep the
+    # signed string, and so the signature, unchanged
+    forged_expires = cookies["avauth_exp"] + "1"
+    assert sign_identity("admin@example.com", forged_expires) != cookies["avauth_sig"]
+
+def test_identity_expiry_must_have_ten_digits(acl_config):
+    maps = render_acl_maps(PROXIES)
+    assert "map $cookie_avauth_exp $avauth_exp {" in maps
+    assert '"~^[0-9]{10}$" $cookie_avauth_exp;' in maps
+
+@patch("avauth_proxy.utils.nginx_utils.reload_nginx")
+def test_generate_writes_maps_and_acl_locations(mock_reload, acl_config):
+    generate_nginx_configs(PROXIES)
+    assert acl_config.join("avauth_acl_maps.conf").check()
+
+    docs = acl_config.join("proxies", "docs.conf").read()
+    assert "auth_request /_avauth/validate/docs;" in docs
+    assert f"if (${acl_variable('docs')} = 1)" in docs
+    assert f"proxy_pass {Config.AVAUTH_UPSTREAM}/auth/validate/docs;" in docs
+
+    legacy = acl_config.join("proxies", "legacy.conf").read()
+    assert "secure_link" not in legacy
+    assert "proxy_pass" in legacy and "/auth/validate/legacy" in legacy
+
+    assert "auth_request" not in acl_config.join("proxies", "public.conf").read()
+
+    # Only the maps changed: still triggers a reload
+    generate_nginx_configs(PROXIES)
+    assert mock_reload.call_count == 1
+    Config.NGINX_ACL_SECRET = "rotated"
+    generate_nginx_configs(PROXIES)
+    assert mock_reload.call_count == 2
@@ -0,0 +1,92 @@
+import pytest
+from unittest.mock import patch
+from avauth_proxy import app
+from avauth_proxy.config import Config
+from avauth_proxy.utils.logging_utils import event_writer
+from avauth_proxy.utils.file_utils import save_proxies
+from avauth_proxy.utils.policy_utils import invalidate_policy_index
+from avauth_proxy.utils.store_utils import ProxyStore
+
+PROXIES = [
+    {"service_name": name, "url": f"{name}.internal", "port": 8000 + i, "auth_required": True}
+    for i, name in enumerate(["echo", "alpha", "delta", "bravo", "charlie"])
+]
+
+@pytest.fixture
+def admin_client(tmpdir, monkeypatch):
+    monkeypatch.setattr(Config, "PROXIES_CONFIG_FILE", str(tmpdir.join("proxies_config.toml")))
+    monkeypatch.setattr(Config, "EVENTS_LOG_FILE", str(tmpdir.join("events.log")))
+    monkeypatch.setattr(Config, "ADMIN_EMAILS", ["admin@example.com"])
+    save_proxies(PROXIES)
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess["user"] = {"email": "admin@example.com"}
+        yield client
+    invalidate_policy_index()
+    # Events are written in the background; before the path is restored
+    event_writer.flush(5)
+
+def test_proxies_are_paginated_by_service_name(admin_client):
+    names, cursor = [], None
+    while True:
+        response = admin_client.get("/proxy/api/proxies", query_string={"limit": 2, "cursor": cursor or ""})
+        assert response.status_code == 200
+        body = response.get_json()
+        assert len(body["proxies"]) <= 2
+        names += [proxy["service_name"] for proxy in body["proxies"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert names == ["alpha", "bravo", "charlie", "delta", "echo"]
+
+def test_search_and_field_filtering(admin_client):
+    body = admin_client.get("/proxy/api/proxies?q=RAV&fields=port").get_json()
+    assert body["proxies"] == [{"service_name": "bravo", "port": 8003}]
+    body = admin_client.get("/proxy/api/proxies?q=delta.internal").get_json()
+    assert [proxy["service_name"] for proxy in body["proxies"]] == ["delta"]
+
+def test_unchanged_poll_is_answered_with_304(admin_client):
+    response = admin_client.get("/proxy/api/proxies")
+    etag = response.headers["ETag"]
+    assert response.get_json()["version"] == 1
+
+    with patch.object(ProxyStore, "page", side_effect=AssertionError("store read")), \
+            patch.object(ProxyStore, "get", side_effect=AssertionError("store read")):
+        response = admin_client.get("/proxy/api/proxies", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert admin_client.get("/proxy/api/proxies/alpha", headers={"If-None-Match": etag}).status_code == 304
+
+    with patch("avauth_proxy.blueprints.proxy_routes.schedule_nginx_reload", return_value=1):
+        admin_client.post("/proxy/api/batch", json={"operations": [{"op": "delete", "service_name": "echo"}]})
+    response = admin_client.get("/proxy/api/proxies", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert len(response.get_json()["proxies"]) == 4
+
+def test_single_proxy(admin_client):
+    assert admin_client.get("/proxy/api/proxies/alpha?fields=url").get_json() == {
+        "service_name": "alpha", "url": "alpha.internal",
+    }
+    assert admin_client.get("/proxy/api/proxies/missing").status_code == 404
+
+def test_dashboard_streams_pages_of_proxies(admin_client, monkeypatch):
+    monkeypatch.setattr(Config, "DASHBOARD_PAGE_SIZE", 2)
+    response = admin_client.get("/proxy/dashboard")
+    assert response.status_code == 200
+    assert response.is_streamed
+    html = response.get_data(as_text=True)
+    assert "alpha.internal" in html and "bravo.internal" in html
+    assert "charlie.internal" not in html
+    assert "Next proxies" in html
+
+    response = admin_client.get("/proxy/dashboard?q=echo")
+    html = response.get_data(as_text=True)
+    assert "echo.internal" in html and "alpha.internal" not in html
+    assert "Next proxies" not in html
+
+def test_status_pages_proxies_and_events_independently(admin_client, monkeypatch):
+    monkeypatch.setattr(Config, "DASHBOARD_PAGE_SIZE", 4)
+    html = admin_client.get("/proxy/status").get_data(as_text=True)
+    assert "delta.internal" in html and "echo.internal" not in html
+    assert "proxy_cursor=" in html
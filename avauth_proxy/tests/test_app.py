@@ -1,5 +1,7 @@
+import logging
 import pytest
 from avauth_proxy import app as flask_app
+from avauth_proxy.utils.logging_utils import EventWriterHandler
 
 @pytest.fixture
 def client():
@@ -19,3 +21,48 @@ def test_login_page(client):
     # In test config, use_oauth2_proxy = false, so login page should be accessible.
     assert response.status_code == 200
     assert b"Please Choose a Login Provider" in response.data
+
+def test_create_app_builds_independent_apps(capsys):
+    from avauth_proxy import create_app, get_oauth
+    first, second = create_app(), create_app()
+    assert first is not second and first is not flask_app
+    assert get_oauth(first) is not get_oauth(second)
+    assert "mock_provider" in get_oauth(first)._registry
+    # Each record is still written to the events log once
+    handlers = [h for h in logging.getLogger().handlers if isinstance(h, EventWriterHandler)]
+    assert len(handlers) == 1
+    assert capsys.readouterr().out == ""
+    with second.test_client() as client:
+        assert b"Please Choose a Login Provider" in client.get("/auth/login").data
+
+def test_utils_import_without_authlib_or_flask():
+    import subprocess
+    import sys
+    code = (
+        "import sys, avauth_proxy.utils.nginx_utils, avauth_proxy.utils.policy_utils\n"
+        "print(sorted(m for m in ('authlib', 'flask', 'requests') if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
+
+def test_warm_app_fills_caches_and_closes_connections(tmpdir, monkeypatch):
+    import gc
+    from avauth_proxy import warm_app
+    from avauth_proxy.config import Config
+    from avauth_proxy.utils import policy_utils
+    from avauth_proxy.utils.store_utils import get_proxy_store
+    from avauth_proxy.utils.template_utils import get_template_env, list_nginx_templates
+    monkeypatch.setattr(Config, "PROXIES_CONFIG_FILE", str(tmpdir.join("proxies_config.toml")))
+    store = get_proxy_store()
+    policy_utils.invalidate_policy_index()
+    try:
+        warm_app(flask_app)
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+    assert policy_utils._index is not None
+    assert store._local.conn is None
+    compiled = {key[1] for key in flask_app.jinja_env.cache.keys()}
+    assert "auth/login.html" in compiled
+    assert set(list_nginx_templates()) <= {key[1] for key in get_template_env().cache.keys()}
+    policy_utils.invalidate_policy_index()
@@ -0,0 +1,134 @@
+import json
+import pytest
+from unittest.mock import patch
+from avauth_proxy import app
+from avauth_proxy.cli import proxies_main
+from avauth_proxy.config import Config
+from avauth_proxy.utils.logging_utils import event_writer
+from avauth_proxy.utils.file_utils import save_proxies
+from avauth_proxy.utils.policy_utils import invalidate_policy_index
+from avauth_proxy.utils.store_utils import ProxyStore, get_proxy_store
+from avauth_proxy.utils.batch_utils import BatchError, validate_operations
+
+@pytest.fixture
+def admin_client(tmpdir, monkeypatch):
+    monkeypatch.setattr(Config, "PROXIES_CONFIG_FILE", str(tmpdir.join("proxies_config.toml")))
+    monkeypatch.setattr(Config, "EVENTS_LOG_FILE", str(tmpdir.join("events.log")))
+    monkeypatch.setattr(Config, "ADMIN_EMAILS", ["admin@example.com"])
+    save_proxies([{"service_name": "existing", "url": "10.0.0.1", "port": 80}])
+    app.config["TESTING"] = True
+    with patch("avauth_proxy.blueprints.proxy_routes.schedule_nginx_reload", return_value=7) as schedule:
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess["user"] = {"email": "admin@example.com"}
+            client.schedule = schedule
+            yield client
+    invalidate_policy_index()
+    # Events are written in the background; before the path is restored
+    event_writer.flush(5)
+
+def _create(name, **fields):
+    return {"op": "create", "proxy": {"service_name": name, "url": "10.0.0.2", "port": "8080", **fields}}
+
+def test_batch_applies_all_operations_with_one_generation(admin_client):
+    operations = [_create(f"svc{i}") for i in range(50)] + [
+        {"op": "update", "service_name": "existing", "proxy": {"auth_required": True}},
+    ]
+    response = admin_client.post("/proxy/api/batch", json={"operations": operations})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["generation"] == 7
+    assert [item["status"] for item in body["results"]] == ["ok"] * 51
+    assert admin_client.schedule.call_count == 1
+
+    store = get_proxy_store()
+    assert len(store) == 51
+    assert store.version() == body["version"]
+    assert store.get("svc0")["port"] == 8080
+    assert store.get("existing") == {"service_name": "existing", "url": "10.0.0.1", "port": 80,
+                                     "auth_required": True}
+
+def test_batch_is_validated_before_anything_is_applied(admin_client):
+    version = get_proxy_store().version()
+    response = admin_client.post("/proxy/api/batch", json={"operations": [
+        _create("fine"),
+        _create("bad name"),
+        {"op": "rename", "service_name": "existing"},
+        _create("ports", port=70000),
+    ]})
+    assert response.status_code == 400
+    statuses = [item["status"] for item in response.get_json()["results"]]
+    assert statuses == ["valid", "invalid", "invalid", "invalid"]
+    assert get_proxy_store().version() == version
+    assert admin_client.schedule.call_count == 0
+
+def test_batch_conflict_rolls_back(admin_client):
+    version = get_proxy_store().version()
+    response = admin_client.post("/proxy/api/batch", json={"operations": [
+        _create("new"),
+        _create("existing"),
+        {"op": "delete", "service_name": "missing"},
+    ]})
+    assert response.status_code == 409
+    statuses = [item["status"] for item in response.get_json()["results"]]
+    assert statuses == ["rolled_back", "conflict", "not_found"]
+    assert get_proxy_store().get("new") is None
+    assert get_proxy_store().version() == version
+    assert admin_client.schedule.call_count == 0
+
+def test_batch_without_changes_skips_generation(admin_client):
+    response = admin_client.post("/proxy/api/batch", json={"operations": [
+        {"op": "update", "service_name": "existing", "proxy": {"port": "80"}},
+    ]})
+    assert response.status_code == 200
+    assert response.get_json()["results"][0]["status"] == "unchanged"
+    assert response.get_json()["generation"] is None
+    assert admin_client.schedule.call_count == 0
+
+def test_batch_requires_login():
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        response = client.post("/proxy/api/batch", json={"operations": []})
+    assert response.status_code == 401
+
+def test_operations_touching_one_service_twice_are_rejected():
+    with pytest.raises(BatchError) as excinfo:
+        validate_operations([_create("a"), {"op": "delete", "service_name": "a"}])
+    assert excinfo.value.results[1]["status"] == "invalid"
+
+def test_proxies_cli_apply(tmpdir, capsys):
+    batch = tmpdir.join("batch.json")
+    batch.write(json.dumps({"operations": [_create("a"), _create("b")]}))
+    store_path = str(tmpdir.join("proxies.db"))
+    output = tmpdir.mkdir("nginx")
+
+    with patch.object(Config, "NGINX_CONFIG_DIR", str(output)), \
+            patch("avauth_proxy.utils.nginx_utils.reload_nginx") as reload:
+        assert proxies_main(["--store", store_path, "apply", str(batch), "--config", "/nonexistent"]) == 0
+        assert reload.call_count == 1
+    result = json.loads(capsys.readouterr().out)
+    assert result["nginx"] == {"written": 2, "removed": 0, "unchanged": 0}
+    assert output.join("a.conf").check() and output.join("b.conf").check()
+
+    # Same batch again: every create conflicts, nothing changes
+    assert proxies_main(["--store", store_path, "apply", str(batch), "--no-render"]) == 1
+    assert ProxyStore(store_path).version() == 1
+
+def test_proxies_cli_apply_uses_config_settings(tmpdir, capsys):
+    batch = tmpdir.join("batch.json")
+    batch.write(json.dumps({"operations": [_create("a", auth_required=True, allowed_emails=["a@example.com"])]}))
+    config_file = tmpdir.join("config.toml")
+    config_file.write('[app]\nnginx_acl_secret = "s3cret"\n\n[auth]\nuse_oauth2_proxy = false\n')
+    output = tmpdir.mkdir("nginx")
+    acl_map_file = tmpdir.join("avauth_acl_maps.conf")
+
+    with patch.object(Config, "NGINX_CONFIG_DIR", str(output)), \
+            patch.object(Config, "NGINX_ACL_MAP_FILE", str(acl_map_file)), \
+            patch.object(Config, "USE_OAUTH2_PROXY", True), \
+            patch.object(Config, "NGINX_ACL_SECRET", None), \
+            patch("avauth_proxy.utils.nginx_utils.reload_nginx"):
+        args = ["--store", str(tmpdir.join("proxies.db")), "apply", str(batch), "--config", str(config_file)]
+        assert proxies_main(args) == 0
+    capsys.readouterr()
+    assert "/_avauth/validate/a" in output.join("a.conf").read()
+    assert "a@example.com" in acl_map_file.read()
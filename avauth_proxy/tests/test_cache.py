@@ -0,0 +1,75 @@
+import pytest
+from avauth_proxy import app
+from avauth_proxy.config import Config
+from avauth_proxy.utils.file_utils import save_proxies
+from avauth_proxy.utils.cache_utils import DecisionCache, decision_cache
+from avauth_proxy.utils.policy_utils import invalidate_policy_index
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def client(tmpdir):
+    old_file = Config.PROXIES_CONFIG_FILE
+    Config.PROXIES_CONFIG_FILE = str(tmpdir.join("proxies_config.toml"))
+    save_proxies([{"service_name": "docs", "url": "10.0.0.3", "port": "8081",
+                   "auth_required": True, "allowed_emails": ["alice@example.com"]}])
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+    Config.PROXIES_CONFIG_FILE = old_file
+    invalidate_policy_index()
+    decision_cache.clear()
+
+def test_decision_cache_ttl_and_lru():
+    clock = FakeClock()
+    cache = DecisionCache(maxsize=2, ttl=10, clock=clock)
+    cache.set(("s1", "docs", 1), 200)
+    cache.set(("s2", "docs", 1), 403)
+    assert cache.get(("s1", "docs", 1)) == 200
+
+    # s2 is least recently used and gets evicted
+    cache.set(("s3", "docs", 1), 200)
+    assert cache.get(("s2", "docs", 1)) is None
+    assert cache.stats()["evictions"] == 1
+
+    clock.now = 11
+    assert cache.get(("s1", "docs", 1)) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+def test_decision_cache_invalidate_session():
+    cache = DecisionCache(maxsize=10, ttl=10)
+    cache.set(("s1", "docs", 1), 200)
+    cache.set(("s1", "wiki", 1), 403)
+    cache.set(("s2", "docs", 1), 200)
+    cache.invalidate_session("s1")
+    assert len(cache) == 1
+    assert cache.get(("s2", "docs", 1)) == 200
+
+def test_validate_uses_cache_and_logout_invalidates(client):
+    with client.session_transaction() as sess:
+        sess["user"] = {"email": "alice@example.com"}
+        sess["sid"] = "session-1"
+    assert client.get("/auth/validate/docs").status_code == 200
+    hits = decision_cache.hits
+    assert client.get("/auth/validate/docs").status_code == 200
+    assert decision_cache.hits == hits + 1
+
+    client.get("/auth/logout")
+    assert len(decision_cache) == 0
+    assert client.get("/auth/validate/docs").status_code == 401
+
+def test_save_proxies_clears_cache(client):
+    decision_cache.set(("session-1", "docs", 1), 200)
+    save_proxies([])
+    assert len(decision_cache) == 0
+
+def test_cache_counters_exported(client):
+    response = client.get("/metrics/")
+    assert b"decision_cache_hits_total" in response.data
+    assert b"decision_cache_misses_total" in response.data
@@ -0,0 +1,140 @@
+import json
+import pytest
+from avauth_proxy import app
+from avauth_proxy.config import Config
+from avauth_proxy.utils.policy_utils import invalidate_policy_index
+from avauth_proxy.utils.stream_utils import StreamedPage
+from avauth_proxy.utils.event_utils import (
+    EventStore,
+    compress_segments,
+    import_event_log,
+    list_segments,
+    parse_event_line,
+    read_segment_header,
+    rotate_if_needed,
+)
+
+def _event(i, code="add"):
+    return {"event_id": f"id-{i}", "timestamp": f"2026-01-01T00:00:{i:02d}",
+            "description": f"event {i}", "code": code}
+
+@pytest.fixture
+def store(tmpdir):
+    path = tmpdir.join("events.log")
+    with open(str(path), "w") as f:
+        for i in range(30):
+            f.write(json.dumps(_event(i, "remove" if i % 3 == 0 else "add")) + "\n")
+        f.write('{"message": "not an event"}\n')
+    return EventStore(str(path), interval=4)
+
+def test_parse_event_line_handles_legacy_repr_without_eval():
+    assert parse_event_line(repr(_event(1)))["event_id"] == "id-1"
+    assert parse_event_line("__import__('os').system('true')") is None
+    assert parse_event_line('{"event_id": "x"') is None
+
+def test_page_cursor_pagination(store):
+    first = store.page(limit=10)
+    assert [e["event_id"] for e in first.events] == [f"id-{i}" for i in range(29, 19, -1)]
+    second = store.page(limit=10, cursor=first.next_cursor)
+    assert second.events[0]["event_id"] == "id-19"
+    third = store.page(limit=10, cursor=second.next_cursor)
+    assert third.events[-1]["event_id"] == "id-0"
+    assert third.next_cursor is None
+    assert store.count() == 30
+
+def test_page_filters(store):
+    removed = store.page(limit=100, code="remove")
+    assert [e["event_id"] for e in removed.events] == [f"id-{i}" for i in range(27, -1, -3)]
+
+    window = store.page(limit=100, since="2026-01-01T00:00:10", until="2026-01-01T00:00:14")
+    assert [e["event_id"] for e in window.events] == ["id-14", "id-13", "id-12", "id-11", "id-10"]
+
+def test_index_is_extended_incrementally(store):
+    assert store.count() == 30
+    with open(store.path, "a") as f:
+        f.write(json.dumps(_event(30)) + "\n")
+        f.write('{"event_id": "partial"')
+    assert store.count() == 31
+    assert store.page(limit=1).events[0]["event_id"] == "id-30"
+
+def test_import_event_log(store, tmpdir):
+    legacy = tmpdir.join("old.log")
+    legacy.write(repr(_event(5)) + "\n" + repr({**_event(99), "timestamp": "2025-12-31T00:00:00"}) + "\n")
+    assert import_event_log(str(legacy), store) == 1
+    assert store.count() == 31
+    assert store.page(limit=100).events[-1]["event_id"] == "id-99"
+
+def test_scan_streams_the_same_page(store):
+    page = store.page(limit=7, code=None)
+    scan = StreamedPage(store.scan(limit=7))
+    assert list(scan) == page.events
+    assert scan.next_cursor == page.next_cursor
+
+def test_status_page_is_paginated(store, tmpdir):
+    old = (Config.EVENTS_LOG_FILE, Config.EVENTS_PAGE_SIZE, Config.ADMIN_EMAILS, Config.PROXIES_CONFIG_FILE)
+    Config.EVENTS_LOG_FILE, Config.EVENTS_PAGE_SIZE = store.path, 5
+    Config.PROXIES_CONFIG_FILE = str(tmpdir.join("proxies_config.toml"))
+    Config.ADMIN_EMAILS = ["admin@example.com"]
+    app.config["TESTING"] = True
+    try:
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess["user"] = {"email": "admin@example.com"}
+            response = client.get("/proxy/status")
+            assert response.status_code == 200
+            assert b"id-29" in response.data and b"id-24" not in response.data
+            assert b"Older events" in response.data
+    finally:
+        Config.EVENTS_LOG_FILE, Config.EVENTS_PAGE_SIZE, Config.ADMIN_EMAILS, Config.PROXIES_CONFIG_FILE = old
+        invalidate_policy_index()
+
+@pytest.fixture
+def segmented_store(tmpdir):
+    old = (Config.EVENTS_MAX_BYTES, Config.EVENTS_MAX_SEGMENTS)
+    Config.EVENTS_MAX_BYTES, Config.EVENTS_MAX_SEGMENTS = 1, 30
+    path = str(tmpdir.join("events.log"))
+    # Three segments of ten events each: two compressed, one active
+    for chunk in range(3):
+        rotate_if_needed(path)
+        with open(path, "a") as f:
+            for i in range(chunk * 10, chunk * 10 + 10):
+                f.write(json.dumps(_event(i)) + "\n")
+    compress_segments(path, grace=0)
+    yield EventStore(path, interval=4)
+    Config.EVENTS_MAX_BYTES, Config.EVENTS_MAX_SEGMENTS = old
+
+def test_rotation_writes_compressed_segments_with_header(segmented_store):
+    segments = list_segments(segmented_store.path)
+    assert [(s.seq, s.kind) for s in segments] == [(1, "gz"), (2, "gz")]
+    assert read_segment_header(segments[0].path) == {
+        "start": "2026-01-01T00:00:00", "end": "2026-01-01T00:00:09", "count": 10,
+    }
+    assert segmented_store.count() == 30
+    assert [e["event_id"] for e in segmented_store.iter_events()] == [f"id-{i}" for i in range(30)]
+
+def test_page_streams_across_segments(segmented_store):
+    seen, cursor = [], None
+    while True:
+        page = segmented_store.page(limit=7, cursor=cursor)
+        seen.extend(e["event_id"] for e in page.events)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    assert seen == [f"id-{i}" for i in range(29, -1, -1)]
+
+def test_page_skips_segments_outside_window(segmented_store, monkeypatch):
+    opened = []
+    real_lines_backwards = EventStore._lines_backwards
+    def spy(self, segment, start, end):
+        opened.append(segment.seq)
+        return real_lines_backwards(self, segment, start, end)
+    monkeypatch.setattr(EventStore, "_lines_backwards", spy)
+
+    page = segmented_store.page(limit=100, since="2026-01-01T00:00:12", until="2026-01-01T00:00:13")
+    assert [e["event_id"] for e in page.events] == ["id-13", "id-12"]
+    assert opened == [2]
+
+def test_retention_drops_oldest_segments(segmented_store):
+    Config.EVENTS_MAX_SEGMENTS = 1
+    compress_segments(segmented_store.path, grace=0)
+    assert [s.seq for s in list_segments(segmented_store.path)] == [2]
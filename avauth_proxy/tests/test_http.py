@@ -0,0 +1,137 @@
+import time
+import threading
+import pytest
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from avauth_proxy.config import Config
+from avauth_proxy.utils.logging_utils import event_writer
+from avauth_proxy.utils.http_utils import (
+    CircuitBreaker, ProviderAdapter, CircuitOpenError, ProviderBusyError,
+    CLOSED, HALF_OPEN, OPEN,
+)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/slow":
+            time.sleep(0.3)
+        status = 503 if self.path == "/down" else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def events_file(tmpdir, monkeypatch):
+    # Circuit state changes are logged, and logged records go to the events log
+    monkeypatch.setattr(Config, "EVENTS_LOG_FILE", str(tmpdir.join("events.log")))
+    yield Config.EVENTS_LOG_FILE
+    event_writer.flush(5)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_session(adapter):
+    session = requests.Session()
+    session.mount("http://", adapter)
+    return session
+
+
+def test_breaker_opens_and_recovers():
+    now = [0.0]
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    now[0] = 11
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # only one trial call at a time
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_connections_are_reused_across_sessions(server):
+    adapter = ProviderAdapter("reuse", 1.0, 1.0, max_concurrency=4, pool_size=4)
+    for _ in range(3):
+        with make_session(adapter) as session:
+            assert session.get(server + "/").status_code == 200
+    assert adapter.pool_stats() == (1, 1)
+    adapter.shutdown()
+
+
+def test_default_read_timeout(server):
+    adapter = ProviderAdapter("timeout", 1.0, 0.05, max_concurrency=4, pool_size=4)
+    with pytest.raises(requests.Timeout):
+        make_session(adapter).get(server + "/slow")
+    assert adapter.breaker.failures == 1
+
+
+def test_server_errors_open_the_circuit(server):
+    breaker = CircuitBreaker("down", failure_threshold=2, reset_timeout=60)
+    adapter = ProviderAdapter("down", 1.0, 1.0, max_concurrency=4, pool_size=4, breaker=breaker)
+    session = make_session(adapter)
+    session.get(server + "/down")
+    session.get(server + "/down")
+    with pytest.raises(CircuitOpenError):
+        session.get(server + "/")
+    # Refusals look like connection errors to existing callers
+    assert issubclass(CircuitOpenError, requests.ConnectionError)
+
+
+def test_concurrency_is_bounded(server, monkeypatch):
+    monkeypatch.setattr(Config, "PROVIDER_QUEUE_TIMEOUT", 0.05)
+    adapter = ProviderAdapter("bounded", 1.0, 1.0, max_concurrency=1, pool_size=1)
+    slow = threading.Thread(target=lambda: make_session(adapter).get(server + "/slow"))
+    slow.start()
+    time.sleep(0.1)
+    with pytest.raises(ProviderBusyError):
+        make_session(adapter).get(server + "/")
+    slow.join()
+    assert make_session(adapter).get(server + "/").status_code == 200
+
+
+def test_unexpected_error_ends_the_half_open_trial(server, monkeypatch):
+    now = [0.0]
+    breaker = CircuitBreaker("trial", failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    adapter = ProviderAdapter("trial", 1.0, 1.0, max_concurrency=4, pool_size=4, breaker=breaker)
+    breaker.record_failure()
+    now[0] = 11
+
+    failing = [True]
+    send = requests.adapters.HTTPAdapter.send
+
+    def explode(self, *args, **kwargs):
+        if failing:
+            raise RuntimeError("not a RequestException")
+        return send(self, *args, **kwargs)
+
+    monkeypatch.setattr(requests.adapters.HTTPAdapter, "send", explode)
+    with pytest.raises(RuntimeError):
+        make_session(adapter).get(server + "/")
+    assert breaker.state == OPEN
+    failing.clear()
+
+    # The next trial goes through instead of being refused forever
+    now[0] = 22
+    assert make_session(adapter).get(server + "/").status_code == 200
+    assert breaker.state == CLOSED
@@ -0,0 +1,68 @@
+import json
+import logging
+import pytest
+from pythonjsonlogger.json import JsonFormatter
+from avauth_proxy.config import Config
+from avauth_proxy.utils import misc_utils
+from avauth_proxy.utils.logging_utils import EventWriter, EventWriterHandler, event_writer, log_event
+
+@pytest.fixture
+def events_file(tmpdir):
+    old_file = Config.EVENTS_LOG_FILE
+    Config.EVENTS_LOG_FILE = str(tmpdir.join("logs", "events.log"))
+    yield Config.EVENTS_LOG_FILE
+    event_writer.flush(5)
+    Config.EVENTS_LOG_FILE = old_file
+
+def _read(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_log_event_is_written_in_background(events_file):
+    log_event("first", "add")
+    misc_utils.log_event("second", "remove")
+    assert event_writer.flush(5)
+    records = _read(events_file)
+    assert [(r["description"], r["code"]) for r in records] == [("first", "add"), ("second", "remove")]
+    assert all("event_id" in r for r in records)
+
+def test_writer_batches_records(events_file):
+    writer = EventWriter(max_queue=100, batch_size=10, flush_interval=1)
+    for i in range(25):
+        writer.submit(json.dumps({"n": i}))
+    assert writer.flush(5)
+    assert [r["n"] for r in _read(events_file)] == list(range(25))
+
+def test_full_queue_drops_and_counts(events_file):
+    writer = EventWriter(max_queue=2)
+    writer._ensure_thread = lambda: None  # no consumer: the queue fills up
+    assert writer.submit("{}") and writer.submit("{}")
+    assert not writer.submit("{}")
+    assert writer.dropped == 1
+
+def test_logging_handler_uses_writer(events_file):
+    writer = EventWriter()
+    logger = logging.getLogger("avauth_proxy.tests.handler")
+    handler = EventWriterHandler(writer)
+    handler.setFormatter(JsonFormatter())
+    logger.addHandler(handler)
+    try:
+        logger.warning("through the queue")
+    finally:
+        logger.removeHandler(handler)
+    assert writer.flush(5)
+    assert _read(events_file)[0]["message"] == "through the queue"
+
+def test_writer_rotates_active_log(events_file):
+    old = Config.EVENTS_MAX_BYTES
+    Config.EVENTS_MAX_BYTES = 5
+    try:
+        writer = EventWriter()
+        writer.submit(json.dumps({"n": 1}))
+        assert writer.flush(5)
+        writer.submit(json.dumps({"n": 2}))
+        assert writer.flush(5)
+    finally:
+        Config.EVENTS_MAX_BYTES = old
+    assert [r["n"] for r in _read(events_file)] == [2]
+    assert [r["n"] for r in _read(events_file + ".000001.open")] == [1]
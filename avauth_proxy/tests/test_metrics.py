@@ -0,0 +1,108 @@
+import os
+import sys
+import pytest
+import subprocess
+from prometheus_client.parser import text_string_to_metric_families
+from avauth_proxy import app
+from avauth_proxy.config import Config
+from avauth_proxy.utils.policy_utils import invalidate_policy_index
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKER = """
+import sys
+from avauth_proxy.utils.metrics_utils import auth_failures, decision_cache_size
+auth_failures.inc()
+decision_cache_size.set(int(sys.argv[1]))
+"""
+
+SCRAPE = """
+import sys
+from prometheus_client import multiprocess
+from avauth_proxy.utils.metrics_utils import collect_metrics
+for pid in sys.argv[1:]:
+    multiprocess.mark_process_dead(int(pid))
+print("--- metrics ---")
+sys.stdout.write(collect_metrics()[0].decode())
+"""
+
+
+@pytest.fixture
+def proxies_file(tmpdir, monkeypatch):
+    # The app reads proxies from a store next to this file
+    monkeypatch.setattr(Config, "PROXIES_CONFIG_FILE", str(tmpdir.join("proxies_config.toml")))
+    yield tmpdir.join("proxies_config.toml")
+    invalidate_policy_index()
+
+
+def run(code, env, *args):
+    return subprocess.run(
+        [sys.executable, "-c", code, *map(str, args)], env=env, check=True,
+        capture_output=True, text=True, cwd=ROOT,
+    )
+
+
+def samples(text):
+    return {
+        sample.name: sample.value
+        for family in text_string_to_metric_families(text.split("--- metrics ---\n", 1)[1])
+        for sample in family.samples
+    }
+
+
+def test_metrics_are_aggregated_across_workers(tmpdir):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmpdir))
+    first = subprocess.Popen([sys.executable, "-c", WORKER, "3"], env=env, cwd=ROOT)
+    first.wait()
+    run(WORKER, env, 4)
+
+    values = samples(run(SCRAPE, env).stdout)
+    assert values["auth_failures_total"] == 2
+    assert values["decision_cache_size"] == 7
+
+    # After a worker exits its live gauges are dropped, counters are kept
+    values = samples(run(SCRAPE, env, first.pid).stdout)
+    assert values["auth_failures_total"] == 2
+    assert values["decision_cache_size"] == 4
+
+
+def test_metrics_endpoint_single_process(proxies_file):
+    response = app.test_client().get("/metrics/")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    assert b"num_proxies" in response.data
+
+
+def sample_value(name, **labels):
+    from prometheus_client import REGISTRY
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_validate_latency_recorded_by_outcome(proxies_file):
+    client = app.test_client()
+    before = sample_value("auth_validate_duration_seconds_count", path="fast", status="403")
+    client.get("/auth/validate/anything")
+    client.get("/auth/validate/anything")
+    assert sample_value("auth_validate_duration_seconds_count", path="fast", status="403") == before + 2
+
+
+def test_render_and_parse_latency_recorded(tmpdir, monkeypatch):
+    from avauth_proxy.config import Config
+    from avauth_proxy.utils import nginx_utils
+    from avauth_proxy.utils.file_utils import load_proxies
+    from avauth_proxy.utils.store_utils import get_proxy_store
+    monkeypatch.setattr(Config, "NGINX_CONFIG_DIR", str(tmpdir.join("nginx")))
+    monkeypatch.setattr(Config, "PROXIES_CONFIG_FILE", str(tmpdir.join("proxies_config.toml")))
+    monkeypatch.setattr(nginx_utils, "reload_nginx", lambda: None)
+    tmpdir.join("proxies_config.toml").write("".join(
+        f'[[proxies]]\nservice_name = "svc{i}"\nurl = "10.0.0.1"\nport = "80"\n' for i in range(3)
+    ))
+
+    parses = sample_value("config_parse_duration_seconds_count", file="proxies")
+    # Opening the store imports the TOML file
+    get_proxy_store()
+    assert sample_value("config_parse_duration_seconds_count", file="proxies") == parses + 1
+
+    renders = sample_value("nginx_render_duration_seconds_count")
+    nginx_utils.generate_nginx_configs(load_proxies())
+    assert sample_value("nginx_render_duration_seconds_count") == renders + 3
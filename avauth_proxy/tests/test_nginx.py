@@ -1,7 +1,11 @@
 import os
+import sys
+import subprocess
 import pytest
 from unittest.mock import patch
+from avauth_proxy.utils import nginx_utils
 from avauth_proxy.utils.nginx_utils import generate_nginx_configs, reload_nginx
+from avauth_proxy.utils.template_utils import get_template_env, list_nginx_templates
 from avauth_proxy.config import Config
 
 @pytest.fixture
@@ -35,3 +39,153 @@ def test_reload_nginx(mock_run):
     mock_run.return_value.returncode = 0
     reload_nginx()
     mock_run.assert_called_once_with(["nginx", "-s", "reload"], capture_output=True)
+
+def _proxy(name, port=8000):
+    return {"service_name": name, "url": "127.0.0.1", "port": port, "template": "default.conf.j2"}
+
+@patch("avauth_proxy.utils.nginx_utils.reload_nginx")
+def test_generate_nginx_configs_incremental(mock_reload, temp_nginx_dir):
+    result = generate_nginx_configs([_proxy("a"), _proxy("b")])
+    assert sorted(result.written) == ["a", "b"]
+    assert mock_reload.call_count == 1
+
+    # Nothing changed: no writes, no reload
+    mtime = os.path.getmtime(str(temp_nginx_dir.join("a.conf")))
+    result = generate_nginx_configs([_proxy("a"), _proxy("b")])
+    assert result.written == [] and result.removed == []
+    assert mock_reload.call_count == 1
+    assert os.path.getmtime(str(temp_nginx_dir.join("a.conf"))) == mtime
+
+    # One changed, one added
+    result = generate_nginx_configs([_proxy("a"), _proxy("b", port=9000), _proxy("c")])
+    assert sorted(result.written) == ["b", "c"]
+    assert result.removed == []
+    result = generate_nginx_configs([_proxy("a"), _proxy("b", port=9000)])
+    assert result.removed == ["c"]
+    assert not temp_nginx_dir.join("c.conf").check()
+    assert mock_reload.call_count == 3
+
+@patch("avauth_proxy.utils.nginx_utils.reload_nginx")
+def test_generate_nginx_configs_sweeps_unmanaged_files(mock_reload, temp_nginx_dir):
+    temp_nginx_dir.join("stale.conf").write("server {}")
+    result = generate_nginx_configs([_proxy("a")])
+    assert result.removed == ["stale"]
+    assert not temp_nginx_dir.join("stale.conf").check()
+
+@patch("avauth_proxy.utils.nginx_utils.reload_nginx")
+def test_concurrent_generations_are_serialized(mock_reload, temp_nginx_dir):
+    import threading
+    proxies = [_proxy(f"svc{i}") for i in range(50)]
+    errors = []
+
+    def generate():
+        try:
+            generate_nginx_configs(proxies)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=generate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    # The first generation wrote everything, the others found it unchanged
+    assert mock_reload.call_count == 1
+    assert not [name for name in os.listdir(str(temp_nginx_dir)) if name.endswith(".tmp")]
+
+@pytest.fixture
+def temp_templates_dir(tmpdir):
+    templates_dir = tmpdir.mkdir("templates")
+    templates_dir.join("simple.conf.j2").write("server_name {{ service_name }};")
+    old_dir = Config.NGINX_TEMPLATES_DIR
+    Config.NGINX_TEMPLATES_DIR = str(templates_dir)
+    yield templates_dir
+    Config.NGINX_TEMPLATES_DIR = old_dir
+
+def test_template_env_is_persistent_and_auto_reloads(temp_templates_dir):
+    env = get_template_env()
+    assert get_template_env() is env
+    template = env.get_template("simple.conf.j2")
+    assert env.get_template("simple.conf.j2") is template
+
+    template_file = temp_templates_dir.join("simple.conf.j2")
+    template_file.write("listen 81; server_name {{ service_name }};")
+    stat = os.stat(str(template_file))
+    os.utime(str(template_file), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert env.get_template("simple.conf.j2").render(service_name="x") == "listen 81; server_name x;"
+
+def test_template_catalogue(temp_templates_dir):
+    assert list_nginx_templates() == ["simple.conf.j2"]
+    temp_templates_dir.join("other.conf.j2").write("")
+    temp_templates_dir.join("README").write("")
+    dir_stat = os.stat(str(temp_templates_dir))
+    os.utime(str(temp_templates_dir), ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns + 10**9))
+    assert list_nginx_templates() == ["other.conf.j2", "simple.conf.j2"]
+
+@patch("avauth_proxy.utils.nginx_utils.reload_nginx")
+def test_generate_nginx_configs_parallel(mock_reload, temp_nginx_dir, tmpdir, monkeypatch):
+    monkeypatch.setattr(Config, "NGINX_RENDER_PARALLEL_MIN", 4)
+    monkeypatch.setattr(Config, "NGINX_RENDER_CHUNK_SIZE", 2)
+    proxies = [_proxy(f"svc{i}", port=8000 + i) for i in range(7)]
+
+    result = generate_nginx_configs(proxies, workers=3)
+    assert result.written == [p["service_name"] for p in proxies]
+    parallel = {name: temp_nginx_dir.join(f"{name}.conf").read() for name in result.written}
+
+    serial_dir = tmpdir.mkdir("serial")
+    monkeypatch.setattr(Config, "NGINX_CONFIG_DIR", str(serial_dir))
+    generate_nginx_configs(proxies, workers=1)
+    assert parallel == {name: serial_dir.join(f"{name}.conf").read() for name in parallel}
+
+    monkeypatch.setattr(Config, "NGINX_CONFIG_DIR", str(temp_nginx_dir))
+    result = generate_nginx_configs(proxies[:6] + [_proxy("svc6", port=9999)], workers=3)
+    assert result.written == ["svc6"]
+    assert len(result.unchanged) == 6
+    assert mock_reload.call_count == 3
+
+def test_render_cli_without_app(tmpdir):
+    proxies_file = tmpdir.join("proxies.toml")
+    proxies_file.write('[[proxies]]\nservice_name = "cli"\nurl = "10.0.0.1"\nport = 8080\n')
+    output = tmpdir.join("conf")
+    code = (
+        "import sys; from avauth_proxy.cli import main; rc = main(sys.argv[1:]); "
+        "print('built' if 'app' in vars(sys.modules['avauth_proxy']) else 'not built'); sys.exit(rc)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code, "--proxies", str(proxies_file), "--output", str(output),
+         "--config", str(tmpdir.join("missing.toml"))],
+        capture_output=True, text=True, env={**os.environ, "CONFIG_TOML_FILE": "/nonexistent/config.toml"},
+    )
+    assert result.returncode == 0, result.stderr
+    assert "1 proxies: 1 written" in result.stdout
+    assert result.stdout.strip().endswith("not built")
+    assert "proxy_pass" in output.join("cli.conf").read()
+    # No nginx_acl_secret: no ACL maps next to the output directory
+    assert not tmpdir.join("avauth_acl_maps.conf").check()
+
+def test_render_cli_reads_app_and_auth_tables(tmpdir):
+    proxies_file = tmpdir.join("proxies.toml")
+    proxies_file.write(
+        '[[proxies]]\nservice_name = "cli"\nurl = "10.0.0.1"\nport = 8080\n'
+        'auth_required = true\nallowed_emails = ["a@example.com"]\n'
+    )
+    config_file = tmpdir.join("config.toml")
+    config_file.write('[app]\nnginx_acl_secret = "s3cret"\n\n[auth]\nuse_oauth2_proxy = false\n')
+    output = tmpdir.join("conf")
+    result = subprocess.run(
+        [sys.executable, "-m", "avauth_proxy.cli", "--proxies", str(proxies_file), "--output", str(output),
+         "--config", str(config_file)],
+        capture_output=True, text=True, env={**os.environ, "CONFIG_TOML_FILE": "/nonexistent/config.toml"},
+    )
+    assert result.returncode == 0, result.stderr
+    conf = output.join("cli.conf").read()
+    assert "/_avauth/validate/cli" in conf and "proxy_pass http://oauth2_proxy" not in conf
+    assert "a@example.com" in tmpdir.join("avauth_acl_maps.conf").read()
+
+@patch("avauth_proxy.utils.nginx_utils.reload_nginx")
+def test_generated_files_follow_the_umask(mock_reload, temp_nginx_dir, monkeypatch):
+    monkeypatch.setattr(nginx_utils, "_UMASK", 0o022)
+    generate_nginx_configs([_proxy("perm")], workers=1)
+    # Not mkstemp's 0600: Nginx may run as another user
+    assert os.stat(os.path.join(str(temp_nginx_dir), "perm.conf")).st_mode & 0o777 == 0o644
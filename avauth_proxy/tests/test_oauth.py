@@ -0,0 +1,53 @@
+import pytest
+from unittest.mock import patch
+from authlib.integrations.flask_client import OAuth
+from avauth_proxy import app
+from avauth_proxy.config import Config
+from avauth_proxy.utils.oauth_utils import ProviderRegistry, load_oauth_providers
+
+PROVIDER = """
+[[oauth_providers]]
+name = "{name}"
+client_id = "{client_id}"
+client_secret = "secret"
+authorize_url = "http://localhost:6000/oauth/authorize"
+access_token_url = "http://localhost:6000/oauth/token"
+api_base_url = "http://localhost:6000/oauth/"
+"""
+
+@pytest.fixture
+def config_file(tmpdir):
+    path = tmpdir.join("config.toml")
+    path.write(PROVIDER.format(name="mock", client_id="one") + PROVIDER.format(name="other", client_id="x"))
+    old = Config.CONFIG_TOML_FILE
+    Config.CONFIG_TOML_FILE = str(path)
+    yield path
+    Config.CONFIG_TOML_FILE = old
+
+def test_registry_parses_config_once(config_file):
+    registry = ProviderRegistry(OAuth(app))
+    registry.get_providers()
+    with patch("avauth_proxy.utils.oauth_utils.get_oauth_providers") as parse:
+        for _ in range(10):
+            assert set(registry.get_providers()) == {"mock", "other"}
+        parse.assert_not_called()
+
+def test_registry_reregisters_only_changed_providers(config_file):
+    oauth = OAuth(app)
+    registry = ProviderRegistry(oauth)
+    assert registry.refresh() == {"mock", "other"}
+    other_client = oauth.create_client("other")
+
+    config_file.write(PROVIDER.format(name="mock", client_id="two") + PROVIDER.format(name="other", client_id="x") + "\n")
+    assert registry.refresh() == {"mock"}
+    assert oauth.create_client("mock").client_id == "two"
+    assert oauth.create_client("other") is other_client
+
+    config_file.write(PROVIDER.format(name="other", client_id="x") + "\n\n")
+    assert registry.refresh() == {"mock"}
+    assert oauth.create_client("mock") is None
+
+def test_load_oauth_providers_reuses_registry(config_file):
+    oauth = OAuth(app)
+    providers = load_oauth_providers(oauth)
+    assert load_oauth_providers(oauth) is providers
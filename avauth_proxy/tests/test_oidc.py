@@ -0,0 +1,180 @@
+import time
+import pytest
+import requests
+from urllib.parse import urlsplit
+from requests.structures import CaseInsensitiveDict
+from avauth_proxy import app
+from avauth_proxy.config import Config
+from avauth_proxy.utils.logging_utils import event_writer
+from joserfc import jwt
+from avauth_proxy.utils.oidc_utils import (
+    DocumentCache, CachedOAuth, freshness_lifetime, provider_metadata_url, resolve_user_info,
+)
+
+mock_server = pytest.importorskip("mock_oauth2_server")
+
+ISSUER = mock_server.ISSUER
+DISCOVERY_URL = f"{ISSUER}/.well-known/openid-configuration"
+
+
+class MockServerSession:
+    """requests-like session answering from the mock OAuth2 server's test client."""
+
+    def __init__(self):
+        self.client = mock_server.app.test_client()
+        self.calls = []
+        self.down = False
+
+    def get(self, url, headers=None, timeout=None):
+        if self.down:
+            raise requests.ConnectionError("provider unreachable")
+        result = self.client.get(urlsplit(url).path, headers=headers or {})
+        self.calls.append((urlsplit(url).path, result.status_code))
+        resp = requests.Response()
+        resp.status_code = result.status_code
+        resp.headers = CaseInsensitiveDict(result.headers)
+        resp._content = result.data
+        resp.url = url
+        return resp
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def events_file(tmpdir, monkeypatch):
+    # Provider failures are logged, and logged records go to the events log
+    monkeypatch.setattr(Config, "EVENTS_LOG_FILE", str(tmpdir.join("events.log")))
+    yield Config.EVENTS_LOG_FILE
+    event_writer.flush(5)
+
+
+@pytest.fixture
+def session():
+    return MockServerSession()
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_discovery_document_is_persisted(tmpdir, session, clock):
+    cache = DocumentCache(cache_dir=str(tmpdir), session=session, clock=clock)
+    assert cache.get(DISCOVERY_URL)["jwks_uri"] == f"{ISSUER}/oauth/jwks"
+    cache.get(DISCOVERY_URL)
+    assert len(session.calls) == 1
+
+    # Another worker (or a restart) reads the shared copy from disk
+    other = DocumentCache(cache_dir=str(tmpdir), session=session, clock=clock)
+    assert other.get(DISCOVERY_URL)["issuer"] == ISSUER
+    assert len(session.calls) == 1
+
+
+def test_expired_entry_is_revalidated_with_etag(tmpdir, session, clock):
+    cache = DocumentCache(cache_dir=str(tmpdir), session=session, clock=clock)
+    document = cache.get(DISCOVERY_URL)
+    clock.now += 300 + Config.OIDC_STALE_TTL + 1  # mock server sends max-age=300
+
+    assert cache.get(DISCOVERY_URL) == document
+    assert session.calls[-1] == ("/.well-known/openid-configuration", 304)
+    assert cache._entry(DISCOVERY_URL)["expires_at"] == clock.now + 300
+
+
+def test_stale_copy_served_when_provider_is_down(tmpdir, session, clock):
+    cache = DocumentCache(cache_dir=str(tmpdir), session=session, clock=clock)
+    document = cache.get(DISCOVERY_URL)
+    session.down = True
+    clock.now += 300 + Config.OIDC_STALE_TTL + 1
+    assert cache.get(DISCOVERY_URL) == document
+
+    with pytest.raises(requests.ConnectionError):
+        DocumentCache(cache_dir=str(tmpdir.join("empty")), session=session, clock=clock).get(DISCOVERY_URL)
+
+
+def test_refresh_ahead_keeps_serving_cached_copy(tmpdir, session, clock):
+    cache = DocumentCache(cache_dir=str(tmpdir), session=session, clock=clock)
+    document = cache.get(DISCOVERY_URL)
+    clock.now += 299
+    assert cache.refresh(DISCOVERY_URL)["document"] == document
+    assert session.calls[-1][1] == 304
+
+
+def test_freshness_lifetime():
+    assert freshness_lifetime({"Cache-Control": "public, max-age=600", "Age": "100"}) == 500
+    assert freshness_lifetime({"Cache-Control": "no-cache"}) == Config.OIDC_MIN_TTL
+    assert freshness_lifetime({}) == Config.OIDC_DEFAULT_TTL
+
+
+def test_provider_metadata_url():
+    assert provider_metadata_url({"name": "corp", "issuer": ISSUER + "/"}) == DISCOVERY_URL
+    assert provider_metadata_url({"name": "google"}).startswith("https://accounts.google.com/")
+    assert provider_metadata_url({"name": "mock_provider"}) is None
+
+
+def test_oidc_client_reads_metadata_and_jwks_from_cache(tmpdir, session, monkeypatch):
+    from avauth_proxy.utils import oidc_utils
+    monkeypatch.setattr(oidc_utils, "oidc_cache", DocumentCache(cache_dir=str(tmpdir), session=session))
+    oauth = CachedOAuth(app)
+    client = oauth.register("corp", server_metadata_url=DISCOVERY_URL, client_id="id", client_secret="secret")
+
+    assert client.load_server_metadata()["token_endpoint"] == f"{ISSUER}/oauth/token"
+    assert client.fetch_jwk_set()["keys"][0]["kid"] == "mock-key-1"
+    client.fetch_jwk_set()
+    assert [path for path, _ in session.calls] == ["/.well-known/openid-configuration", "/oauth/jwks"]
+
+
+def id_token(**claims):
+    now = int(time.time())
+    claims = dict({"iss": ISSUER, "aud": "mock_client_id", "sub": "testuser", "iat": now, "exp": now + 300}, **claims)
+    return jwt.encode({"alg": "RS256", "kid": "mock-key-1"}, claims, mock_server.signing_key)
+
+
+@pytest.fixture
+def oidc_client(tmpdir, session, monkeypatch):
+    from avauth_proxy.utils import oidc_utils
+    monkeypatch.setattr(oidc_utils, "oidc_cache", DocumentCache(cache_dir=str(tmpdir), session=session))
+    client = CachedOAuth(app).register(
+        "corp", server_metadata_url=DISCOVERY_URL, client_id="mock_client_id", client_secret="secret"
+    )
+    client.userinfo_calls = 0
+
+    def userinfo():
+        client.userinfo_calls += 1
+        return {"email": "testuser@example.com", "name": "Test User"}
+
+    monkeypatch.setattr(client, "userinfo", userinfo)
+    return client
+
+
+def test_id_token_claims_skip_userinfo(oidc_client):
+    token = {"access_token": "x", "id_token": id_token(email="testuser@example.com")}
+    user_info = resolve_user_info(oidc_client, token, {"name": "corp"})
+    assert user_info["email"] == "testuser@example.com"
+    assert oidc_client.userinfo_calls == 0
+
+
+def test_userinfo_fetched_when_claims_missing(oidc_client):
+    token = {"access_token": "x", "id_token": id_token()}
+    user_info = resolve_user_info(oidc_client, token, {"name": "corp"})
+    assert user_info["sub"] == "testuser"
+    assert user_info["email"] == "testuser@example.com"
+    assert oidc_client.userinfo_calls == 1
+
+    token = {"access_token": "x", "id_token": id_token(email="testuser@example.com")}
+    resolve_user_info(oidc_client, token, {"name": "corp", "required_claims": ["email", "name"]})
+    assert oidc_client.userinfo_calls == 2
+
+
+def test_forged_id_token_is_rejected(oidc_client):
+    from joserfc.jwk import RSAKey
+    other_key = RSAKey.generate_key(2048, parameters={"kid": "mock-key-1"}, private=True)
+    forged = jwt.encode({"alg": "RS256", "kid": "mock-key-1"}, {"iss": ISSUER, "aud": "mock_client_id", "sub": "x", "email": "a@b.c", "iat": int(time.time()), "exp": int(time.time()) + 300}, other_key)
+    with pytest.raises(Exception):
+        resolve_user_info(oidc_client, {"access_token": "x", "id_token": forged}, {"name": "corp"})
+    assert oidc_client.userinfo_calls == 0
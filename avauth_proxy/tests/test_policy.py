@@ -0,0 +1,71 @@
+import pytest
+from avauth_proxy import app
+from avauth_proxy.config import Config
+from avauth_proxy.utils.file_utils import save_proxies
+from avauth_proxy.utils.policy_utils import (
+    get_policy_index,
+    invalidate_policy_index,
+    compile_policies,
+    check_access,
+)
+
+PROXIES = [
+    {"service_name": "public", "url": "10.0.0.2", "port": "8080", "auth_required": False},
+    {"service_name": "docs", "url": "10.0.0.3", "port": "8081", "auth_required": True,
+     "allowed_emails": ["alice@example.com"], "allowed_domains": []},
+    {"service_name": "private", "url": "10.0.0.4", "port": "9090", "auth_required": True,
+     "allowed_emails": [], "allowed_domains": ["mycompany.com"]},
+]
+
+@pytest.fixture
+def proxies_file(tmpdir):
+    old_file = Config.PROXIES_CONFIG_FILE
+    Config.PROXIES_CONFIG_FILE = str(tmpdir.join("proxies_config.toml"))
+    save_proxies(PROXIES)
+    yield Config.PROXIES_CONFIG_FILE
+    Config.PROXIES_CONFIG_FILE = old_file
+    invalidate_policy_index()
+
+@pytest.fixture
+def client():
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+
+def test_policy_index_compiles_allowlists(proxies_file):
+    index = get_policy_index()
+    assert len(index) == 3
+    assert index.get("docs").allowed_emails == frozenset({"alice@example.com"})
+    assert index.get("private").allowed_domains == frozenset({"mycompany.com"})
+    assert index.get("missing") is None
+
+def test_policy_index_rebuilt_only_on_content_change(proxies_file):
+    index = get_policy_index()
+    assert get_policy_index() is index
+
+    # Same content, new mtime: index is kept
+    save_proxies(PROXIES)
+    assert get_policy_index() is index
+
+    save_proxies(PROXIES[:1])
+    new_index = get_policy_index()
+    assert new_index is not index
+    assert new_index.version == index.version + 1
+    assert new_index.get("docs") is None
+
+def test_check_access():
+    services = compile_policies(PROXIES)
+    assert check_access(None, {"email": "alice@example.com"}) == 403
+    assert check_access(services["docs"], None) == 401
+    assert check_access(services["public"], {"email": "anyone@example.org"}) == 200
+    assert check_access(services["docs"], {"email": "alice@example.com"}) == 200
+    assert check_access(services["docs"], {"email": "bob@example.com"}) == 403
+    assert check_access(services["private"], {"email": "bob@mycompany.com"}) == 200
+
+def test_validate_route(client, proxies_file):
+    assert client.get("/auth/validate/docs").status_code == 401
+    with client.session_transaction() as sess:
+        sess["user"] = {"email": "alice@example.com"}
+    assert client.get("/auth/validate/docs").status_code == 200
+    assert client.get("/auth/validate/private").status_code == 403
+    assert client.get("/auth/validate/unknown").status_code == 403
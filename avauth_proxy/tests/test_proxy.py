@@ -1,6 +1,11 @@
+import time
 import pytest
+import threading
 from avauth_proxy.utils.file_utils import load_proxies, save_proxies
 from avauth_proxy.config import Config
+from avauth_proxy.utils.policy_utils import get_policy_index, invalidate_policy_index
+from avauth_proxy.utils import store_utils
+from avauth_proxy.utils.store_utils import ProxyStore, ProxyExistsError, ProxyNotFoundError, proxy_store_path
 
 def test_load_proxies(tmpdir):
     old_file = Config.PROXIES_CONFIG_FILE
@@ -10,3 +15,122 @@ def test_load_proxies(tmpdir):
     proxies = load_proxies()
     assert proxies == []
     Config.PROXIES_CONFIG_FILE = old_file
+
+def test_proxy_store_crud_and_version(tmpdir):
+    store = ProxyStore(str(tmpdir.join("proxies.db")))
+    assert store.version() == 0
+    assert store.create({"service_name": "a", "url": "10.0.0.1", "port": 80}) == 1
+    assert store.create({"service_name": "b", "url": "10.0.0.2", "port": 80}) == 2
+    with pytest.raises(ProxyExistsError):
+        store.create({"service_name": "a"})
+    with pytest.raises(ValueError):
+        store.create({"url": "10.0.0.3"})
+
+    # Identical update: no new version
+    assert store.update("a", {"service_name": "a", "url": "10.0.0.1", "port": 80}) == 2
+    assert store.update("a", {"service_name": "a", "url": "10.0.0.9", "port": 80}) == 3
+    assert store.get("a")["url"] == "10.0.0.9"
+    # Rename keeps the position
+    store.update("a", {"service_name": "c", "url": "10.0.0.9", "port": 80})
+    assert [p["service_name"] for p in store.list()] == ["c", "b"]
+    with pytest.raises(ProxyNotFoundError):
+        store.update("a", {"service_name": "a"})
+
+    store.delete("b")
+    with pytest.raises(ProxyNotFoundError):
+        store.delete("b")
+    assert store.version() == 5
+    # Another connection (another worker) sees the same state
+    assert ProxyStore(str(tmpdir.join("proxies.db"))).list() == store.list()
+
+def test_proxy_store_transaction_is_atomic(tmpdir):
+    store = ProxyStore(str(tmpdir.join("proxies.db")))
+    store.create({"service_name": "a"})
+    with pytest.raises(ProxyExistsError):
+        with store.transaction() as tx:
+            tx.create({"service_name": "b"})
+            tx.delete("a")
+            tx.create({"service_name": "b"})
+    assert [p["service_name"] for p in store.list()] == ["a"]
+    assert store.version() == 1
+
+    with store.transaction() as tx:
+        tx.create({"service_name": "b"})
+        tx.create({"service_name": "c"})
+    assert tx.version == 2
+
+def test_proxy_store_toml_import_export(tmpdir):
+    toml_file = tmpdir.join("proxies_config.toml")
+    toml_file.write('[[proxies]]\nservice_name = "a"\nport = 80\n')
+    store = ProxyStore(str(tmpdir.join("proxies.db")))
+    assert store.sync_from_toml(str(toml_file))
+    assert not store.sync_from_toml(str(toml_file))
+    assert store.list() == [{"service_name": "a", "port": 80}]
+
+    store.create({"service_name": "b", "port": 81})
+    assert store.export_toml(str(toml_file))
+    assert not store.export_toml(str(toml_file))
+    # The exported file is not re-imported
+    assert not store.sync_from_toml(str(toml_file))
+
+    # A hand edit is
+    toml_file.write('[[proxies]]\nservice_name = "b"\nport = 82\n')
+    assert store.sync_from_toml(str(toml_file))
+    assert store.list() == [{"service_name": "b", "port": 82}]
+
+def test_exported_toml_mode_and_failed_writes(tmpdir, monkeypatch):
+    toml_file = tmpdir.join("proxies_config.toml")
+    store = ProxyStore(str(tmpdir.join("proxies.db")))
+    store.create({"service_name": "a"})
+    monkeypatch.setattr(store_utils, "_UMASK", 0o022)
+    assert store.export_toml(str(toml_file))
+    # Not mkstemp's 0600: operators and other containers read this file
+    assert toml_file.stat().mode & 0o777 == 0o644
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    store.create({"service_name": "b"})
+    monkeypatch.setattr(store_utils.os, "replace", fail)
+    with pytest.raises(OSError):
+        store.export_toml(str(toml_file))
+    assert not tmpdir.listdir(lambda p: p.basename.endswith(".tmp"))
+
+def test_concurrent_exports_do_not_roll_back(tmpdir):
+    toml_path = tmpdir.join("proxies_config.toml")
+    toml_file = str(toml_path)
+    first = ProxyStore(str(tmpdir.join("proxies.db")))
+    first.create({"service_name": "a"})
+    # A second handle stands in for another worker
+    second = ProxyStore(first.path)
+    other = threading.Thread(target=lambda: (second.create({"service_name": "b"}), second.export_toml(toml_file)))
+    write_toml = first._write_toml
+
+    def slow_write(path, proxies):
+        other.start()
+        time.sleep(0.2)  # the other export must wait instead of writing now
+        return write_toml(path, proxies)
+
+    first._write_toml = slow_write
+    assert first.export_toml(toml_file)
+    other.join()
+    assert not first.sync_from_toml(toml_file)
+    assert [p["service_name"] for p in first.list()] == ["a", "b"]
+    assert "b" in toml_path.read()
+
+def test_policy_index_follows_store_rows(tmpdir):
+    old_file = Config.PROXIES_CONFIG_FILE
+    Config.PROXIES_CONFIG_FILE = str(tmpdir.join("proxies_config.toml"))
+    try:
+        save_proxies([{"service_name": "docs", "auth_required": True, "allowed_emails": ["a@example.com"]}])
+        index = get_policy_index()
+        assert index.get("docs").allowed_emails == frozenset({"a@example.com"})
+
+        # A write by another worker is picked up on the next check
+        ProxyStore(proxy_store_path()).delete("docs")
+        invalidate_policy_index()
+        assert get_policy_index().get("docs") is None
+        assert get_policy_index().version == index.version + 1
+    finally:
+        Config.PROXIES_CONFIG_FILE = old_file
+        invalidate_policy_index()
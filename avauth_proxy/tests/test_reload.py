@@ -0,0 +1,55 @@
+import threading
+import pytest
+from avauth_proxy.config import Config
+from avauth_proxy.utils.logging_utils import event_writer
+from avauth_proxy.utils.nginx_utils import GenerationResult
+from avauth_proxy.utils.reload_utils import ReloadScheduler
+
+class CountingRender:
+    def __init__(self, error=None):
+        self.calls = 0
+        self.error = error
+        self.started = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        if self.error:
+            raise self.error
+        return GenerationResult(["svc"], [], [])
+
+def test_requests_within_window_are_coalesced():
+    render = CountingRender()
+    scheduler = ReloadScheduler(render, window=0.1, max_delay=5)
+    generations = [scheduler.request() for _ in range(5)]
+    assert generations == [1, 2, 3, 4, 5]
+
+    result = scheduler.wait(generations[-1], timeout=5)
+    assert result.written == ["svc"]
+    assert scheduler.wait(generations[0], timeout=1) == result
+    assert render.calls == 1
+
+def test_later_request_gets_new_run():
+    render = CountingRender()
+    scheduler = ReloadScheduler(render, window=0.01, max_delay=1)
+    scheduler.wait(scheduler.request(), timeout=5)
+    scheduler.wait(scheduler.request(), timeout=5)
+    assert render.calls == 2
+
+@pytest.fixture
+def events_file(tmpdir, monkeypatch):
+    # Failed runs are logged as events
+    monkeypatch.setattr(Config, "EVENTS_LOG_FILE", str(tmpdir.join("events.log")))
+    yield Config.EVENTS_LOG_FILE
+    event_writer.flush(5)
+
+def test_wait_reraises_render_error(events_file):
+    scheduler = ReloadScheduler(CountingRender(RuntimeError("nginx: bad config")), window=0.01, max_delay=1)
+    generation = scheduler.request()
+    with pytest.raises(RuntimeError, match="bad config"):
+        scheduler.wait(generation, timeout=5)
+
+def test_wait_times_out():
+    scheduler = ReloadScheduler(CountingRender(), window=10, max_delay=10)
+    with pytest.raises(TimeoutError):
+        scheduler.wait(scheduler.request(), timeout=0.05)
@@ -0,0 +1,114 @@
+import pytest
+from flask import Flask, session
+from avauth_proxy import app
+from avauth_proxy.utils.session_utils import (
+    SessionStore, MemorySessionStore, SQLiteSessionStore, KeyValueSessionStore, LocalKeyValueClient,
+    ServerSideSessionInterface, make_session_loader, regenerate_session,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "sqlite", "external"])
+def store_and_clock(request, tmpdir):
+    clock = FakeClock()
+    if request.param == "memory":
+        return MemorySessionStore(maxsize=2, clock=clock), clock
+    if request.param == "sqlite":
+        return SQLiteSessionStore(str(tmpdir.join("sessions.db")), purge_every=1, clock=clock), clock
+    return KeyValueSessionStore(LocalKeyValueClient(clock=clock)), clock
+
+
+def test_store_interface_is_abstract():
+    class Incomplete(SessionStore):
+        def get(self, session_id):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_store_roundtrip_and_expiry(store_and_clock):
+    store, clock = store_and_clock
+    store.set("abc", {"user": {"email": "a@example.com"}}, ttl=60)
+    assert store.get("abc") == {"user": {"email": "a@example.com"}}
+    clock.now += 61
+    assert store.get("abc") is None
+    store.set("abc", {"x": 1}, ttl=60)
+    store.delete("abc")
+    assert store.get("abc") is None
+
+
+def test_memory_store_is_bounded():
+    store = MemorySessionStore(maxsize=2)
+    for session_id in ("a", "b", "c"):
+        store.set(session_id, {}, ttl=60)
+    assert store.get("a") is None
+    assert len(store) == 2
+
+
+def test_sqlite_store_is_shared(tmpdir):
+    path = str(tmpdir.join("sessions.db"))
+    SQLiteSessionStore(path).set("abc", {"user": {"email": "a@example.com"}}, ttl=60)
+    assert SQLiteSessionStore(path).get("abc")["user"]["email"] == "a@example.com"
+
+
+@pytest.fixture
+def server_side_app():
+    test_app = Flask(__name__)
+    test_app.secret_key = "test"
+    test_app.session_interface = ServerSideSessionInterface(MemorySessionStore())
+
+    @test_app.route("/login")
+    def login():
+        regenerate_session(session)
+        session["user"] = {"email": "a@example.com", "name": "A" * 500}
+        return "ok"
+
+    @test_app.route("/whoami")
+    def whoami():
+        return session.get("user", {}).get("email", "")
+
+    @test_app.route("/logout")
+    def logout():
+        session.clear()
+        return "ok"
+
+    return test_app
+
+
+def test_cookie_only_carries_session_id(server_side_app):
+    client = server_side_app.test_client()
+    client.get("/login")
+    cookie = client.get_cookie("session")
+    assert len(cookie.value) == 24
+    assert client.get("/whoami").data == b"a@example.com"
+
+    loader = make_session_loader(server_side_app)
+    assert loader(cookie.value)["user"]["email"] == "a@example.com"
+    assert loader("unknown") == {}
+
+
+def test_login_rotates_and_logout_deletes(server_side_app):
+    client = server_side_app.test_client()
+    client.get("/login")
+    first = client.get_cookie("session").value
+    client.get("/login")
+    second = client.get_cookie("session").value
+    assert first != second
+    store = server_side_app.session_interface.store
+    assert store.get(first) is None
+
+    client.get("/logout")
+    assert store.get(second) is None
+    assert client.get_cookie("session") is None
+
+
+def test_app_uses_configured_backend():
+    assert isinstance(app.session_interface, ServerSideSessionInterface)
@@ -0,0 +1,122 @@
+import time
+import pytest
+from unittest.mock import patch
+from avauth_proxy.config import Config
+from avauth_proxy.utils import config_utils, policy_utils
+from avauth_proxy.utils.logging_utils import event_writer
+from avauth_proxy.utils.config_utils import get_config_snapshot, reload_config
+from avauth_proxy.utils.store_utils import ProxyStore, _toml_lock, get_proxy_store, proxy_store_path
+from avauth_proxy.utils.watch_utils import ConfigWatcher, apply_changes
+
+CONFIG = """
+[app]
+admin_emails = [{admins}]
+
+[auth]
+use_oauth2_proxy = false
+"""
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+@pytest.fixture
+def files(tmpdir, monkeypatch):
+    # Published settings are restored along with the paths
+    for name in ("CONFIG_TOML_FILE", "PROXIES_CONFIG_FILE", "ADMIN_EMAILS", "USE_OAUTH2_PROXY", "NGINX_ACL_SECRET"):
+        monkeypatch.setattr(Config, name, getattr(Config, name))
+    monkeypatch.setattr(Config, "EVENTS_LOG_FILE", str(tmpdir.join("events.log")))
+    monkeypatch.setattr(config_utils, "_snapshot", config_utils._snapshot)
+    config_file, proxies_file = tmpdir.join("config.toml"), tmpdir.join("proxies_config.toml")
+    config_file.write(CONFIG.format(admins='"one@example.com"'))
+    proxies_file.write("")
+    Config.CONFIG_TOML_FILE, Config.PROXIES_CONFIG_FILE = str(config_file), str(proxies_file)
+    reload_config(force=True)
+    yield config_file, proxies_file
+    policy_utils.invalidate_policy_index()
+    event_writer.flush(5)
+
+@pytest.fixture
+def watcher(files):
+    watcher = ConfigWatcher(debounce=0.05)
+    assert watcher.start()
+    assert not watcher.start()
+    yield watcher
+    watcher.stop()
+
+def test_config_edit_swaps_the_snapshot(files, watcher):
+    config_file, _ = files
+    before = get_config_snapshot()
+    assert Config.ADMIN_EMAILS == frozenset({"one@example.com"})
+
+    config_file.write(CONFIG.format(admins='"one@example.com", "two@example.com"'))
+    assert wait_until(lambda: "two@example.com" in Config.ADMIN_EMAILS)
+    after = get_config_snapshot()
+    assert after is not before and after.admin_emails == Config.ADMIN_EMAILS
+    assert before.admin_emails == frozenset({"one@example.com"})
+
+def test_invalid_config_keeps_the_last_snapshot(files):
+    config_file, _ = files
+    before = get_config_snapshot()
+    config_file.write("[app\nadmin_emails = ")
+    apply_changes({"config"})
+    assert get_config_snapshot() is before
+    assert Config.ADMIN_EMAILS == frozenset({"one@example.com"})
+
+def test_rendered_settings_change_schedules_a_render(files):
+    config_file, _ = files
+    with patch("avauth_proxy.utils.reload_utils.schedule_nginx_reload") as schedule:
+        config_file.write(CONFIG.format(admins='"two@example.com"'))
+        apply_changes({"config"})
+        assert schedule.call_count == 0
+        config_file.write(CONFIG.format(admins='"two@example.com"') + 'nginx_acl_secret = "rotated"\n')
+        apply_changes({"config"})
+        assert Config.NGINX_ACL_SECRET == "rotated"
+        assert schedule.call_count == 1
+        config_file.write(CONFIG.format(admins='"two@example.com"').replace("false", "true"))
+        apply_changes({"config"})
+        assert Config.USE_OAUTH2_PROXY and schedule.call_count == 2
+
+def test_removed_acl_secret_falls_back_to_the_environment(files, monkeypatch):
+    config_file, _ = files
+    monkeypatch.delenv("NGINX_ACL_SECRET", raising=False)
+    with patch("avauth_proxy.utils.reload_utils.schedule_nginx_reload") as schedule:
+        config_file.write(CONFIG.format(admins='"one@example.com"') + 'nginx_acl_secret = "s3cret"\n')
+        apply_changes({"config"})
+        assert Config.NGINX_ACL_SECRET == "s3cret"
+        config_file.write(CONFIG.format(admins='"one@example.com"'))
+        apply_changes({"config"})
+        assert Config.NGINX_ACL_SECRET is None
+        assert schedule.call_count == 2
+
+def test_proxies_edit_is_imported_once(files, watcher):
+    _, proxies_file = files
+    with patch("avauth_proxy.utils.reload_utils.schedule_nginx_reload") as schedule:
+        proxies_file.write('[[proxies]]\nservice_name = "edited"\nurl = "10.0.0.1"\nport = 80\n')
+        assert wait_until(lambda: policy_utils._index is not None and policy_utils._index.get("edited"))
+        assert get_proxy_store().get("edited")["url"] == "10.0.0.1"
+        assert schedule.call_count == 1
+        # The same content again (e.g. another worker's watcher) is a no-op
+        apply_changes({"proxies"})
+        assert schedule.call_count == 1
+
+def test_proxies_edit_waits_for_a_running_export(files, watcher):
+    _, proxies_file = files
+    with patch("avauth_proxy.utils.reload_utils.schedule_nginx_reload"):
+        # Another worker's export holds the file's lock
+        with _toml_lock(str(proxies_file)):
+            proxies_file.write('[[proxies]]\nservice_name = "locked"\nurl = "10.0.0.3"\nport = 80\n')
+            time.sleep(0.3)
+            assert get_proxy_store().get("locked") is None
+        # The skipped import is retried once the lock is released
+        assert wait_until(lambda: get_proxy_store().get("locked") is not None)
+
+def test_store_write_from_another_process_rebuilds_the_index(files, watcher):
+    policy_utils.get_policy_index()
+    # A second connection stands in for another worker
+    ProxyStore(proxy_store_path()).create({"service_name": "other", "url": "10.0.0.2", "port": 80})
+    assert wait_until(lambda: policy_utils._index.get("other") is not None)
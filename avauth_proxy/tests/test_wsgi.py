@@ -0,0 +1,43 @@
+import pytest
+from avauth_proxy import app
+from avauth_proxy.config import Config
+from avauth_proxy.utils.file_utils import save_proxies
+from avauth_proxy.utils.cache_utils import decision_cache
+from avauth_proxy.utils.policy_utils import invalidate_policy_index
+
+@pytest.fixture
+def client(tmpdir):
+    old_file = Config.PROXIES_CONFIG_FILE
+    Config.PROXIES_CONFIG_FILE = str(tmpdir.join("proxies_config.toml"))
+    save_proxies([{"service_name": "docs", "url": "10.0.0.3", "port": "8081",
+                   "auth_required": True, "allowed_domains": ["example.com"]}])
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+    Config.PROXIES_CONFIG_FILE = old_file
+    invalidate_policy_index()
+    decision_cache.clear()
+
+def test_fast_path_reads_flask_session(client):
+    with client.session_transaction() as sess:
+        sess["user"] = {"email": "carol@example.com"}
+    response = client.get("/auth/validate/docs")
+    assert response.status_code == 200
+    assert response.data == b""
+
+def test_fast_path_rejects_tampered_cookie(client):
+    client.set_cookie(app.config["SESSION_COOKIE_NAME"], "eyJ1c2VyIjp7fX0.forged.signature")
+    assert client.get("/auth/validate/docs").status_code == 401
+
+def test_fast_path_bad_paths(client):
+    assert client.get("/auth/validate/docs/extra").status_code == 404
+    assert client.get("/auth/validate/unknown").status_code == 403
+
+def test_fast_path_matches_flask_route(client):
+    with client.session_transaction() as sess:
+        sess["user"] = {"email": "mallory@evil.test"}
+    with app.test_request_context("/auth/validate/docs"):
+        from flask import session
+        session["user"] = {"email": "mallory@evil.test"}
+        flask_status = app.view_functions["auth.validate_service"]("docs")[1]
+    assert client.get("/auth/validate/docs").status_code == flask_status == 403
@@ -1,6 +1,30 @@
-from .file_utils import load_proxies, save_proxies
-from .logging_utils import log_event
-from .nginx_utils import generate_nginx_configs, reload_nginx
-from .oauth_utils import load_oauth_providers
-from .config_utils import get_app_config, get_oauth_providers
-from .misc_utils import get_available_templates, load_events
+# Names below are imported from their modules on first access, so importing
+# one utils module (e.g. nginx_utils from the render CLI) does not pull in
+# Authlib, Flask or the HTTP client through all the others.
+import importlib
+
+_EXPORTS = {
+    "load_proxies": "file_utils", "save_proxies": "file_utils",
+    "log_event": "logging_utils",
+    "generate_nginx_configs": "nginx_utils", "reload_nginx": "nginx_utils",
+    "load_oauth_providers": "oauth_utils", "get_provider_registry": "oauth_utils",
+    "get_app_config": "config_utils", "get_oauth_providers": "config_utils",
+    "get_available_templates": "misc_utils", "load_events": "misc_utils",
+    "get_policy_index": "policy_utils", "invalidate_policy_index": "policy_utils",
+    "check_access": "policy_utils", "decide_access": "policy_utils",
+    "decision_cache": "cache_utils",
+    "schedule_nginx_reload": "reload_utils", "wait_for_nginx_reload": "reload_utils",
+    "get_template_env": "template_utils", "list_nginx_templates": "template_utils",
+    "get_event_store": "event_utils", "import_event_log": "event_utils",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
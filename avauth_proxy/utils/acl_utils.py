@@ -0,0 +1,122 @@
+import re
+import time
+import base64
+import hashlib
+from avauth_proxy.config import Config
+
+# Cookies carrying the identity Nginx can verify natively with the
+# secure_link module: md5("expires:email:secret"), base64url without padding.
+# The separators keep digits from moving between expiry and email.
+EMAIL_COOKIE = "avauth_email"
+EXPIRES_COOKIE = "avauth_exp"
+SIGNATURE_COOKIE = "avauth_sig"
+
+_VARIABLE_UNSAFE = re.compile(r"[^A-Za-z0-9_]")
+# Unix time in seconds until the year 2286; anything else is refused
+_EXPIRES = re.compile(r"^[0-9]{10}$")
+
+
+def acl_enabled():
+    return bool(Config.NGINX_ACL_SECRET)
+
+
+def is_acl_eligible(proxy):
+    """
+    A service can be decided by an Nginx map when its policy is a plain
+    email/domain allowlist. Services can opt out with `nginx_acl = false`.
+    """
+    return (
+        acl_enabled()
+        and bool(proxy.get("auth_required", False))
+        and proxy.get("nginx_acl", True)
+        and bool(proxy.get("allowed_emails") or proxy.get("allowed_domains"))
+    )
+
+
+def acl_variable(service_name):
+    """Nginx variable name (without $) holding the map result for a service."""
+    digest = hashlib.sha1(service_name.encode("utf-8")).hexdigest()[:8]
+    return f"avauth_allow_{_VARIABLE_UNSAFE.sub('_', service_name)}_{digest}"
+
+
+def _quote(value):
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def render_acl_maps(proxies):
+    """
+    Render the http-level include with one `map` per eligible service.
+
+    The map key is "$secure_link:$cookie_avauth_email", so it only yields 1
+    for a valid, unexpired identity cookie whose email (exact string, which
+    Nginx compares case-insensitively) or domain (case-sensitive regex) is
+    allowlisted. Everything else maps to 0 and falls back to /auth/validate.
+    """
+    lines = [
+        "# Generated by avauth_proxy from proxies_config.toml; do not edit.",
+        "# Include this file in the http {} context.",
+        "",
+        "map $host $avauth_acl_secret {",
+        f"    default {_quote(Config.NGINX_ACL_SECRET or '')};",
+        "}",
+        "",
+        "# Expiry handed to secure_link: 10 digits, else 0 (never valid)",
+        f"map ${'cookie_' + EXPIRES_COOKIE} $avauth_exp {{",
+        f"    {_quote('~' + _EXPIRES.pattern)} ${'cookie_' + EXPIRES_COOKIE};",
+        "    default 0;",
+        "}",
+    ]
+    for proxy in proxies:
+        if not is_acl_eligible(proxy):
+            continue
+        lines.append("")
+        lines.append(f"# {proxy['service_name']}")
+        lines.append(f"map \"$secure_link:${'cookie_' + EMAIL_COOKIE}\" ${acl_variable(proxy['service_name'])} {{")
+        lines.append("    default 0;")
+        for email in sorted(set(proxy.get("allowed_emails", []))):
+            lines.append(f"    {_quote('1:' + email)} 1;")
+        for domain in sorted(set(proxy.get("allowed_domains", []))):
+            lines.append(f"    {_quote('~^1:[^@]*@' + re.escape(domain) + '$')} 1;")
+        lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def sign_identity(email, expires):
+    raw = hashlib.md5(f"{expires}:{email}:{Config.NGINX_ACL_SECRET}".encode("utf-8")).digest()
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def identity_cookies(email, now=None):
+    """
+    Return {cookie name: value} for the Nginx-verifiable identity of `email`,
+    or an empty dict when the ACL maps are disabled or there is no email.
+    """
+    if not acl_enabled() or not email:
+        return {}
+    expires = int(now if now is not None else time.time()) + Config.NGINX_ACL_TTL
+    return {
+        EMAIL_COOKIE: email,
+        EXPIRES_COOKIE: str(expires),
+        SIGNATURE_COOKIE: sign_identity(email, expires),
+    }
+
+
+def set_identity_cookies(response, email):
+    # Flask is imported here so the Nginx renderer can use this module without it
+    from flask import current_app
+    for name, value in identity_cookies(email).items():
+        response.set_cookie(
+            name, value,
+            max_age=Config.NGINX_ACL_TTL,
+            secure=current_app.config["SESSION_COOKIE_SECURE"],
+            httponly=True,
+            samesite=current_app.config["SESSION_COOKIE_SAMESITE"],
+        )
+    return response
+
+
+def clear_identity_cookies(response):
+    for name in (EMAIL_COOKIE, EXPIRES_COOKIE, SIGNATURE_COOKIE):
+        response.delete_cookie(name)
+    return response
+
@@ -0,0 +1,144 @@
+import re
+from collections import namedtuple
+from avauth_proxy.utils.store_utils import get_proxy_store, ProxyExistsError, ProxyNotFoundError
+from avauth_proxy.utils.template_utils import list_nginx_templates
+
+OPERATIONS = ("create", "update", "delete")
+
+# service_name ends up in a file name and an Nginx variable
+_SERVICE_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,127}$")
+_LIST_FIELDS = ("allowed_emails", "allowed_domains")
+_STRING_FIELDS = ("url", "template", "custom_directives", "server_name")
+_BOOL_FIELDS = ("auth_required", "nginx_acl")
+
+BatchResult = namedtuple("BatchResult", ["changed", "version", "results"])
+
+
+class BatchError(ValueError):
+    """Raised with the per-item results when a batch is rejected as a whole."""
+
+    def __init__(self, message, results):
+        super().__init__(message)
+        self.results = results
+
+
+def normalize_proxy(proxy, partial=False):
+    """
+    Check the fields of a proxy from an API request and return a cleaned
+    copy. With `partial`, fields may be missing (update operations).
+    """
+    if not isinstance(proxy, dict):
+        raise ValueError("proxy must be an object")
+    cleaned = dict(proxy)
+    if not partial or "service_name" in proxy:
+        name = proxy.get("service_name")
+        if not isinstance(name, str) or not _SERVICE_NAME.match(name):
+            raise ValueError("service_name must be 1-128 letters, digits, '.', '_' or '-'")
+    if not partial and not proxy.get("url"):
+        raise ValueError("url is required")
+    for field in _STRING_FIELDS:
+        if field in proxy and not isinstance(proxy[field], str):
+            raise ValueError(f"{field} must be a string")
+    if "template" in proxy and proxy["template"] not in list_nginx_templates():
+        raise ValueError(f"Unknown template {proxy['template']}")
+    if "port" in proxy:
+        port = proxy["port"]
+        if isinstance(port, bool) or not str(port).isdigit() or not 0 < int(port) < 65536:
+            raise ValueError("port must be between 1 and 65535")
+        cleaned["port"] = int(port)
+    for field in _BOOL_FIELDS:
+        if field in proxy and not isinstance(proxy[field], bool):
+            raise ValueError(f"{field} must be true or false")
+    for field in _LIST_FIELDS:
+        if field in proxy:
+            values = proxy[field]
+            if not isinstance(values, list) or not all(isinstance(v, str) and v.strip() for v in values):
+                raise ValueError(f"{field} must be a list of non-empty strings")
+            cleaned[field] = [v.strip() for v in values]
+    return cleaned
+
+
+def validate_operations(operations):
+    """
+    Check the shape of every operation before anything is applied. Returns
+    the normalized operations; raises BatchError listing every invalid one.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise BatchError("operations must be a non-empty list", [])
+
+    normalized, results, targets = [], [], set()
+    for i, operation in enumerate(operations):
+        try:
+            if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+                raise ValueError(f"op must be one of {', '.join(OPERATIONS)}")
+            op = operation["op"]
+            if op == "create":
+                proxy = normalize_proxy(operation.get("proxy"))
+                target = proxy["service_name"]
+            else:
+                target = operation.get("service_name")
+                if not isinstance(target, str) or not target:
+                    raise ValueError("service_name is required")
+                proxy = normalize_proxy(operation.get("proxy"), partial=True) if op == "update" else None
+            # One operation per service keeps the outcome independent of order
+            names = {target} | ({proxy["service_name"]} if proxy and "service_name" in proxy else set())
+            if names & targets:
+                raise ValueError(f"{', '.join(sorted(names & targets))} is changed by another operation")
+            targets |= names
+            normalized.append({"op": op, "service_name": target, "proxy": proxy})
+            results.append({"index": i, "service_name": target, "op": op, "status": "valid"})
+        except ValueError as e:
+            results.append({"index": i, "op": operation.get("op") if isinstance(operation, dict) else None,
+                            "status": "invalid", "error": str(e)})
+
+    if any(result["status"] == "invalid" for result in results):
+        raise BatchError("invalid operations", results)
+    return normalized
+
+
+def apply_operations(operations, store=None):
+    """
+    Apply validated operations in one store transaction: all of them or,
+    if one fails (e.g. creating an existing service), none. Returns a
+    BatchResult; raises BatchError with the per-item results on failure.
+    """
+    if store is None:
+        store = get_proxy_store()
+    results = []
+    failed = False
+    try:
+        with store.transaction() as tx:
+            for i, operation in enumerate(operations):
+                op, name = operation["op"], operation["service_name"]
+                result = {"index": i, "service_name": name, "op": op}
+                try:
+                    if op == "create":
+                        tx.create(operation["proxy"])
+                    elif op == "update":
+                        current = tx.get(name)
+                        if current is None:
+                            raise ProxyNotFoundError(name)
+                        updated = {**current, **operation["proxy"]}
+                        if updated == current:
+                            result["status"] = "unchanged"
+                            results.append(result)
+                            continue
+                        tx.update(name, updated)
+                    else:
+                        tx.delete(name)
+                    result["status"] = "ok"
+                except ProxyExistsError as e:
+                    result.update(status="conflict", error=str(e))
+                    failed = True
+                except ProxyNotFoundError:
+                    result.update(status="not_found", error=f"Proxy {name} does not exist")
+                    failed = True
+                results.append(result)
+            if failed:
+                raise BatchError("batch rolled back", results)
+    except BatchError:
+        for result in results:
+            if result["status"] in ("ok", "unchanged"):
+                result["status"] = "rolled_back"
+        raise
+    return BatchResult(tx.changed, tx.version, results)
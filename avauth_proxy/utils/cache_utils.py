@@ -0,0 +1,111 @@
+import time
+import threading
+from collections import OrderedDict
+from avauth_proxy.config import Config
+from avauth_proxy.utils.metrics_utils import (
+    decision_cache_hits, decision_cache_misses, decision_cache_evictions, decision_cache_size,
+)
+
+
+class DecisionCache:
+    """
+    Bounded LRU cache of /auth/validate decisions with a per-entry TTL.
+
+    Keys are (session id, service_name, policy version) tuples. Entries are
+    also indexed by session id so a logout can drop all of a user's decisions
+    without scanning the whole cache. An `instrumented` cache also reports
+    to the decision_cache_* Prometheus metrics.
+    """
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic, instrumented=False):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, status)
+        self._by_session = {}  # session id -> set of keys
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.instrumented = instrumented
+
+    def get(self, key):
+        """Return the cached status for key, or None on a miss or expiry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._miss()
+                return None
+            expires_at, status = entry
+            if expires_at <= self._clock():
+                self._discard(key)
+                self._miss()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        if self.instrumented:
+            decision_cache_hits.inc()
+        return status
+
+    def set(self, key, status):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._entries[key] = (self._clock() + self.ttl, status)
+            self._by_session.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                self.evictions += 1
+                if self.instrumented:
+                    decision_cache_evictions.inc()
+            self._export_size()
+
+    def invalidate_session(self, session_id):
+        """Drop every cached decision for one session (e.g. on logout)."""
+        with self._lock:
+            for key in self._by_session.pop(session_id, ()):
+                self._entries.pop(key, None)
+            self._export_size()
+
+    def clear(self):
+        """Drop every cached decision (e.g. when the proxy policy changed)."""
+        with self._lock:
+            self._entries.clear()
+            self._by_session.clear()
+            self._export_size()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _miss(self):
+        # Caller must hold self._lock
+        self.misses += 1
+        if self.instrumented:
+            decision_cache_misses.inc()
+
+    def _export_size(self):
+        # Caller must hold self._lock
+        if self.instrumented:
+            decision_cache_size.set(len(self._entries))
+
+    def _discard(self, key):
+        # Caller must hold self._lock
+        self._entries.pop(key, None)
+        keys = self._by_session.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_session[key[0]]
+
+
+decision_cache = DecisionCache(Config.DECISION_CACHE_SIZE, Config.DECISION_CACHE_TTL, instrumented=True)
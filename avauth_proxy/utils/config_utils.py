@@ -1,12 +1,34 @@
 import os
 import tomllib
+import threading
+from collections import namedtuple
+from types import MappingProxyType
 from avauth_proxy.config import Config
+from avauth_proxy.utils.metrics_utils import config_parse_duration
+
+# One parse of config.toml. `settings` is the merged [app] and [auth] tables,
+# `signature` identifies the file version it was read from (file_signature).
+ConfigSnapshot = namedtuple(
+    "ConfigSnapshot", ["path", "signature", "settings", "admin_emails", "use_oauth2_proxy", "providers"]
+)
+
+_lock = threading.Lock()
+_snapshot = None
 
 def load_config_file(filepath):
     if not os.path.exists(filepath):
         raise FileNotFoundError(f"Configuration file not found: {filepath}")
-    with open(filepath, "rb") as f:
-        return tomllib.load(f)
+    with config_parse_duration.labels(file="config").time():
+        with open(filepath, "rb") as f:
+            return tomllib.load(f)
+
+def file_signature(path):
+    """(path, inode, mtime, size) of a file, or (path, None) if it is missing."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return (path, None)
+    return (path, st.st_ino, st.st_mtime_ns, st.st_size)
 
 def get_oauth_providers():
     config_data = load_config_file(Config.CONFIG_TOML_FILE)
@@ -19,3 +41,48 @@ def get_app_config():
     # Merge auth config into app config for convenience
     app_config.update(auth_config)
     return app_config
+
+def read_config_snapshot(path=None):
+    """Parse config.toml once into a ConfigSnapshot."""
+    path = path or Config.CONFIG_TOML_FILE
+    signature = file_signature(path)
+    config_data = load_config_file(path)
+    settings = dict(config_data.get("app", {}))
+    settings.update(config_data.get("auth", {}))
+    return ConfigSnapshot(
+        path=path,
+        signature=signature,
+        settings=MappingProxyType(settings),
+        admin_emails=frozenset(settings.get("admin_emails", [])),
+        use_oauth2_proxy=settings.get("use_oauth2_proxy", True),
+        providers=tuple(config_data.get("oauth_providers", [])),
+    )
+
+def publish_config(snapshot):
+    """
+    Make `snapshot` the current configuration. The settings read on every
+    request are plain Config attributes, each replaced in one assignment.
+    """
+    global _snapshot
+    _snapshot = snapshot
+    Config.USE_OAUTH2_PROXY = snapshot.use_oauth2_proxy
+    Config.ADMIN_EMAILS = snapshot.admin_emails
+    # Not the published value: removing the key must turn the ACL maps off
+    Config.NGINX_ACL_SECRET = snapshot.settings.get("nginx_acl_secret", os.getenv("NGINX_ACL_SECRET"))
+    return snapshot
+
+def reload_config(force=False):
+    """
+    Re-read config.toml if it changed since the current snapshot and
+    publish it. Returns the new snapshot, or None if nothing changed.
+    """
+    with _lock:
+        current = _snapshot
+        path = Config.CONFIG_TOML_FILE
+        if not force and current is not None and current.signature == file_signature(path):
+            return None
+        return publish_config(read_config_snapshot(path))
+
+def get_config_snapshot():
+    """The published ConfigSnapshot, None before the first reload_config()."""
+    return _snapshot
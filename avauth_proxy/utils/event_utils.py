@@ -0,0 +1,504 @@
+import io
+import os
+import re
+import ast
+import gzip
+import json
+import time
+import fcntl
+import datetime
+import threading
+from contextlib import contextmanager
+from collections import namedtuple
+from avauth_proxy.config import Config
+
+EventPage = namedtuple("EventPage", ["events", "next_cursor"])
+
+# A part of the events log. kind is "gz" (compressed, with header), "open"
+# (rotated, waiting for compression) or "active" (being appended to).
+Segment = namedtuple("Segment", ["seq", "kind", "path", "header"])
+
+_CHUNK_SIZE = 64 * 1024
+_SEGMENT_RE = re.compile(r"^\.(\d{6})\.(gz|open)$")
+
+
+def parse_event_line(line):
+    """
+    Parse one events.log line into an event dict, or None for blank,
+    partial or non-event lines. Accepts JSON (current format) and the
+    Python-repr lines written by older versions, without eval().
+    """
+    if isinstance(line, bytes):
+        line = line.decode("utf-8", errors="replace")
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError:
+        try:
+            record = ast.literal_eval(line)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            return None
+    if not isinstance(record, dict) or "event_id" not in record:
+        return None
+    return {
+        "event_id": record["event_id"],
+        "timestamp": record.get("timestamp", ""),
+        "description": record.get("description", ""),
+        "code": record.get("code", ""),
+    }
+
+
+def _as_timestamp(value):
+    if value is None or isinstance(value, str):
+        return value or None
+    if isinstance(value, (int, float)):
+        value = datetime.datetime.fromtimestamp(value)
+    return value.isoformat()
+
+
+def _read_lines_backwards(f, start, end):
+    """Yield (offset, line) for complete lines in [start, end), newest first."""
+    pos = end
+    buf = b""
+    while pos > start:
+        size = min(_CHUNK_SIZE, pos - start)
+        pos -= size
+        f.seek(pos)
+        buf = f.read(size) + buf
+        lines = buf.split(b"\n")
+        line_end = pos + len(buf)
+        for line in reversed(lines[1:]):
+            line_start = line_end - len(line)
+            if line:
+                yield line_start, line
+            line_end = line_start - 1
+        buf = lines[0]
+    if buf:
+        yield start, buf
+
+
+# -- segments ------------------------------------------------------------------
+
+@contextmanager
+def _segment_lock(path):
+    """Inter-process lock serializing rotation and compression of one log."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def list_segments(path):
+    """Closed segments of the log at `path`, oldest first (no headers)."""
+    directory, base = os.path.split(path)
+    segments = []
+    try:
+        filenames = os.listdir(directory or ".")
+    except FileNotFoundError:
+        return segments
+    for filename in filenames:
+        if not filename.startswith(base):
+            continue
+        match = _SEGMENT_RE.match(filename[len(base):])
+        if match:
+            segments.append(Segment(int(match.group(1)), match.group(2), os.path.join(directory, filename), None))
+    segments.sort(key=lambda s: s.seq)
+    return segments
+
+
+_headers = {}  # gz segment path -> header dict; segments are immutable
+
+
+def read_segment_header(segment_path):
+    """Return the {"start", "end", "count"} header of a compressed segment."""
+    header = _headers.get(segment_path)
+    if header is None:
+        with gzip.open(segment_path, "rb") as f:
+            header = json.loads(f.readline())
+        _headers[segment_path] = header
+    return header
+
+
+_started_at = {}  # (path, inode) -> epoch seconds of the first event
+
+
+def _active_started_at(path, inode):
+    """Epoch seconds of the first event in the active log, or None."""
+    started_at = _started_at.get((path, inode))
+    if started_at is not None:
+        return started_at
+    try:
+        with open(path, "rb") as f:
+            event = parse_event_line(f.readline())
+    except FileNotFoundError:
+        return None
+    if event is None or not event["timestamp"]:
+        return None
+    try:
+        started_at = datetime.datetime.fromisoformat(event["timestamp"]).timestamp()
+    except ValueError:
+        return None
+    _started_at[(path, inode)] = started_at
+    return started_at
+
+
+def _needs_rotation(path, now):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if st.st_size == 0:
+        return False
+    if st.st_size >= Config.EVENTS_MAX_BYTES:
+        return True
+    started_at = _active_started_at(path, st.st_ino)
+    return started_at is not None and now - started_at >= Config.EVENTS_MAX_AGE
+
+
+def rotate_if_needed(path, now=None):
+    """
+    Close the active log as `<path>.NNNNNN.open` once it reaches
+    Config.EVENTS_MAX_BYTES or its first event is older than
+    Config.EVENTS_MAX_AGE seconds. Returns True if this call rotated.
+    Writers detect the inode change and reopen `path`.
+    """
+    now = now if now is not None else time.time()
+    if not _needs_rotation(path, now):
+        return False
+    with _segment_lock(path):
+        # Another worker may have rotated while we waited for the lock
+        if not _needs_rotation(path, now):
+            return False
+        segments = list_segments(path)
+        seq = segments[-1].seq + 1 if segments else 1
+        os.rename(path, f"{path}.{seq:06d}.open")
+    return True
+
+
+def compress_segments(path, grace=None, now=None):
+    """
+    Gzip rotated `.open` segments that have not been written to for `grace`
+    seconds (writers in other processes may still hold the old inode), and
+    drop the oldest compressed segments beyond Config.EVENTS_MAX_SEGMENTS.
+
+    A compressed segment starts with a one-line JSON header holding the
+    time range and event count, followed by the original log bytes.
+    """
+    grace = grace if grace is not None else Config.EVENTS_COMPRESS_GRACE
+    now = now if now is not None else time.time()
+    compressed = 0
+    with _segment_lock(path):
+        for segment in list_segments(path):
+            if segment.kind != "open":
+                continue
+            try:
+                if now - os.stat(segment.path).st_mtime < grace:
+                    continue
+            except FileNotFoundError:
+                continue
+
+            header = {"start": None, "end": None, "count": 0}
+            with open(segment.path, "rb") as f:
+                for line in f:
+                    event = parse_event_line(line)
+                    if event is None:
+                        continue
+                    # Batches from several workers may interleave slightly
+                    # out of order, so keep the true min/max
+                    ts = event["timestamp"]
+                    header["count"] += 1
+                    if header["start"] is None or ts < header["start"]:
+                        header["start"] = ts
+                    if header["end"] is None or ts > header["end"]:
+                        header["end"] = ts
+
+            gz_path = segment.path[:-len(".open")] + ".gz"
+            with open(segment.path, "rb") as src, gzip.open(f"{gz_path}.tmp", "wb") as dst:
+                dst.write(json.dumps(header).encode("utf-8") + b"\n")
+                while True:
+                    chunk = src.read(_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+            os.replace(f"{gz_path}.tmp", gz_path)
+            os.remove(segment.path)
+            compressed += 1
+
+        closed = [s for s in list_segments(path) if s.kind == "gz"]
+        for segment in closed[:max(0, len(closed) - Config.EVENTS_MAX_SEGMENTS)]:
+            os.remove(segment.path)
+            _headers.pop(segment.path, None)
+    return compressed
+
+
+class EventStore:
+    """
+    Read side of the segmented JSON-lines events log.
+
+    The active log has a sparse index (one (offset, timestamp) entry every
+    Config.EVENTS_INDEX_INTERVAL events) kept in `<log>.idx` and extended
+    incrementally as the log grows. Closed segments are read lazily, newest
+    first, and compressed ones are skipped without decompressing their body
+    when their header's time range is outside the query. Cursors are
+    "<segment seq>:<byte offset>".
+    """
+
+    def __init__(self, path, interval=None):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.interval = interval or Config.EVENTS_INDEX_INTERVAL
+        self._lock = threading.Lock()
+        self._index = None
+
+    # -- index -------------------------------------------------------------
+
+    def _empty_index(self, inode):
+        return {"inode": inode, "indexed_end": 0, "count": 0, "entries": []}
+
+    def _load_index(self, st):
+        if self._index is None:
+            try:
+                with open(self.index_path, "r") as f:
+                    self._index = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._index = None
+        index = self._index
+        if index is None or index.get("inode") != st.st_ino or index.get("indexed_end", 0) > st.st_size:
+            # New, rotated, replaced or truncated log: start over
+            index = self._empty_index(st.st_ino)
+        return index
+
+    def refresh_index(self):
+        """Extend the active log's sparse index over newly appended lines."""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._index = None
+                return self._empty_index(None)
+            index = self._load_index(st)
+            if index["indexed_end"] == st.st_size and index is self._index:
+                return index
+
+            offset = index["indexed_end"]
+            count = index["count"]
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # partially written record
+                    event = parse_event_line(line)
+                    if event is not None:
+                        if count % self.interval == 0:
+                            index["entries"].append([offset, event["timestamp"]])
+                        count += 1
+                    offset += len(line)
+            index["indexed_end"] = offset
+            index["count"] = count
+            self._index = index
+
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(index, f)
+                os.replace(tmp_path, self.index_path)
+            except OSError:
+                pass  # read-only log dir; the in-memory index still works
+            return index
+
+    def _bounds(self, index, since, until):
+        """Byte range of the active log that can contain events in [since, until]."""
+        entries = index["entries"]
+        start, end = 0, None
+        if since is not None:
+            for offset, ts in entries:
+                if ts >= since:
+                    break
+                start = offset
+        if until is not None:
+            for offset, ts in entries:
+                if ts > until:
+                    end = offset
+                    break
+        return start, end
+
+    # -- segments ----------------------------------------------------------
+
+    def segments(self):
+        """Every segment including the active log, newest first."""
+        closed = list_segments(self.path)
+        active_seq = closed[-1].seq + 1 if closed else 1
+        segments = [Segment(active_seq, "active", self.path, None)]
+        for segment in reversed(closed):
+            header = None
+            if segment.kind == "gz":
+                try:
+                    header = read_segment_header(segment.path)
+                except FileNotFoundError:
+                    continue  # expired meanwhile
+            segments.append(segment._replace(header=header))
+        return segments
+
+    def count(self):
+        total = 0
+        for segment in self.segments():
+            if segment.kind == "active":
+                total += self.refresh_index()["count"]
+            elif segment.kind == "gz":
+                total += segment.header["count"]
+            else:
+                total += sum(1 for _ in self._iter_segment(segment))
+        return total
+
+    def _iter_segment(self, segment):
+        """Yield the events of one segment, oldest first, streaming."""
+        opener = gzip.open if segment.kind == "gz" else open
+        try:
+            with opener(segment.path, "rb") as f:
+                if segment.kind == "gz":
+                    f.readline()  # header
+                for line in f:
+                    event = parse_event_line(line)
+                    if event is not None:
+                        yield event
+        except FileNotFoundError:
+            return  # compressed or expired meanwhile
+
+    def _lines_backwards(self, segment, start, end):
+        """Yield (offset, line) of one segment newest first."""
+        if segment.kind == "gz":
+            # Segments are bounded by EVENTS_MAX_BYTES, so decompressing one
+            # at a time keeps memory bounded; offsets are relative to the
+            # original log bytes, as for uncompressed segments.
+            with gzip.open(segment.path, "rb") as f:
+                f.readline()
+                data = f.read()
+            end = len(data) if end is None else min(end, len(data))
+            yield from _read_lines_backwards(io.BytesIO(data), start, end)
+            return
+        with open(segment.path, "rb") as f:
+            if end is None:
+                end = os.fstat(f.fileno()).st_size
+            yield from _read_lines_backwards(f, start, end)
+
+    # -- queries -----------------------------------------------------------
+
+    def page(self, limit=None, cursor=None, code=None, since=None, until=None):
+        """
+        Return an EventPage with up to `limit` events, newest first.
+
+        `cursor` is the opaque next_cursor of the previous page; `code`
+        filters on the event code; `since`/`until` bound the timestamp
+        (ISO strings, datetimes or epoch seconds, inclusive).
+        """
+        scan = self.scan(limit, cursor, code, since, until)
+        events = []
+        while True:
+            try:
+                events.append(next(scan))
+            except StopIteration as stop:
+                return EventPage(events, stop.value)
+
+    def scan(self, limit=None, cursor=None, code=None, since=None, until=None):
+        """
+        Generator version of page(): yields the events one by one, reading
+        the log lazily, and returns the next cursor (see StreamedPage).
+        """
+        limit = limit or Config.EVENTS_PAGE_SIZE
+        since, until = _as_timestamp(since), _as_timestamp(until)
+        cursor_seq, cursor_offset = None, None
+        if cursor:
+            try:
+                seq, _, offset = cursor.partition(":")
+                cursor_seq, cursor_offset = int(seq), int(offset)
+            except ValueError:
+                pass  # bogus cursor: start from the newest event
+
+        count = 0
+        for segment in self.segments():
+            if cursor_seq is not None and segment.seq > cursor_seq:
+                continue
+            header = segment.header
+            if header is not None and header["count"]:
+                if until is not None and header["start"] > until:
+                    continue
+                if since is not None and header["end"] < since:
+                    break  # every older segment is older still
+
+            start, end = 0, None
+            if segment.kind == "active":
+                index = self.refresh_index()
+                start, end = self._bounds(index, since, until)
+                end = index["indexed_end"] if end is None else end
+            if segment.seq == cursor_seq:
+                end = cursor_offset if end is None else min(end, cursor_offset)
+            if end is not None and end <= start:
+                continue
+
+            try:
+                for offset, line in self._lines_backwards(segment, start, end):
+                    event = parse_event_line(line)
+                    if event is None:
+                        continue
+                    if until is not None and event["timestamp"] > until:
+                        continue
+                    if since is not None and event["timestamp"] < since:
+                        return None
+                    if code is not None and event["code"] != code:
+                        continue
+                    if count == limit:
+                        return f"{segment.seq}:{offset + len(line) + 1}"
+                    count += 1
+                    yield event
+            except FileNotFoundError:
+                continue  # compressed meanwhile; rare enough to skip
+        return None
+
+    def iter_events(self):
+        """Yield every event, oldest first, one segment at a time."""
+        for segment in reversed(self.segments()):
+            yield from self._iter_segment(segment)
+
+
+_stores = {}
+
+
+def get_event_store():
+    path = Config.EVENTS_LOG_FILE
+    store = _stores.get(path)
+    if store is None:
+        store = _stores[path] = EventStore(path)
+    return store
+
+
+def import_event_log(source_path, store=None):
+    """
+    Merge an existing events log (JSON or legacy Python-repr lines) into the
+    event store. Events already stored in any segment (by event_id) are
+    skipped; new ones are merged into the active log sorted by timestamp and
+    the index is rebuilt. Returns the number of newly imported events. The
+    active log is replaced, so run it while the app is stopped.
+    """
+    store = store or get_event_store()
+    known = {event["event_id"] for event in store.iter_events()}
+    imported = {}
+    with open(source_path, "rb") as f:
+        for line in f:
+            event = parse_event_line(line)
+            if event is not None and event["event_id"] not in known:
+                imported.setdefault(event["event_id"], event)
+
+    active = list(store._iter_segment(Segment(None, "active", store.path, None)))
+    os.makedirs(os.path.dirname(store.path), exist_ok=True)
+    tmp_path = f"{store.path}.import.tmp"
+    with open(tmp_path, "w") as f:
+        for event in sorted(active + list(imported.values()), key=lambda e: e["timestamp"]):
+            f.write(json.dumps(event) + "\n")
+    os.replace(tmp_path, store.path)
+    store.refresh_index()
+    return len(imported)
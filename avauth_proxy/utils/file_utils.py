@@ -1,16 +1,18 @@
-import os
-import tomllib
-import tomli_w as tomlw
-from avauth_proxy.config import Config
+from avauth_proxy.utils.policy_utils import invalidate_policy_index
+from avauth_proxy.utils.cache_utils import decision_cache
+from avauth_proxy.utils.store_utils import get_proxy_store
 
 def load_proxies():
-    if os.path.exists(Config.PROXIES_CONFIG_FILE):
-        with open(Config.PROXIES_CONFIG_FILE, "rb") as f:
-            return tomllib.load(f).get("proxies", [])
-    else:
-        save_proxies([])
-        return []
+    return get_proxy_store().list()
 
 def save_proxies(proxies):
-    with open(Config.PROXIES_CONFIG_FILE, "wb") as f:
-        tomlw.dump({"proxies": proxies}, f)
+    """Make the store hold exactly `proxies`; only differing rows are written."""
+    version = get_proxy_store().replace_all(proxies)
+    invalidate_policy_index()
+    decision_cache.clear()
+    return version
+
+def proxies_changed():
+    """Call after per-row changes to the store so this worker sees them at once."""
+    invalidate_policy_index()
+    decision_cache.clear()
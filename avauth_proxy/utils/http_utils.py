@@ -0,0 +1,212 @@
+import time
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from avauth_proxy.config import Config
+from avauth_proxy.utils.metrics_utils import (
+    provider_requests, provider_in_flight, provider_circuit_state,
+    provider_pool_connections, provider_pool_idle, provider_max_concurrency,
+)
+
+logger = logging.getLogger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class ProviderUnavailableError(requests.ConnectionError):
+    """Raised without touching the network when a provider call is refused."""
+
+
+class CircuitOpenError(ProviderUnavailableError):
+    pass
+
+
+class ProviderBusyError(ProviderUnavailableError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `failure_threshold` failures in a row the circuit opens and calls
+    fail fast for `reset_timeout` seconds. Then a single trial call is let
+    through (half-open): success closes the circuit, failure reopens it.
+    """
+
+    def __init__(self, name, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+        provider_circuit_state.labels(provider=name).set(0)
+
+    def _set_state(self, state):
+        if state != self.state:
+            logger.warning(f"Circuit for provider {self.name} is now {state}")
+        self.state = state
+        provider_circuit_state.labels(provider=self.name).set(_STATE_VALUES[state])
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now."""
+        with self._lock:
+            if self.state == OPEN:
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError(f"Circuit open for provider {self.name}")
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._trial_running:
+                    raise CircuitOpenError(f"Circuit half-open for provider {self.name}")
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+                self._set_state(OPEN)
+
+
+class ProviderAdapter(HTTPAdapter):
+    """
+    Keep-alive connection pool shared by every session talking to one
+    provider. Each send() gets default connect/read timeouts, waits for one
+    of `max_concurrency` slots and goes through the provider's breaker.
+    Connection errors, timeouts and 5xx responses count as failures.
+    """
+
+    def __init__(self, name, connect_timeout, read_timeout, max_concurrency, pool_size, breaker=None):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.breaker = breaker or CircuitBreaker(
+            name, Config.PROVIDER_BREAKER_FAILURES, Config.PROVIDER_BREAKER_RESET
+        )
+        super().__init__(pool_connections=1, pool_maxsize=pool_size)
+        provider_max_concurrency.labels(provider=name).set(max_concurrency)
+
+    def send(self, request, timeout=None, **kwargs):
+        if not self._slots.acquire(timeout=Config.PROVIDER_QUEUE_TIMEOUT):
+            provider_requests.labels(provider=self.name, outcome="busy").inc()
+            raise ProviderBusyError(f"Too many concurrent requests to provider {self.name}")
+        in_flight = provider_in_flight.labels(provider=self.name)
+        in_flight.inc()
+        try:
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                provider_requests.labels(provider=self.name, outcome="rejected").inc()
+                raise
+            try:
+                response = super().send(request, timeout=timeout or self.timeout, **kwargs)
+            except Exception:
+                # Any exception, not only RequestException, ends a half-open trial
+                self.breaker.record_failure()
+                provider_requests.labels(provider=self.name, outcome="error").inc()
+                raise
+        finally:
+            in_flight.dec()
+            self._slots.release()
+            self._export_pool_stats()
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            provider_requests.labels(provider=self.name, outcome="error").inc()
+        else:
+            self.breaker.record_success()
+            provider_requests.labels(provider=self.name, outcome="ok").inc()
+        return response
+
+    def close(self):
+        # Sessions are short-lived and close their adapters on exit; the pool
+        # outlives them and is only torn down by shutdown().
+        pass
+
+    def shutdown(self):
+        super().close()
+
+    def _export_pool_stats(self):
+        opened, idle = self.pool_stats()
+        provider_pool_connections.labels(provider=self.name).set(opened)
+        provider_pool_idle.labels(provider=self.name).set(idle)
+
+    def pool_stats(self):
+        """Return (open connections, idle connections) across the pool."""
+        opened = idle = 0
+        for key in list(self.poolmanager.pools.keys()):
+            pool = self.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            if pool.pool is not None:
+                # The queue is padded with None placeholders up to maxsize
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        return opened, idle
+
+
+_adapters = {}  # provider name -> ProviderAdapter
+_lock = threading.Lock()
+
+
+def configure_provider_http(provider):
+    """
+    Create or update the pooled adapter of a provider from its config.toml
+    entry (`connect_timeout`, `read_timeout`, `max_concurrency`).
+    """
+    name = provider["name"]
+    settings = (
+        provider.get("connect_timeout", Config.PROVIDER_CONNECT_TIMEOUT),
+        provider.get("read_timeout", Config.PROVIDER_READ_TIMEOUT),
+        provider.get("max_concurrency", Config.PROVIDER_MAX_CONCURRENCY),
+    )
+    with _lock:
+        adapter = _adapters.get(name)
+        if adapter is not None and (*adapter.timeout, adapter.max_concurrency) == settings:
+            return adapter
+        breaker = adapter.breaker if adapter is not None else None
+        _adapters[name] = ProviderAdapter(
+            name, *settings, pool_size=max(settings[2], Config.PROVIDER_POOL_SIZE), breaker=breaker
+        )
+    if adapter is not None:
+        adapter.shutdown()
+    return _adapters[name]
+
+
+def get_provider_adapter(name):
+    adapter = _adapters.get(name)
+    if adapter is None:
+        adapter = configure_provider_http({"name": name})
+    return adapter
+
+
+def remove_provider_http(name):
+    with _lock:
+        adapter = _adapters.pop(name, None)
+    if adapter is not None:
+        adapter.shutdown()
+
+
+def provider_adapters():
+    return dict(_adapters)
+
+
+def mount_provider_adapter(session, name):
+    adapter = get_provider_adapter(name)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
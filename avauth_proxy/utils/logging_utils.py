@@ -1,19 +1,170 @@
 import os
+import sys
 import uuid
+import time
+import queue
+import atexit
 import datetime
 import logging
+import threading
 import json
 
 from pythonjsonlogger.json import JsonFormatter
 from avauth_proxy.config import Config
+from avauth_proxy.utils.event_utils import rotate_if_needed, compress_segments
+from avauth_proxy.utils.metrics_utils import events_dropped, event_count, event_write_duration
 from copy import deepcopy
 
+
+class EventWriter:
+    """
+    Background writer for the events log.
+
+    Callers only enqueue an already serialized line; a daemon thread drains
+    the bounded queue and appends records in batches of up to
+    Config.EVENTS_BATCH_SIZE, at most Config.EVENTS_FLUSH_INTERVAL seconds
+    after the first record of a batch arrived. When the queue is full the
+    record is dropped and counted instead of blocking the request.
+
+    The writer also rotates the active log into segments and, every
+    Config.EVENTS_MAINTENANCE_INTERVAL seconds, compresses idle rotated ones.
+    """
+
+    def __init__(self, max_queue=None, batch_size=None, flush_interval=None):
+        self._queue = queue.Queue(maxsize=max_queue or Config.EVENTS_QUEUE_SIZE)
+        self.batch_size = batch_size or Config.EVENTS_BATCH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else Config.EVENTS_FLUSH_INTERVAL
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._file = None
+        self._file_path = None
+        self._maintained_at = 0.0
+
+    def submit(self, line):
+        """Queue one record line; returns False if it had to be dropped."""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self._count_dropped(1)
+            return False
+        return True
+
+    def flush(self, timeout=None):
+        """Block until everything queued before this call is on disk."""
+        self._ensure_thread()
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _count_dropped(self, count):
+        with self._lock:
+            self.dropped += count
+        events_dropped.inc(count)
+
+    def _ensure_thread(self):
+        # Threads do not survive fork(); each worker starts its own writer
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._file = None
+            self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and not isinstance(batch[-1], threading.Event):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _open(self):
+        path = Config.EVENTS_LOG_FILE
+        if self._file is not None and self._file_path == path:
+            try:
+                if os.fstat(self._file.fileno()).st_ino == os.stat(path).st_ino:
+                    return self._file
+            except FileNotFoundError:
+                pass
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._file_path = path
+        return self._file
+
+    def _write(self, batch):
+        lines = [item for item in batch if isinstance(item, str)]
+        if lines:
+            started = time.perf_counter()
+            try:
+                rotate_if_needed(Config.EVENTS_LOG_FILE)
+                f = self._open()
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+                event_write_duration.observe(time.perf_counter() - started)
+            except OSError as e:
+                self._file = None
+                self._count_dropped(len(lines))
+                sys.stderr.write(f"Failed to write {len(lines)} event(s) to {Config.EVENTS_LOG_FILE}: {e}\n")
+        self._maintain()
+        for item in batch:
+            if isinstance(item, threading.Event):
+                item.set()
+
+    def _maintain(self):
+        now = time.monotonic()
+        if now - self._maintained_at < Config.EVENTS_MAINTENANCE_INTERVAL:
+            return
+        self._maintained_at = now
+        try:
+            compress_segments(Config.EVENTS_LOG_FILE)
+        except OSError as e:
+            sys.stderr.write(f"Failed to compress event log segments: {e}\n")
+
+
+event_writer = EventWriter()
+atexit.register(event_writer.flush, 2.0)
+
+
+class EventWriterHandler(logging.Handler):
+    """logging.Handler that hands formatted records to the event writer."""
+
+    def __init__(self, writer):
+        super().__init__()
+        self.writer = writer
+
+    def emit(self, record):
+        try:
+            self.writer.submit(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
 def configure_logging():
-    os.makedirs(os.path.dirname(Config.EVENTS_LOG_FILE), exist_ok=True)
+    """Send root logger records to the event writer; repeated calls are no-ops."""
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
+    # create_app() may run several times in one process
+    if any(isinstance(handler, EventWriterHandler) for handler in logger.handlers):
+        return
 
-    log_handler = logging.FileHandler(Config.EVENTS_LOG_FILE)
+    log_handler = EventWriterHandler(event_writer)
     formatter = JsonFormatter()
     log_handler.setFormatter(formatter)
     logger.addHandler(log_handler)
@@ -21,7 +172,9 @@ def configure_logging():
 def log_event(description, code):
     event_id = str(uuid.uuid4())
     timestamp = datetime.datetime.now().isoformat()
-    logging.info({"event_id": event_id, "timestamp": timestamp, "description": description, "code": code})
+    event = {"event_id": event_id, "timestamp": timestamp, "description": description, "code": code}
+    event_writer.submit(json.dumps(event))
+    event_count.labels(code=code).inc()
 
 def sanitize_config(config):
     """
@@ -0,0 +1,127 @@
+"""
+Every Prometheus metric of the app, defined once.
+
+With PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py, which also cleans
+up after exited workers) prometheus_client keeps values in mmap-backed
+files per worker; collect_metrics() aggregates them so any worker answers
+/metrics/ with the totals of all of them. Gauges declare how to combine
+per-worker values. Without the variable, metrics live in the default
+in-process registry.
+"""
+import os
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST,
+)
+from prometheus_client import multiprocess
+
+
+def multiprocess_enabled():
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+# Proxies and authentication
+num_proxies = Gauge(
+    "num_proxies", "Number of active proxies", multiprocess_mode="mostrecent"
+)
+auth_failures = Counter("auth_failures", "Failed authentication attempts")
+event_count = Counter("event_count", "Events written to the event log", ["code"])
+login_claims_source = Counter(
+    "login_claims_source", "Where login claims came from", ["provider", "source"]
+)
+
+# /auth/validate: "fast" is the bare WSGI handler, "flask" the blueprint view
+VALIDATE_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+)
+validate_duration = Histogram(
+    "auth_validate_duration_seconds", "Time to answer an auth_request subrequest",
+    ["path", "status"], buckets=VALIDATE_BUCKETS,
+)
+
+# /auth/validate decision cache (per worker; sizes are summed)
+decision_cache_hits = Counter("decision_cache_hits", "Decision cache hits")
+decision_cache_misses = Counter("decision_cache_misses", "Decision cache misses")
+decision_cache_evictions = Counter("decision_cache_evictions", "Decision cache LRU evictions")
+decision_cache_size = Gauge(
+    "decision_cache_size", "Entries in the decision cache", multiprocess_mode="livesum"
+)
+
+# Nginx config generation
+nginx_generate_duration = Histogram(
+    "nginx_generate_duration_seconds", "Duration of generate_nginx_configs()"
+)
+nginx_render_duration = Histogram(
+    "nginx_render_duration_seconds", "Time to render the config of one proxy",
+    buckets=VALIDATE_BUCKETS,
+)
+nginx_reload_command_duration = Histogram(
+    "nginx_reload_command_duration_seconds", "Duration of `nginx -s reload`"
+)
+nginx_reload_failures = Counter("nginx_reload_failures", "Failed `nginx -s reload` runs")
+nginx_reload_requests = Counter(
+    "nginx_reload_requests", "Config generations requested by proxy mutations"
+)
+nginx_reload_runs = Counter(
+    "nginx_reload_runs", "Coalesced render+reload runs", ["result"]
+)
+nginx_reload_duration = Histogram(
+    "nginx_reload_duration_seconds", "Duration of a coalesced render+reload run"
+)
+
+# Configuration files ("config" is config.toml, "proxies" proxies_config.toml)
+config_parse_duration = Histogram(
+    "config_parse_duration_seconds", "Time to read and parse a TOML config file", ["file"],
+    buckets=VALIDATE_BUCKETS + (0.25, 0.5, 1.0, 2.5),
+)
+config_reloads = Counter(
+    "config_reloads", "Changes applied by the file watcher", ["file", "result"]
+)
+
+# Event log
+event_write_duration = Histogram(
+    "event_log_write_duration_seconds", "Time to append one batch to the event log",
+    buckets=VALIDATE_BUCKETS,
+)
+events_dropped = Counter(
+    "events_dropped", "Event log records dropped because the write queue was full or the write failed"
+)
+
+# Identity provider HTTP client; operation is "token" or "userinfo"
+provider_call_duration = Histogram(
+    "oauth_provider_request_duration_seconds", "Latency of OAuth calls to identity providers",
+    ["provider", "operation"],
+)
+provider_requests = Counter(
+    "provider_http_requests", "Outbound identity provider requests", ["provider", "outcome"]
+)
+provider_in_flight = Gauge(
+    "provider_http_in_flight", "Identity provider requests in progress", ["provider"],
+    multiprocess_mode="livesum",
+)
+provider_circuit_state = Gauge(
+    "provider_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ["provider"],
+    multiprocess_mode="livemax",
+)
+provider_pool_connections = Gauge(
+    "provider_http_pool_connections", "Connections opened by the provider pool", ["provider"],
+    multiprocess_mode="livesum",
+)
+provider_pool_idle = Gauge(
+    "provider_http_pool_idle", "Idle keep-alive connections in the provider pool", ["provider"],
+    multiprocess_mode="livesum",
+)
+provider_max_concurrency = Gauge(
+    "provider_http_max_concurrency", "Concurrent request limit per provider and worker", ["provider"],
+    multiprocess_mode="livemax",
+)
+
+
+def collect_metrics():
+    """Return (body, content type) for a scrape."""
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
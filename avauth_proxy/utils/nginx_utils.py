@@ -1,55 +1,264 @@
 import os
+import json
+import time
+import fcntl
+import hashlib
+import tempfile
 import subprocess
-from jinja2 import Environment, FileSystemLoader
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from collections import namedtuple
 from avauth_proxy.config import Config
+from avauth_proxy.utils.template_utils import get_template_env
+from avauth_proxy.utils.acl_utils import acl_enabled, is_acl_eligible, acl_variable, render_acl_maps
+from avauth_proxy.utils.metrics_utils import (
+    nginx_generate_duration, nginx_render_duration, nginx_reload_command_duration, nginx_reload_failures,
+)
 
-def generate_nginx_configs(proxies):
+# Per-directory record of what we last wrote: {service_name: {"file", "hash"}}
+MANIFEST_FILENAME = ".avauth_manifest.json"
+# Held for a whole generation, so workers of different processes never
+# interleave their writes, sweeps and manifest updates
+LOCK_FILENAME = ".avauth_generate.lock"
+
+GenerationResult = namedtuple("GenerationResult", ["written", "removed", "unchanged"])
+
+# Read once: os.umask() can only be queried by setting it, which is not
+# thread-safe. Generated files get the mode open() would have given them.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _load_manifest(nginx_config_dir):
+    path = os.path.join(nginx_config_dir, MANIFEST_FILENAME)
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+@contextmanager
+def _generation_lock(nginx_config_dir):
+    """Inter-process lock serializing generations into one directory."""
+    with open(os.path.join(nginx_config_dir, LOCK_FILENAME), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_atomic(path, content):
+    # A unique temp name, so concurrent writers never share a half-written file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            # mkstemp creates 0600 files; Nginx may read them as another user
+            os.fchmod(f.fileno(), 0o666 & ~_UMASK)
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _write_if_changed(path, content):
+    try:
+        with open(path, "r") as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    _write_atomic(path, content)
+    return True
+
+
+# Config values the templates depend on, handed to render pool workers
+_RENDER_SETTINGS = ("NGINX_TEMPLATES_DIR", "NGINX_TEMPLATE_CACHE_DIR", "NGINX_ACL_SECRET", "AVAUTH_UPSTREAM")
+
+_pool_context = None
+
+
+def _render_pool_context():
+    # Workers fork from a server that already imported this module, so they
+    # neither re-import it nor inherit the generating process's threads.
+    global _pool_context
+    if _pool_context is None:
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            _pool_context = multiprocessing.get_context("forkserver")
+            _pool_context.set_forkserver_preload([__name__])
+        else:
+            _pool_context = multiprocessing.get_context("spawn")
+    return _pool_context
+
+
+def render_workers(workers=None):
+    """Number of render processes to use; 1 means render in-process."""
+    workers = workers if workers is not None else Config.NGINX_RENDER_WORKERS
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+
+def _render_chunk(proxies, default_template_name, nginx_config_dir, previous, settings=None):
+    """
+    Render one batch of proxies and write the configs that changed.
+
+    `previous` holds the old manifest entries of services whose file is on
+    disk. Returns [(service_name, manifest entry, written)]. Runs in the
+    generating process or, with `settings` applied first, in a pool worker.
+    """
+    if settings is not None:
+        for name, value in settings.items():
+            setattr(Config, name, value)
+
+    env = get_template_env()
+    # get_template() stats the source for auto_reload; do it once per template
+    templates = {}
+    results = []
+    for proxy in proxies:
+        template_name = proxy.get("template", default_template_name)
+        template = templates.get(template_name)
+        if template is None:
+            template = templates[template_name] = env.get_template(template_name)
+
+        render_started = time.perf_counter()
+        config_content = template.render(
+            service_name=proxy.get("service_name", "default"),
+            url=proxy.get("url", "localhost"),
+            port=proxy.get("port", 80),
+            custom_directives=proxy.get("custom_directives", ""),
+            auth_required=proxy.get("auth_required", False),
+            acl_variable=acl_variable(proxy["service_name"]) if is_acl_eligible(proxy) else None,
+            avauth_upstream=Config.AVAUTH_UPSTREAM,
+        )
+        nginx_render_duration.observe(time.perf_counter() - render_started)
+
+        service_name = proxy["service_name"]
+        filename = f"{service_name}.conf"
+        content_hash = hashlib.sha256(config_content.encode("utf-8")).hexdigest()
+        entry = {"file": filename, "hash": content_hash}
+        if previous.get(service_name) == entry:
+            results.append((service_name, entry, False))
+            continue
+
+        _write_atomic(os.path.join(nginx_config_dir, filename), config_content)
+        results.append((service_name, entry, True))
+    return results
+
+
+def _render_all(proxies, default_template_name, nginx_config_dir, previous, workers):
+    chunk_size = Config.NGINX_RENDER_CHUNK_SIZE
+    if workers <= 1 or len(proxies) < max(Config.NGINX_RENDER_PARALLEL_MIN, 2 * chunk_size):
+        return _render_chunk(proxies, default_template_name, nginx_config_dir, previous)
+
+    settings = {name: getattr(Config, name) for name in _RENDER_SETTINGS}
+    chunks = [proxies[i:i + chunk_size] for i in range(0, len(proxies), chunk_size)]
+    results = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=_render_pool_context()) as pool:
+        futures = [
+            pool.submit(
+                _render_chunk, chunk, default_template_name, nginx_config_dir,
+                {p["service_name"]: previous[p["service_name"]] for p in chunk if p["service_name"] in previous},
+                settings,
+            )
+            for chunk in chunks
+        ]
+        for future in futures:
+            results.extend(future.result())
+    return results
+
+
+@nginx_generate_duration.time()
+def generate_nginx_configs(proxies, workers=None, reload=True):
     """
     Generates Nginx configuration files from templates, selecting the appropriate template
     based on whether oauth2-proxy is used or not.
+
+    Generation is incremental: the sha256 of every rendered config is kept in a
+    manifest inside NGINX_CONFIG_DIR, only files whose rendered content changed
+    are rewritten, only configs of removed services are deleted, and Nginx is
+    reloaded only if something on disk changed (and `reload` is true).
+
+    From NGINX_RENDER_PARALLEL_MIN proxies on, chunks of
+    NGINX_RENDER_CHUNK_SIZE proxies are rendered and written by a pool of
+    `workers` processes (default NGINX_RENDER_WORKERS).
+
+    When NGINX_ACL_SECRET is set, the allowlist maps for plain email/domain
+    policies are also written to NGINX_ACL_MAP_FILE (see acl_utils).
+
+    The whole generation holds an flock on NGINX_CONFIG_DIR/LOCK_FILENAME,
+    so generations started by several processes run one after another.
     """
-    nginx_templates_dir = Config.NGINX_TEMPLATES_DIR
     nginx_config_dir = Config.NGINX_CONFIG_DIR
-    temp_dir = f"{nginx_config_dir}.temp"
 
     # Ensure directories exist
-    os.makedirs(temp_dir, exist_ok=True)
+    os.makedirs(nginx_config_dir, exist_ok=True)
 
-    env = Environment(loader=FileSystemLoader(nginx_templates_dir))
     # Decide default template based on auth mode
     default_template_name = "default.conf.j2" if Config.USE_OAUTH2_PROXY else "oauth2_disabled.conf.j2"
 
     try:
-        for proxy in proxies:
-            template_name = proxy.get("template", default_template_name)
-            template = env.get_template(template_name)
-
-            config_content = template.render(
-                service_name=proxy.get("service_name", "default"),
-                url=proxy.get("url", "localhost"),
-                port=proxy.get("port", 80),
-                custom_directives=proxy.get("custom_directives", "")
-            )
+        with _generation_lock(nginx_config_dir):
+            return _generate(proxies, default_template_name, nginx_config_dir, workers, reload)
+    except Exception as e:
+        raise RuntimeError(f"Failed to generate Nginx configs: {e}")
 
-            config_path = os.path.join(temp_dir, f"{proxy['service_name']}.conf")
-            with open(config_path, "w") as f:
-                f.write(config_content)
 
-        # Clean old
-        for filename in os.listdir(nginx_config_dir):
-            os.remove(os.path.join(nginx_config_dir, filename))
-        for filename in os.listdir(temp_dir):
-            os.rename(os.path.join(temp_dir, filename), os.path.join(nginx_config_dir, filename))
+def _generate(proxies, default_template_name, nginx_config_dir, workers, reload):
+    # Caller holds the generation lock
+    old_manifest = _load_manifest(nginx_config_dir)
+    # One listing instead of a stat() per service
+    on_disk = set(os.listdir(nginx_config_dir))
+    previous = {
+        service_name: entry for service_name, entry in (old_manifest or {}).items()
+        if entry["file"] in on_disk
+    }
 
+    manifest = {}
+    written, unchanged = [], []
+    for service_name, entry, was_written in _render_all(
+        proxies, default_template_name, nginx_config_dir, previous, render_workers(workers)
+    ):
+        manifest[service_name] = entry
+        (written if was_written else unchanged).append(service_name)
+
+    removed = []
+    if old_manifest is None:
+        # No manifest yet: the directory is ours, sweep configs we did not render
+        keep = {entry["file"] for entry in manifest.values()}
+        for filename in sorted(on_disk):
+            if filename.endswith(".conf") and filename not in keep:
+                os.remove(os.path.join(nginx_config_dir, filename))
+                removed.append(filename[:-len(".conf")])
+    else:
+        for service_name, entry in old_manifest.items():
+            if service_name in manifest:
+                continue
+            if entry["file"] in on_disk:
+                os.remove(os.path.join(nginx_config_dir, entry["file"]))
+            removed.append(service_name)
+
+    acl_changed = acl_enabled() and _write_if_changed(Config.NGINX_ACL_MAP_FILE, render_acl_maps(proxies))
+
+    if reload and (written or removed or acl_changed):
         reload_nginx()
-    except Exception as e:
-        raise RuntimeError(f"Failed to generate Nginx configs: {e}")
-    finally:
-        for filename in os.listdir(temp_dir):
-            os.remove(os.path.join(temp_dir, filename))
-        os.rmdir(temp_dir)
+
+    # Only record the new state once Nginx accepted it, so a failed reload
+    # is retried on the next generation.
+    if manifest != old_manifest:
+        _write_atomic(
+            os.path.join(nginx_config_dir, MANIFEST_FILENAME),
+            json.dumps(manifest, indent=0, sort_keys=True),
+        )
+    return GenerationResult(written, removed, unchanged)
 
 def reload_nginx():
-    result = subprocess.run(["nginx", "-s", "reload"], capture_output=True)
+    with nginx_reload_command_duration.time():
+        result = subprocess.run(["nginx", "-s", "reload"], capture_output=True)
     if result.returncode != 0:
+        nginx_reload_failures.inc()
         raise RuntimeError(f"Nginx reload failed: {result.stderr.decode('utf-8')}")
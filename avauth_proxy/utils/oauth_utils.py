@@ -1,37 +1,145 @@
-from avauth_proxy.utils.config_utils import get_oauth_providers
+import time
+import threading
+from avauth_proxy.config import Config
+from avauth_proxy.utils.config_utils import file_signature, get_config_snapshot, get_oauth_providers
+from avauth_proxy.utils.oidc_utils import oidc_cache, provider_metadata_url
+from avauth_proxy.utils.http_utils import configure_provider_http, remove_provider_http
+from avauth_proxy.utils.watch_utils import watching
+
+
+def _register_provider(oauth, provider):
+    name = provider["name"]
+    client_kwargs = provider.get("client_kwargs", {})
+
+    # Authlib caches the client built by register(); drop it so a changed
+    # config actually produces a new client.
+    oauth._clients.pop(name, None)
+    configure_provider_http(provider)
+
+    # OpenID Connect providers (Google, or any with server_metadata_url /
+    # issuer) take their endpoints from the cached discovery document
+    metadata_url = provider_metadata_url(provider)
+    if metadata_url:
+        # ID tokens (and the nonce that binds them) need the openid scope
+        client_kwargs = dict(client_kwargs)
+        client_kwargs.setdefault("scope", "openid email profile")
+        endpoints = {
+            key: provider[key]
+            for key in ("access_token_url", "authorize_url", "api_base_url")
+            if provider.get(key)
+        }
+        oauth.register(
+            name=name,
+            server_metadata_url=metadata_url,
+            client_id=provider["client_id"],
+            client_secret=provider["client_secret"],
+            client_kwargs=client_kwargs,
+            **endpoints
+        )
+        if Config.OIDC_PREFETCH:
+            oidc_cache.prefetch(metadata_url)
+    else:
+        # Traditional OAuth2 registration for other providers
+        metadata = {}
+        if provider.get("userinfo_endpoint"):
+            # Authlib's userinfo() reads it from the client metadata
+            metadata["userinfo_endpoint"] = provider["userinfo_endpoint"]
+        oauth.register(
+            name=name,
+            client_id=provider["client_id"],
+            client_secret=provider["client_secret"],
+            access_token_url=provider.get("access_token_url"),
+            authorize_url=provider.get("authorize_url"),
+            api_base_url=provider.get("api_base_url"),
+            client_kwargs=client_kwargs,
+            **metadata
+        )
+
+
+def _unregister_provider(oauth, name):
+    oauth._registry.pop(name, None)
+    oauth._clients.pop(name, None)
+    remove_provider_http(name)
+
+
+class ProviderRegistry:
+    """
+    OAuth providers from config.toml, registered once with Authlib.
+
+    config.toml is stat()ed at most every Config.CONFIG_CHECK_INTERVAL
+    seconds (WATCH_FALLBACK_INTERVAL while the file watcher pushes changes
+    through apply_snapshot()); when it changed, only providers whose
+    settings differ are re-registered (removed ones are unregistered).
+    """
+
+    def __init__(self, oauth):
+        self.oauth = oauth
+        self._providers = {}
+        self._signature = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _apply(self, providers, signature):
+        # Caller holds self._lock
+        providers = {provider["name"]: provider for provider in providers}
+        changed = set()
+        for name, provider in providers.items():
+            if self._providers.get(name) != provider:
+                _register_provider(self.oauth, provider)
+                changed.add(name)
+        for name in set(self._providers) - set(providers):
+            _unregister_provider(self.oauth, name)
+            changed.add(name)
+
+        self._providers = providers
+        self._signature = signature
+        return changed
+
+    def refresh(self, force=False):
+        """Re-read config.toml if it changed; returns the names re-registered."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            signature = file_signature(Config.CONFIG_TOML_FILE)
+            if not force and signature == self._signature:
+                return set()
+            snapshot = get_config_snapshot()
+            if snapshot is not None and snapshot.signature == signature:
+                # Already parsed by config_utils
+                return self._apply(snapshot.providers, signature)
+            return self._apply(get_oauth_providers(), signature)
+
+    def apply_snapshot(self, snapshot):
+        """Adopt the providers of a ConfigSnapshot; returns the names re-registered."""
+        with self._lock:
+            if snapshot.path != Config.CONFIG_TOML_FILE or snapshot.signature == self._signature:
+                return set()
+            self._checked_at = time.monotonic()
+            return self._apply(snapshot.providers, snapshot.signature)
+
+    def get_providers(self):
+        """Return {name: provider config} without file I/O between checks."""
+        checked_at = self._checked_at
+        interval = Config.WATCH_FALLBACK_INTERVAL if watching() else Config.CONFIG_CHECK_INTERVAL
+        if checked_at is None or time.monotonic() - checked_at >= interval:
+            self.refresh()
+        return self._providers
+
+
+_registries = {}  # id(oauth) -> ProviderRegistry
+
+
+def get_provider_registry(oauth):
+    registry = _registries.get(id(oauth))
+    if registry is None or registry.oauth is not oauth:
+        registry = _registries[id(oauth)] = ProviderRegistry(oauth)
+    return registry
+
 
 def load_oauth_providers(oauth):
     """
     Register OAuth providers dynamically, with special handling for OpenID Connect.
+
+    Returns {name: provider config}. Registration happens once and is only
+    repeated for providers whose config.toml entry changed.
     """
-    providers_config = get_oauth_providers()
-    oauth_providers = {}
-
-    for provider in providers_config:
-        name = provider["name"]
-        client_kwargs = provider.get("client_kwargs", {})
-
-        # Special handling for Google and other OpenID Connect providers
-        if name == "google":
-            oauth.register(
-                name=name,
-                server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
-                client_id=provider["client_id"],
-                client_secret=provider["client_secret"],
-                client_kwargs=client_kwargs
-            )
-        else:
-            # Traditional OAuth2 registration for other providers
-            oauth.register(
-                name=name,
-                client_id=provider["client_id"],
-                client_secret=provider["client_secret"],
-                access_token_url=provider.get("access_token_url"),
-                authorize_url=provider.get("authorize_url"),
-                api_base_url=provider.get("api_base_url"),
-                client_kwargs=client_kwargs
-            )
-
-        oauth_providers[name] = provider
-
-    return oauth_providers
+    return get_provider_registry(oauth).get_providers()
@@ -0,0 +1,297 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from email.utils import parsedate_to_datetime
+import requests
+from requests.structures import CaseInsensitiveDict
+from avauth_proxy.config import Config
+from avauth_proxy.utils.http_utils import mount_provider_adapter
+from avauth_proxy.utils.metrics_utils import login_claims_source, provider_call_duration
+
+logger = logging.getLogger(__name__)
+
+# Discovery documents of providers that are OIDC without saying so in config.toml
+WELL_KNOWN_METADATA_URLS = {
+    "google": "https://accounts.google.com/.well-known/openid-configuration",
+}
+
+_MAX_AGE = re.compile(r"(?:^|,)\s*max-age\s*=\s*\"?(\d+)\"?", re.IGNORECASE)
+
+
+def provider_metadata_url(provider):
+    """
+    Discovery document URL for a provider: `server_metadata_url`, else
+    `<issuer>/.well-known/openid-configuration`, else a well-known default.
+    """
+    if provider.get("server_metadata_url"):
+        return provider["server_metadata_url"]
+    if provider.get("issuer"):
+        return provider["issuer"].rstrip("/") + "/.well-known/openid-configuration"
+    return WELL_KNOWN_METADATA_URLS.get(provider["name"])
+
+
+def freshness_lifetime(headers, default=None):
+    """Seconds a response may be cached, from Cache-Control/Age/Expires."""
+    cache_control = headers.get("Cache-Control", "")
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        ttl = 0
+    else:
+        match = _MAX_AGE.search(cache_control)
+        if match:
+            ttl = int(match.group(1)) - int(headers.get("Age", 0) or 0)
+        elif headers.get("Expires") and headers.get("Date"):
+            try:
+                ttl = (parsedate_to_datetime(headers["Expires"])
+                       - parsedate_to_datetime(headers["Date"])).total_seconds()
+            except (TypeError, ValueError):
+                ttl = 0
+        else:
+            ttl = Config.OIDC_DEFAULT_TTL if default is None else default
+    return max(Config.OIDC_MIN_TTL, min(Config.OIDC_MAX_TTL, ttl))
+
+
+class DocumentCache:
+    """
+    Cache of OIDC discovery documents and JWKS shared by every provider.
+
+    Entries live in memory and in OIDC_CACHE_DIR (one JSON file per URL),
+    so workers and restarts reuse each other's fetches. Freshness follows
+    Cache-Control; refreshes are conditional (ETag/Last-Modified). Shortly
+    before expiry, and for OIDC_STALE_TTL seconds after it, the cached copy
+    is served while a background thread refreshes it. When a refresh fails
+    the last copy keeps being served.
+    """
+
+    def __init__(self, cache_dir=None, session=None, clock=time.time):
+        self.cache_dir = cache_dir
+        self.session = session
+        self.clock = clock
+        self._entries = {}
+        self._locks = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def _cache_dir(self):
+        return self.cache_dir or Config.OIDC_CACHE_DIR
+
+    def _path(self, url):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self._cache_dir(), f"{digest}.json")
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._locks.setdefault(url, threading.Lock())
+
+    def _http(self):
+        if self.session is None:
+            self.session = requests.Session()
+        return self.session
+
+    def _read_disk(self, url):
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def _write_disk(self, entry):
+        cache_dir = self._cache_dir()
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=".oidc-", suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(entry["url"]))
+        except OSError as e:
+            logger.warning(f"Could not persist OIDC cache entry for {entry['url']}: {e}")
+
+    def _entry(self, url):
+        entry = self._entries.get(url)
+        if entry is None:
+            entry = self._read_disk(url)
+            if entry is not None:
+                self._entries[url] = entry
+        return entry
+
+    def _store(self, url, document, headers, fetched_at):
+        ttl = freshness_lifetime(headers)
+        entry = {
+            "url": url,
+            "document": document,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "fetched_at": fetched_at,
+            "refresh_at": fetched_at + ttl - min(Config.OIDC_REFRESH_AHEAD, ttl / 2),
+            "expires_at": fetched_at + ttl,
+        }
+        self._entries[url] = entry
+        self._write_disk(entry)
+        return entry
+
+    def refresh(self, url, force=False):
+        """Fetch `url` now (conditionally when cached) and return its entry."""
+        with self._url_lock(url):
+            entry = self._entry(url)
+            # Another worker may have refreshed the shared file meanwhile
+            on_disk = self._read_disk(url)
+            if on_disk is not None and (entry is None or on_disk["fetched_at"] > entry["fetched_at"]):
+                entry = self._entries[url] = on_disk
+            if not force and entry is not None and self.clock() < entry["refresh_at"]:
+                return entry
+
+            headers = {"Accept": "application/json"}
+            if entry is not None:
+                if entry.get("etag"):
+                    headers["If-None-Match"] = entry["etag"]
+                if entry.get("last_modified"):
+                    headers["If-Modified-Since"] = entry["last_modified"]
+            fetched_at = self.clock()
+            resp = self._http().get(url, headers=headers, timeout=Config.OIDC_HTTP_TIMEOUT)
+            if resp.status_code == 304 and entry is not None:
+                response_headers = CaseInsensitiveDict(resp.headers)
+                response_headers.setdefault("ETag", entry.get("etag"))
+                response_headers.setdefault("Last-Modified", entry.get("last_modified"))
+                return self._store(url, entry["document"], response_headers, fetched_at)
+            resp.raise_for_status()
+            return self._store(url, resp.json(), resp.headers, fetched_at)
+
+    def _refresh_in_background(self, url):
+        with self._lock:
+            if url in self._refreshing:
+                return
+            self._refreshing.add(url)
+
+        def run():
+            try:
+                self.refresh(url)
+            except Exception as e:
+                logger.warning(f"Background refresh of {url} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(url)
+                    self._idle.notify_all()
+
+        threading.Thread(target=run, name="avauth-oidc-refresh", daemon=True).start()
+
+    def get(self, url, force=False):
+        """Return the parsed JSON document at `url`."""
+        entry = self._entry(url)
+        if entry is not None and not force:
+            now = self.clock()
+            if now < entry["expires_at"] + Config.OIDC_STALE_TTL:
+                if now >= entry["refresh_at"]:
+                    self._refresh_in_background(url)
+                return entry["document"]
+        try:
+            entry = self.refresh(url, force=True)
+        except Exception as e:
+            if entry is None:
+                raise
+            logger.warning(f"Refreshing {url} failed, serving the cached copy: {e}")
+        return entry["document"]
+
+    def prefetch(self, url):
+        """Warm the cache for `url` in the background unless it is fresh."""
+        entry = self._entry(url)
+        if entry is None or self.clock() >= entry["refresh_at"]:
+            self._refresh_in_background(url)
+
+    def wait_idle(self, timeout=None):
+        """Wait for background refreshes to finish; False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._refreshing, timeout)
+
+    def close(self):
+        """Close pooled HTTP connections (e.g. before fork); they reopen on demand."""
+        if self.session is not None:
+            self.session.close()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+oidc_cache = DocumentCache()
+
+
+def _oauth_classes():
+    # Authlib (and the Flask integration it loads) is only imported once an
+    # app builds its OAuth registry, not by every importer of this module
+    from authlib.integrations.flask_client import OAuth
+    from authlib.integrations.flask_client.apps import FlaskOAuth2App
+
+    class CachedMetadataApp(FlaskOAuth2App):
+        """
+        OAuth2 client that reads discovery metadata and JWKS from oidc_cache and
+        sends its requests through the provider's pooled adapter (http_utils).
+        """
+
+        def _get_session(self):
+            return mount_provider_adapter(super()._get_session(), self.name)
+
+        def _get_oauth_client(self, **metadata):
+            return mount_provider_adapter(super()._get_oauth_client(**metadata), self.name)
+
+        def load_server_metadata(self):
+            if not self._server_metadata_url:
+                return self.server_metadata
+            metadata = dict(self.server_metadata)
+            metadata.update(oidc_cache.get(self._server_metadata_url))
+            return metadata
+
+        def fetch_jwk_set(self, force=False):
+            metadata = self.load_server_metadata()
+            jwk_set = metadata.get("jwks")
+            if jwk_set and not force:
+                return jwk_set
+
+            uri = metadata.get("jwks_uri")
+            if not uri:
+                raise RuntimeError('Missing "jwks_uri" in metadata')
+            return oidc_cache.get(uri, force=force)
+
+    class CachedOAuth(OAuth):
+        oauth2_client_cls = CachedMetadataApp
+
+    return {"CachedMetadataApp": CachedMetadataApp, "CachedOAuth": CachedOAuth}
+
+
+def __getattr__(name):
+    if name in ("CachedMetadataApp", "CachedOAuth"):
+        globals().update(_oauth_classes())
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def required_claims(provider):
+    return tuple(provider.get("required_claims", Config.OIDC_REQUIRED_CLAIMS))
+
+
+def resolve_user_info(client, token, provider):
+    """
+    Return the user's claims after a code exchange.
+
+    OIDC providers' ID tokens are verified locally against the cached JWKS
+    (Authlib already does this in authorize_access_token() when a nonce was
+    sent). The userinfo endpoint is only called when the ID token is missing
+    or lacks one of the provider's required claims.
+    """
+    claims = token.get("userinfo")
+    if claims is None and token.get("id_token") and client.load_server_metadata().get("jwks_uri"):
+        claims = client.parse_id_token(token, nonce=None)
+    if claims is not None and all(claims.get(name) for name in required_claims(provider)):
+        login_claims_source.labels(provider=client.name, source="id_token").inc()
+        return dict(claims)
+
+    login_claims_source.labels(provider=client.name, source="userinfo").inc()
+    user_info = dict(claims or {})
+    with provider_call_duration.labels(provider=client.name, operation="userinfo").time():
+        user_info.update(client.userinfo())
+    return user_info
@@ -0,0 +1,140 @@
+import time
+import threading
+from collections import namedtuple
+from avauth_proxy.config import Config
+from avauth_proxy.utils.cache_utils import decision_cache
+from avauth_proxy.utils.metrics_utils import num_proxies
+from avauth_proxy.utils.store_utils import get_proxy_store
+from avauth_proxy.utils.watch_utils import watching
+
+# Compiled per-service authorization policy. Email and domain allowlists are
+# frozensets so membership checks are O(1) on the validate hot path.
+ServicePolicy = namedtuple("ServicePolicy", ["auth_required", "allowed_emails", "allowed_domains"])
+
+
+class PolicyIndex:
+    """
+    Immutable snapshot of the proxy store compiled for /auth/validate.
+
+    `version` increases by one every time the index is rebuilt in this
+    process; `store_version` is the ProxyStore (store_id, version) it was
+    built from and is identical across workers.
+    """
+
+    def __init__(self, services, store_version, version):
+        self.services = services
+        self.store_version = store_version
+        self.version = version
+
+    def get(self, service_name):
+        return self.services.get(service_name)
+
+    def __len__(self):
+        return len(self.services)
+
+
+def compile_policies(proxies):
+    """
+    Build the service_name -> ServicePolicy mapping from a list of proxy dicts
+    as returned by ProxyStore.list().
+    """
+    services = {}
+    for proxy in proxies:
+        services[proxy["service_name"]] = ServicePolicy(
+            auth_required=bool(proxy.get("auth_required", False)),
+            allowed_emails=frozenset(proxy.get("allowed_emails", [])),
+            allowed_domains=frozenset(proxy.get("allowed_domains", [])),
+        )
+    return services
+
+
+def check_access(policy, user_info):
+    """
+    Return the HTTP status Nginx expects from auth_request for this user and
+    service policy: 200 if allowed, 401 if not logged in, 403 otherwise.
+    """
+    if policy is None:
+        # Unknown service => deny
+        return 403
+    if user_info is None:
+        return 401
+    if not policy.auth_required:
+        return 200
+
+    user_email = user_info.get("email")
+    if user_email in policy.allowed_emails:
+        return 200
+
+    user_domain = user_email.split("@")[-1] if user_email else ""
+    if user_domain in policy.allowed_domains:
+        return 200
+
+    return 403
+
+
+def decide_access(service_name, user_info, session_id=None):
+    """
+    Resolve the auth_request status for a service, consulting the decision
+    cache when the caller has a session id. Anonymous requests are not cached.
+    """
+    index = get_policy_index()
+    if session_id is None or user_info is None:
+        return check_access(index.get(service_name), user_info)
+
+    key = (session_id, service_name, index.version)
+    status = decision_cache.get(key)
+    if status is None:
+        status = check_access(index.get(service_name), user_info)
+        decision_cache.set(key, status)
+    return status
+
+
+_lock = threading.Lock()
+_index = None
+_signature = None
+_checked_at = 0.0
+
+
+def _refresh():
+    global _index, _signature, _checked_at
+
+    store = get_proxy_store()
+    signature = (store.path, store.store_id, store.version())
+    _checked_at = time.monotonic()
+    if _index is not None and signature == _signature:
+        return _index
+
+    store_version, proxies = store.snapshot()
+    version = _index.version + 1 if _index is not None else 1
+    _index = PolicyIndex(compile_policies(proxies), (store.store_id, store_version), version)
+    num_proxies.set(len(_index))
+    _signature = (store.path, store.store_id, store_version)
+    return _index
+
+
+def get_policy_index():
+    """
+    Return the current PolicyIndex.
+
+    The store's version is read at most once every
+    Config.POLICY_CHECK_INTERVAL seconds (WATCH_FALLBACK_INTERVAL while the
+    file watcher invalidates the index on store writes) and the index is
+    only recompiled when it changed. Between checks this is a plain
+    attribute read.
+    """
+    index = _index
+    interval = Config.WATCH_FALLBACK_INTERVAL if watching() else Config.POLICY_CHECK_INTERVAL
+    if index is not None and time.monotonic() - _checked_at < interval:
+        return index
+    with _lock:
+        return _refresh()
+
+
+def invalidate_policy_index():
+    """
+    Force the next get_policy_index() call to check the store's version.
+    The index is only recompiled if the version changed.
+    """
+    global _checked_at
+    with _lock:
+        _checked_at = 0.0
@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from avauth_proxy.config import Config
+from avauth_proxy.utils.store_utils import get_proxy_store
+from avauth_proxy.utils.nginx_utils import generate_nginx_configs
+from avauth_proxy.utils.logging_utils import log_event
+from avauth_proxy.utils.metrics_utils import nginx_reload_requests, nginx_reload_runs, nginx_reload_duration
+
+
+class ReloadScheduler:
+    """
+    Background scheduler that coalesces Nginx config generations.
+
+    Every request() bumps a generation id. A worker thread waits until no new
+    request arrived for `window` seconds (but never longer than `max_delay`
+    after the first pending one), then runs `render` once for all of them.
+    Callers may block on their generation id with wait().
+
+    Coalescing is only per process: mutations handled by N gunicorn workers
+    can still lead to N runs. generate_nginx_configs() serializes those runs
+    with a lock on NGINX_CONFIG_DIR, and as it is incremental, the runs that
+    follow the first find nothing changed and do not reload Nginx again.
+    """
+
+    def __init__(self, render, window, max_delay, keep_outcomes=64):
+        self._render = render
+        self.window = window
+        self.max_delay = max_delay
+        self._keep_outcomes = keep_outcomes
+        self._cond = threading.Condition()
+        self._requested = 0
+        self._completed = 0
+        self._first_pending_at = None
+        self._last_request_at = None
+        self._outcomes = OrderedDict()  # completed generation -> (result, error)
+        self._thread = None
+        self._pid = None
+
+    @property
+    def completed(self):
+        return self._completed
+
+    def request(self):
+        """Schedule a render+reload and return the generation id covering it."""
+        with self._cond:
+            self._requested += 1
+            now = time.monotonic()
+            if self._first_pending_at is None:
+                self._first_pending_at = now
+            self._last_request_at = now
+            self._ensure_thread()
+            self._cond.notify_all()
+            nginx_reload_requests.inc()
+            return self._requested
+
+    def wait(self, generation, timeout=None):
+        """
+        Block until `generation` has been rendered and return the
+        GenerationResult of the run that covered it. Re-raises that run's
+        error, and raises TimeoutError if it did not finish in time.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._completed >= generation, timeout):
+                raise TimeoutError(f"Nginx config generation {generation} still pending")
+            for covered, (result, error) in self._outcomes.items():
+                if covered >= generation:
+                    if error is not None:
+                        raise error
+                    return result
+            # Outcome already dropped from the history; it did complete.
+            return None
+
+    def _ensure_thread(self):
+        # Caller holds self._cond. Threads do not survive fork(), so a worker
+        # forked from a preloaded master starts its own.
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="nginx-reload", daemon=True)
+        self._thread.start()
+
+    def _next_batch(self):
+        with self._cond:
+            while self._requested == self._completed:
+                self._cond.wait()
+            while True:
+                deadline = min(self._last_request_at + self.window, self._first_pending_at + self.max_delay)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            self._first_pending_at = None
+            return self._requested
+
+    def _run(self):
+        while True:
+            target = self._next_batch()
+            start = time.perf_counter()
+            result, error = None, None
+            try:
+                result = self._render()
+                nginx_reload_runs.labels(result="reloaded" if result.written or result.removed else "unchanged").inc()
+            except Exception as e:
+                error = e
+                nginx_reload_runs.labels(result="failed").inc()
+                log_event(f"Nginx config generation {target} failed: {e}", "nginx_error")
+            nginx_reload_duration.observe(time.perf_counter() - start)
+
+            with self._cond:
+                self._completed = target
+                self._outcomes[target] = (result, error)
+                while len(self._outcomes) > self._keep_outcomes:
+                    self._outcomes.popitem(last=False)
+                self._cond.notify_all()
+
+
+def _render_current():
+    # Always render the latest saved state so one run covers every mutation
+    # that happened while it was pending.
+    store = get_proxy_store()
+    if Config.PROXY_STORE_EXPORT:
+        store.export_toml(Config.PROXIES_CONFIG_FILE)
+    return generate_nginx_configs(store.list())
+
+
+reload_scheduler = ReloadScheduler(
+    _render_current,
+    window=Config.NGINX_RELOAD_DEBOUNCE,
+    max_delay=Config.NGINX_RELOAD_MAX_DELAY,
+)
+
+
+def schedule_nginx_reload():
+    """Request a coalesced config generation; returns its generation id."""
+    return reload_scheduler.request()
+
+
+def wait_for_nginx_reload(generation, timeout=None):
+    return reload_scheduler.wait(generation, timeout)
@@ -0,0 +1,298 @@
+import os
+import json
+import time
+import secrets
+import sqlite3
+import importlib
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from itsdangerous import BadSignature
+from avauth_proxy.config import Config
+
+
+def new_session_id():
+    """Opaque 144-bit session id, 24 URL-safe characters."""
+    return secrets.token_urlsafe(18)
+
+
+class SessionStore(ABC):
+    """
+    Interface of server-side session backends. Values are plain dicts that
+    must round-trip through JSON; `ttl` is in seconds.
+    """
+
+    @abstractmethod
+    def get(self, session_id):
+        pass
+
+    @abstractmethod
+    def set(self, session_id, data, ttl):
+        pass
+
+    @abstractmethod
+    def delete(self, session_id):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Per-process LRU store; only suitable for a single worker."""
+
+    def __init__(self, maxsize=10000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries = OrderedDict()  # id -> (expires_at, json)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] <= self.clock():
+                del self._entries[session_id]
+                return None
+            self._entries.move_to_end(session_id)
+        return json.loads(entry[1])
+
+    def set(self, session_id, data, ttl):
+        value = json.dumps(data, separators=(",", ":"))
+        with self._lock:
+            self._entries[session_id] = (self.clock() + ttl, value)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Store in a local SQLite database (WAL mode), shared by all gunicorn
+    workers on the host. Each thread keeps its own connection; expired rows
+    are purged every `purge_every` writes.
+    """
+
+    def __init__(self, path, purge_every=1000, clock=time.time):
+        self.path = path
+        self.purge_every = purge_every
+        self.clock = clock
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, session_id):
+        row = self._connection().execute(
+            "SELECT data FROM sessions WHERE id = ? AND expires_at > ?",
+            (session_id, self.clock()),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, session_id, data, ttl):
+        now = self.clock()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(data, separators=(",", ":")), now + ttl),
+        )
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+
+    def delete(self, session_id):
+        self._connection().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+
+class KeyValueSessionStore(SessionStore):
+    """
+    Store in an external key-value service. `client` needs the redis-py
+    subset get(key), set(key, value, ex=seconds) and delete(key).
+    """
+
+    def __init__(self, client, prefix="avauth:session:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, session_id):
+        value = self.client.get(self.prefix + session_id)
+        if value is None:
+            return None
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        return json.loads(value)
+
+    def set(self, session_id, data, ttl):
+        self.client.set(self.prefix + session_id, json.dumps(data, separators=(",", ":")), ex=int(ttl))
+
+    def delete(self, session_id):
+        self.client.delete(self.prefix + session_id)
+
+
+class LocalKeyValueClient:
+    """In-process stand-in for an external key-value client (dev and tests)."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= self.clock():
+                self._data.pop(key, None)
+                return None
+            return entry[1]
+
+    def set(self, key, value, ex):
+        with self._lock:
+            self._data[key] = (self.clock() + ex, value.encode("utf-8"))
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+def create_session_store(backend=None):
+    """
+    Build the store for `backend` ("memory", "sqlite" or "external"). The
+    external client comes from Config.SESSION_EXTERNAL_CLIENT, a
+    "module:callable" returning a client.
+    """
+    backend = backend or Config.SESSION_BACKEND
+    if backend == "memory":
+        return MemorySessionStore(maxsize=Config.SESSION_MEMORY_SIZE)
+    if backend == "sqlite":
+        return SQLiteSessionStore(Config.SESSION_SQLITE_FILE)
+    if backend == "external":
+        if not Config.SESSION_EXTERNAL_CLIENT:
+            raise ValueError("SESSION_EXTERNAL_CLIENT is required for the external session backend")
+        module_name, _, attr = Config.SESSION_EXTERNAL_CLIENT.partition(":")
+        factory = getattr(importlib.import_module(module_name), attr)
+        return KeyValueSessionStore(factory())
+    raise ValueError(f"Unknown session backend: {backend}")
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, session_id=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.session_id = session_id
+        self.modified = False
+        self.rotate = False
+
+    def regenerate(self):
+        """Move the data to a fresh id on save (call on login)."""
+        self.rotate = True
+        self.modified = True
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Flask session interface keeping session data in a SessionStore; the
+    cookie only carries the opaque session id.
+    """
+
+    session_class = ServerSideSession
+
+    def __init__(self, store):
+        self.store = store
+
+    def load(self, session_id):
+        """Session data for an id from the cookie, or None."""
+        if not session_id or len(session_id) > 64:
+            return None
+        return self.store.get(session_id)
+
+    def open_session(self, app, request):
+        session_id = request.cookies.get(self.get_cookie_name(app))
+        data = self.load(session_id)
+        if data is None:
+            return self.session_class()
+        return self.session_class(data, session_id=session_id)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and session.session_id:
+                self.store.delete(session.session_id)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not session.modified and session.session_id:
+            return
+
+        if session.rotate and session.session_id:
+            self.store.delete(session.session_id)
+            session.session_id = None
+        if session.session_id is None:
+            session.session_id = new_session_id()
+        session.rotate = False
+        self.store.set(session.session_id, dict(session), Config.SESSION_TTL)
+        response.vary.add("Cookie")
+        response.set_cookie(
+            name,
+            session.session_id,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def regenerate_session(session):
+    """Issue a new session id on login when sessions are server-side."""
+    if isinstance(session, ServerSideSession):
+        session.regenerate()
+
+
+def make_session_loader(flask_app):
+    """
+    Return load(cookie value) -> session dict for the app's session
+    interface, usable outside a request context (e.g. the WSGI fast path).
+    """
+    interface = flask_app.session_interface
+    if isinstance(interface, ServerSideSessionInterface):
+        return lambda value: interface.load(value) or {}
+
+    serializer = interface.get_signing_serializer(flask_app)
+    max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+
+    def load(value):
+        if serializer is None:
+            return {}
+        try:
+            return serializer.loads(value, max_age=max_age)
+        except BadSignature:
+            return {}
+
+    return load
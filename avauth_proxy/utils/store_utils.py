@@ -0,0 +1,431 @@
+import os
+import json
+import uuid
+import base64
+import fcntl
+import binascii
+import hashlib
+import sqlite3
+import tempfile
+import threading
+import tomllib
+from contextlib import contextmanager
+from collections import namedtuple
+import tomli_w as tomlw
+from avauth_proxy.config import Config
+from avauth_proxy.utils.metrics_utils import config_parse_duration
+
+# Read once: os.umask() can only be queried by setting it, which is not
+# thread-safe
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+ProxyPage = namedtuple("ProxyPage", ["proxies", "next_cursor", "version"])
+
+
+class ProxyExistsError(ValueError):
+    pass
+
+
+class ProxyNotFoundError(KeyError):
+    pass
+
+
+def _validate(proxy):
+    name = proxy.get("service_name") if isinstance(proxy, dict) else None
+    if not isinstance(name, str) or not name:
+        raise ValueError("A proxy needs a non-empty service_name")
+
+
+def _dumps(proxy):
+    return json.dumps(proxy, sort_keys=True, separators=(",", ":"))
+
+
+def _encode_cursor(service_name):
+    return base64.urlsafe_b64encode(service_name.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor):
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError):
+        return ""  # bogus cursor: start from the first proxy
+
+
+class ProxyTransaction:
+    """
+    Row operations inside one ProxyStore.transaction(). The policy version
+    is bumped once at commit if any of them changed a row.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.changed = False
+        self.version = None
+
+    def get(self, service_name):
+        row = self._conn.execute(
+            "SELECT data FROM proxies WHERE service_name = ?", (service_name,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def exists(self, service_name):
+        return self._conn.execute(
+            "SELECT 1 FROM proxies WHERE service_name = ?", (service_name,)
+        ).fetchone() is not None
+
+    def create(self, proxy):
+        _validate(proxy)
+        try:
+            self._conn.execute(
+                "INSERT INTO proxies (service_name, data) VALUES (?, ?)",
+                (proxy["service_name"], _dumps(proxy)),
+            )
+        except sqlite3.IntegrityError:
+            raise ProxyExistsError(f"Proxy {proxy['service_name']} already exists")
+        self.changed = True
+
+    def update(self, service_name, proxy):
+        """Replace a proxy; `proxy` may carry a new service_name (rename)."""
+        _validate(proxy)
+        try:
+            cursor = self._conn.execute(
+                "UPDATE proxies SET service_name = ?, data = ? WHERE service_name = ? AND data != ?",
+                (proxy["service_name"], _dumps(proxy), service_name, _dumps(proxy)),
+            )
+        except sqlite3.IntegrityError:
+            raise ProxyExistsError(f"Proxy {proxy['service_name']} already exists")
+        if cursor.rowcount:
+            self.changed = True
+        elif not self.exists(service_name):
+            raise ProxyNotFoundError(service_name)
+
+    def delete(self, service_name):
+        cursor = self._conn.execute("DELETE FROM proxies WHERE service_name = ?", (service_name,))
+        if not cursor.rowcount:
+            raise ProxyNotFoundError(service_name)
+        self.changed = True
+
+    def replace_all(self, proxies):
+        """Make the table hold exactly `proxies`, touching only rows that differ."""
+        wanted = {}
+        for proxy in proxies:
+            _validate(proxy)
+            wanted[proxy["service_name"]] = _dumps(proxy)
+        current = dict(self._conn.execute("SELECT service_name, data FROM proxies"))
+        for service_name in current.keys() - wanted.keys():
+            self._conn.execute("DELETE FROM proxies WHERE service_name = ?", (service_name,))
+            self.changed = True
+        for service_name, data in wanted.items():
+            if current.get(service_name) == data:
+                continue
+            self._conn.execute(
+                "INSERT INTO proxies (service_name, data) VALUES (?, ?) "
+                "ON CONFLICT (service_name) DO UPDATE SET data = excluded.data",
+                (service_name, data),
+            )
+            self.changed = True
+
+
+class ProxyStore:
+    """
+    Proxies in a local SQLite database (WAL mode) shared by all workers on
+    the host: one row per service, keyed by service_name, in insertion order.
+
+    Every committed change bumps `version`, a counter readers can poll with
+    one indexed read. `store_id` is random per database, so (store_id,
+    version) identifies a state. Each thread keeps its own connection.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._store_id = None
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS proxies ("
+                    "id INTEGER PRIMARY KEY, service_name TEXT NOT NULL UNIQUE, data TEXT NOT NULL)"
+                )
+                conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '0')")
+                conn.execute(
+                    "INSERT OR IGNORE INTO meta (key, value) VALUES ('store_id', ?)", (uuid.uuid4().hex,)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        """Close this thread's connection, e.g. in a master before it forks."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+
+    def _meta(self, key, conn=None):
+        row = (conn or self._connection()).execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, conn, key, value):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    @property
+    def store_id(self):
+        if self._store_id is None:
+            self._store_id = self._meta("store_id")
+        return self._store_id
+
+    def version(self):
+        return int(self._meta("version"))
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run row operations atomically; all of them are committed together
+        (bumping the version once) or, if the block raises, none.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        tx = ProxyTransaction(conn)
+        try:
+            yield tx
+            if tx.changed:
+                conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+            tx.version = int(self._meta("version", conn))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, service_name):
+        row = self._connection().execute(
+            "SELECT data FROM proxies WHERE service_name = ?", (service_name,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list(self):
+        """All proxies in insertion order."""
+        return [json.loads(data) for (data,) in self._connection().execute("SELECT data FROM proxies ORDER BY id")]
+
+    def snapshot(self):
+        """(version, proxies) read in one transaction."""
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            version = int(self._meta("version", conn))
+            proxies = [json.loads(data) for (data,) in conn.execute("SELECT data FROM proxies ORDER BY id")]
+        finally:
+            conn.execute("COMMIT")
+        return version, proxies
+
+    def _page_query(self, limit, cursor, search):
+        sql = "SELECT service_name, data FROM proxies WHERE service_name > ?"
+        params = [_decode_cursor(cursor) if cursor else ""]
+        if search:
+            sql += " AND (instr(lower(service_name), ?) OR instr(lower(json_extract(data, '$.url')), ?))"
+            params += [search.lower()] * 2
+        sql += " ORDER BY service_name LIMIT ?"
+        params.append(limit + 1)
+        return sql, params
+
+    def page(self, limit, cursor=None, search=None):
+        """
+        Return a ProxyPage with up to `limit` proxies ordered by
+        service_name, starting after the opaque `cursor` of the previous
+        page. `search` matches service_name or url (substring, any case).
+        """
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            version = int(self._meta("version", conn))
+            rows = conn.execute(*self._page_query(limit, cursor, search)).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        next_cursor = _encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+        return ProxyPage([json.loads(data) for _, data in rows[:limit]], next_cursor, version)
+
+    def scan(self, limit, cursor=None, search=None):
+        """
+        Generator version of page(): yields the proxies as rows are read
+        and returns the next cursor (see StreamedPage).
+        """
+        previous = None
+        for count, (service_name, data) in enumerate(self._connection().execute(*self._page_query(limit, cursor, search))):
+            if count == limit:
+                return _encode_cursor(previous)
+            previous = service_name
+            yield json.loads(data)
+        return None
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM proxies").fetchone()[0]
+
+    def create(self, proxy):
+        with self.transaction() as tx:
+            tx.create(proxy)
+        return tx.version
+
+    def update(self, service_name, proxy):
+        with self.transaction() as tx:
+            tx.update(service_name, proxy)
+        return tx.version
+
+    def delete(self, service_name):
+        with self.transaction() as tx:
+            tx.delete(service_name)
+        return tx.version
+
+    def replace_all(self, proxies):
+        with self.transaction() as tx:
+            tx.replace_all(proxies)
+        return tx.version
+
+    def import_toml(self, path):
+        """
+        Replace the store's content with the proxies of a TOML file and
+        remember the file's digest; returns the new version.
+        """
+        with _toml_lock(path):
+            return self._import_toml(path)
+
+    def _import_toml(self, path):
+        with open(path, "rb") as f:
+            content = f.read()
+        with config_parse_duration.labels(file="proxies").time():
+            proxies = tomllib.loads(content.decode("utf-8")).get("proxies", [])
+        with self.transaction() as tx:
+            tx.replace_all(proxies)
+            # The version the commit will have
+            version = int(self._meta("version", tx._conn)) + (1 if tx.changed else 0)
+            self._set_meta(tx._conn, "toml_digest", hashlib.sha256(content).hexdigest())
+            self._set_meta(tx._conn, "toml_version", version)
+        return tx.version
+
+    def write_toml(self, path):
+        """Atomically write the current proxies to a TOML file; returns the version written."""
+        version, proxies = self.snapshot()
+        self._write_toml(path, proxies)
+        return version
+
+    def _write_toml(self, path, proxies):
+        content = tomlw.dumps({"proxies": proxies}).encode("utf-8")
+        directory = os.path.dirname(path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".proxies-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                # mkstemp creates 0600 files; keep the mode open() would give
+                os.fchmod(f.fileno(), 0o666 & ~_UMASK)
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return content
+
+    def export_toml(self, path):
+        """
+        Mirror the store to PROXIES_CONFIG_FILE unless it already reflects
+        the current version; returns True if it was written.
+
+        Snapshot, write and meta update run under the file's lock, so two
+        workers exporting at once cannot leave an older file on disk behind
+        the digest of a newer one (which the next sync would import back).
+        """
+        with _toml_lock(path):
+            version, proxies = self.snapshot()
+            if self._meta("toml_version") == str(version) and os.path.exists(path):
+                return False
+            # Under the lock the file holds exactly these bytes until we return
+            content = self._write_toml(path, proxies)
+            with self.transaction() as tx:
+                self._set_meta(tx._conn, "toml_digest", hashlib.sha256(content).hexdigest())
+                self._set_meta(tx._conn, "toml_version", version)
+        return True
+
+    def sync_from_toml(self, path, blocking=True):
+        """
+        Import the TOML file if its content differs from what was last
+        imported or exported (e.g. it was edited by hand). Returns True if
+        it was imported. With blocking=False returns None instead of
+        waiting while another process exports or imports the file.
+        """
+        if not os.path.exists(path):
+            return False
+        with _toml_lock(path, blocking) as locked:
+            if not locked:
+                return None
+            try:
+                with open(path, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+            except FileNotFoundError:
+                return False
+            if self._meta("toml_digest") == digest:
+                return False
+            self._import_toml(path)
+        return True
+
+
+@contextmanager
+def _toml_lock(path, blocking=True):
+    """
+    Inter-process lock serializing exports and imports of one TOML file;
+    yields False if blocking=False and another process holds it.
+    """
+    with open(f"{path}.lock", "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+_stores = {}  # database path -> ProxyStore
+_lock = threading.Lock()
+
+
+def proxy_store_path():
+    """PROXY_STORE_FILE, else PROXIES_CONFIG_FILE with a .db extension."""
+    if Config.PROXY_STORE_FILE:
+        return Config.PROXY_STORE_FILE
+    return os.path.splitext(Config.PROXIES_CONFIG_FILE)[0] + ".db"
+
+
+def get_proxy_store():
+    """
+    Return the process-wide ProxyStore. Opening it imports
+    PROXIES_CONFIG_FILE when that file changed since the store last
+    imported or exported it (a new store, or a hand edit).
+    """
+    path = proxy_store_path()
+    store = _stores.get(path)
+    if store is None:
+        with _lock:
+            store = _stores.get(path)
+            if store is None:
+                store = ProxyStore(path)
+                store.sync_from_toml(Config.PROXIES_CONFIG_FILE)
+                _stores[path] = store
+    return store
@@ -0,0 +1,39 @@
+from flask import stream_template
+
+
+class StreamedPage:
+    """
+    One page of items produced lazily while a template iterates over it.
+
+    `scan` is a generator yielding the items and returning the cursor of
+    the next page (or None); `next_cursor` is set once the page has been
+    iterated, e.g. after the template's loop over it.
+    """
+
+    def __init__(self, scan):
+        self._scan = scan
+        self.next_cursor = None
+
+    def __iter__(self):
+        self.next_cursor = yield from self._scan
+
+
+def _buffered(chunks, buffer_size):
+    pending, size = [], 0
+    for chunk in chunks:
+        pending.append(chunk)
+        size += len(chunk)
+        if size >= buffer_size:
+            yield "".join(pending)
+            pending, size = [], 0
+    if pending:
+        yield "".join(pending)
+
+
+def stream_page_template(template_name, buffer_size=8192, **context):
+    """
+    Render a template as a stream of chunks of about `buffer_size`
+    characters. Must be called in the view: stream_template() keeps the
+    request context alive while the body is sent.
+    """
+    return _buffered(stream_template(template_name, **context), buffer_size)
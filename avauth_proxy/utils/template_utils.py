@@ -0,0 +1,54 @@
+import os
+import threading
+from avauth_proxy.config import Config
+
+_lock = threading.Lock()
+_envs = {}  # templates dir -> Environment
+_catalogues = {}  # templates dir -> (dir mtime_ns, template names)
+
+
+def get_template_env():
+    """
+    Return the process-wide Jinja environment for the Nginx templates.
+
+    Compiled templates stay in the environment's in-memory cache and are
+    also written to a filesystem bytecode cache shared across workers and
+    restarts. auto_reload recompiles a template when its mtime changes.
+    """
+    templates_dir = Config.NGINX_TEMPLATES_DIR
+    env = _envs.get(templates_dir)
+    if env is None:
+        with _lock:
+            env = _envs.get(templates_dir)
+            if env is None:
+                # Jinja is only loaded by processes that actually render
+                from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+                bytecode_dir = Config.NGINX_TEMPLATE_CACHE_DIR
+                if bytecode_dir:
+                    os.makedirs(bytecode_dir, exist_ok=True)
+                env = Environment(
+                    loader=FileSystemLoader(templates_dir),
+                    bytecode_cache=FileSystemBytecodeCache(bytecode_dir),
+                    auto_reload=True,
+                )
+                _envs[templates_dir] = env
+    return env
+
+
+def list_nginx_templates():
+    """
+    Return the sorted .j2 template names in NGINX_TEMPLATES_DIR. The listing
+    is cached and only redone when the directory's mtime changes.
+    """
+    templates_dir = Config.NGINX_TEMPLATES_DIR
+    mtime_ns = os.stat(templates_dir).st_mtime_ns
+    cached = _catalogues.get(templates_dir)
+    if cached is not None and cached[0] == mtime_ns:
+        return list(cached[1])
+
+    templates = tuple(sorted(
+        filename for filename in os.listdir(templates_dir)
+        if filename.endswith(".j2")
+    ))
+    _catalogues[templates_dir] = (mtime_ns, templates)
+    return list(templates)
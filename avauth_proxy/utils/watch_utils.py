@@ -0,0 +1,243 @@
+import os
+import time
+import logging
+import threading
+from avauth_proxy.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Event types that mean a watched file may have new content
+_CHANGE_EVENTS = ("created", "modified", "moved", "deleted", "closed")
+
+
+class ConfigWatcher:
+    """
+    Watches config.toml, proxies_config.toml and the proxy store with
+    watchdog and applies changes in a background thread, so request
+    handling never stats or parses them:
+
+        config    parse once, publish the ConfigSnapshot (admins,
+                  use_oauth2_proxy) and re-register changed providers;
+                  schedule a render if use_oauth2_proxy or
+                  nginx_acl_secret changed
+        proxies   import a hand-edited file into the store (only in the
+                  worker that wins the import, and not while another
+                  process holds the file's export lock), then schedule
+                  a render
+        store     any write to the SQLite store, from this or another
+                  process: recompile the policy index if its version moved
+
+    Events are coalesced until none arrived for `debounce` seconds (but no
+    longer than CONFIG_WATCH_MAX_DELAY), so an editor's save (often
+    truncate + write, or write + rename) is applied once. The watched directories are those of the files at start().
+    Threads do not survive fork(): call start() in each worker.
+    """
+
+    def __init__(self, debounce=None):
+        self.debounce = debounce
+        self._cond = threading.Condition()
+        self._pending = set()
+        self._first_event_at = None
+        self._last_event_at = None
+        self._targets = {}  # absolute path -> kind
+        self._observer = None
+        self._thread = None
+        self._pid = None
+        self._stopped = False
+        # Read on the request path by watching(); cleared in forked children
+        self.active = False
+
+    def running(self):
+        return (
+            self._observer is not None and self._pid == os.getpid()
+            and self._observer.is_alive() and self._thread.is_alive()
+        )
+
+    def _resolve_targets(self):
+        from avauth_proxy.utils.store_utils import get_proxy_store
+        # Opening the store imports an edited proxies file now, not on the first event
+        store_path = os.path.abspath(get_proxy_store().path)
+        return {
+            os.path.abspath(Config.CONFIG_TOML_FILE): "config",
+            os.path.abspath(Config.PROXIES_CONFIG_FILE): "proxies",
+            store_path: "store",
+            store_path + "-wal": "store",
+        }
+
+    def start(self):
+        """Start watching in this process; returns False if already running."""
+        # Only processes that watch load watchdog
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if not event.is_directory and event.event_type in _CHANGE_EVENTS:
+                    watcher.notify(event.src_path, getattr(event, "dest_path", None))
+
+        with self._cond:
+            if self.running():
+                return False
+            self._pid = os.getpid()
+            self._stopped = False
+            self._pending.clear()
+            self._targets = self._resolve_targets()
+            observer = Observer()
+            observer.daemon = True
+            for directory in sorted({os.path.dirname(path) for path in self._targets}):
+                if os.path.isdir(directory):
+                    observer.schedule(Handler(), directory, recursive=False)
+            observer.start()
+            self._observer = observer
+            self._thread = threading.Thread(target=self._run, name="config-watch", daemon=True)
+            self._thread.start()
+            self.active = True
+            return True
+
+    def stop(self):
+        with self._cond:
+            observer, thread = self._observer, self._thread
+            self.active = False
+            if observer is None or self._pid != os.getpid():
+                self._observer = self._thread = None
+                return
+            self._observer = None
+            self._stopped = True
+            self._cond.notify_all()
+        observer.stop()
+        observer.join()
+        thread.join()
+
+    def notify(self, *paths):
+        """Record a file event; called from the observer thread."""
+        kinds = {self._targets.get(os.path.abspath(path)) for path in paths if path}
+        kinds.discard(None)
+        if kinds:
+            self._add(kinds)
+
+    def _add(self, kinds):
+        with self._cond:
+            now = time.monotonic()
+            if not self._pending:
+                self._first_event_at = now
+            self._pending |= kinds
+            self._last_event_at = now
+            self._cond.notify_all()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending and not self._stopped:
+                self._cond.wait()
+            while not self._stopped:
+                debounce = Config.CONFIG_WATCH_DEBOUNCE if self.debounce is None else self.debounce
+                deadline = min(self._last_event_at + debounce, self._first_event_at + Config.CONFIG_WATCH_MAX_DELAY)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            pending, self._pending = self._pending, set()
+            return None if self._stopped else pending
+
+    def _run(self):
+        while True:
+            kinds = self._next_batch()
+            if kinds is None:
+                return
+            try:
+                retry = apply_changes(kinds)
+            except Exception as e:
+                logger.warning(f"Applying changes to {', '.join(sorted(kinds))} failed: {e}")
+            else:
+                if retry:
+                    self._add(retry)
+
+    def _after_fork(self):
+        # The observer and worker threads stay behind in the parent
+        self.active = False
+        self._observer = self._thread = None
+        self._cond = threading.Condition()
+        self._pending = set()
+
+
+def apply_changes(kinds):
+    """
+    Apply changed files: any of "config", "proxies" and "store". Returns
+    the kinds that could not be applied yet and should be retried.
+    """
+    # Imported here: this module is imported by policy_utils and oauth_utils
+    from avauth_proxy.utils.config_utils import reload_config
+    from avauth_proxy.utils.metrics_utils import config_reloads
+    from avauth_proxy.utils.oauth_utils import _registries
+    from avauth_proxy.utils.store_utils import get_proxy_store
+    from avauth_proxy.utils.file_utils import proxies_changed
+    from avauth_proxy.utils.policy_utils import get_policy_index, invalidate_policy_index
+    from avauth_proxy.utils.reload_utils import schedule_nginx_reload
+
+    retry = set()
+    if "config" in kinds:
+        # Settings that are baked into the rendered Nginx configs
+        rendered = (Config.USE_OAUTH2_PROXY, Config.NGINX_ACL_SECRET)
+        try:
+            snapshot = reload_config()
+        except Exception as e:
+            # Half-written or invalid file: keep serving the last good snapshot
+            config_reloads.labels(file="config", result="failed").inc()
+            logger.warning(f"Not reloading {Config.CONFIG_TOML_FILE}: {e}")
+        else:
+            if snapshot is not None:
+                for registry in list(_registries.values()):
+                    registry.apply_snapshot(snapshot)
+                if (Config.USE_OAUTH2_PROXY, Config.NGINX_ACL_SECRET) != rendered:
+                    # Templates or the ACL maps' secret changed: re-render everything
+                    schedule_nginx_reload()
+                config_reloads.labels(file="config", result="applied").inc()
+                logger.info(f"Reloaded {snapshot.path}")
+
+    if "proxies" in kinds:
+        store = get_proxy_store()
+        try:
+            version = store.version()
+            # Every worker sees the edit; the digest makes all but one a no-op.
+            # While another process exports (or imports) the file, its content
+            # is in flux: try again after the next debounce instead of waiting.
+            imported = store.sync_from_toml(Config.PROXIES_CONFIG_FILE, blocking=False)
+            if imported is None:
+                retry.add("proxies")
+            elif imported and store.version() != version:
+                proxies_changed()
+                schedule_nginx_reload()
+                config_reloads.labels(file="proxies", result="applied").inc()
+                logger.info(f"Imported {Config.PROXIES_CONFIG_FILE} into the proxy store")
+        except Exception as e:
+            config_reloads.labels(file="proxies", result="failed").inc()
+            logger.warning(f"Not importing {Config.PROXIES_CONFIG_FILE}: {e}")
+        kinds = kinds | {"store"}
+
+    if "store" in kinds:
+        # Rebuild here rather than on the next request; a no-op unless the
+        # store's version moved. Cached decisions are keyed by index version.
+        invalidate_policy_index()
+        get_policy_index()
+    return retry
+
+
+config_watcher = ConfigWatcher()
+os.register_at_fork(after_in_child=config_watcher._after_fork)
+
+
+def start_config_watcher():
+    """Start the process-wide watcher unless CONFIG_WATCH is off; returns True if started."""
+    if not Config.CONFIG_WATCH:
+        return False
+    return config_watcher.start()
+
+
+def stop_config_watcher():
+    config_watcher.stop()
+
+
+def watching():
+    """True if this process' watcher is running (polling can back off)."""
+    return config_watcher.active
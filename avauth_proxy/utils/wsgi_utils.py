@@ -0,0 +1,56 @@
+import time
+from werkzeug.http import parse_cookie
+from avauth_proxy.utils.policy_utils import decide_access
+from avauth_proxy.utils.session_utils import make_session_loader
+from avauth_proxy.utils.metrics_utils import validate_duration
+
+_STATUS_LINES = {
+    200: "200 OK",
+    401: "401 UNAUTHORIZED",
+    403: "403 FORBIDDEN",
+    404: "404 NOT FOUND",
+}
+_EMPTY_HEADERS = [("Content-Type", "text/plain"), ("Content-Length", "0")]
+
+
+def make_validate_app(flask_app):
+    """
+    Build a bare WSGI application answering Nginx auth_request subrequests
+    for /auth/validate/<service_name> without Flask routing, request contexts
+    or blueprint hooks.
+
+    It is meant to be mounted with DispatcherMiddleware under /auth/validate,
+    so PATH_INFO is just "/<service_name>". The session cookie is resolved
+    through the app's session interface (signed cookie or server-side
+    store), and the decision comes from the shared policy index and
+    decision cache.
+    """
+    load_cookie = make_session_loader(flask_app)
+    cookie_name = flask_app.config["SESSION_COOKIE_NAME"]
+
+    def load_session(environ):
+        cookie_header = environ.get("HTTP_COOKIE")
+        if not cookie_header:
+            return {}
+        value = parse_cookie(cookie_header).get(cookie_name)
+        if not value:
+            return {}
+        return load_cookie(value)
+
+    # Bound once: labels() costs more than the observation itself
+    durations = {status: validate_duration.labels(path="fast", status=str(status)) for status in (200, 401, 403)}
+
+    def validate_app(environ, start_response):
+        started = time.perf_counter()
+        service_name = environ.get("PATH_INFO", "")[1:]
+        if not service_name or "/" in service_name:
+            start_response(_STATUS_LINES[404], list(_EMPTY_HEADERS))
+            return [b""]
+
+        session_data = load_session(environ)
+        status = decide_access(service_name, session_data.get("user"), session_data.get("sid"))
+        start_response(_STATUS_LINES[status], list(_EMPTY_HEADERS))
+        durations[status].observe(time.perf_counter() - started)
+        return [b""]
+
+    return validate_app
@@ -0,0 +1,54 @@
+# Gunicorn settings for avauth_proxy:
+#   gunicorn -c gunicorn.conf.py avauth_proxy.app:app
+#
+# Prometheus metrics are kept in per-worker value files under
+# PROMETHEUS_MULTIPROC_DIR so /metrics/ reports totals for all workers.
+# The variable has to be set before anything imports prometheus_client,
+# which with preload_app is the master itself.
+#
+# With GUNICORN_PRELOAD (default on) the master builds the app once and
+# warm_app() fills the policy index, template and provider caches before
+# the first fork, so workers share them copy-on-write and start serving
+# right away. Set GUNICORN_PRELOAD=0 to have every worker build its own
+# app instead (e.g. to pick up code changes with a HUP).
+import os
+import tempfile
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1").lower() not in ("0", "false", "no")
+
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "avauth_prometheus")
+)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def on_starting(server):
+    # Values from a previous run would otherwise be added to the new totals.
+    # A preloading master has already opened its own value files; workers
+    # do not share them (prometheus_client starts over on a new pid).
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    for filename in os.listdir(path):
+        if filename.endswith(".db"):
+            os.remove(os.path.join(path, filename))
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from avauth_proxy import get_app, warm_app
+    warm_app(get_app())
+
+
+def post_fork(server, worker):
+    # Each worker watches config.toml and the proxies for hot reloads;
+    # threads do not survive the fork, so this cannot run in the master
+    from avauth_proxy.utils.watch_utils import start_config_watcher
+    start_config_watcher()
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live* gauges; its counters keep counting
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
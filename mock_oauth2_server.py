@@ -1,4 +1,8 @@
+import os
+import json
+import hashlib
 from flask import Flask, request, jsonify
+from joserfc.jwk import RSAKey
 from authlib.integrations.flask_oauth2 import AuthorizationServer
 from authlib.oauth2.rfc6749 import grants
 from werkzeug.security import gen_salt
@@ -7,6 +11,10 @@ from datetime import datetime, timedelta
 app = Flask(__name__)
 app.secret_key = "mock-oauth2-server-secret-key"
 
+# OpenID Connect discovery for clients that use server_metadata_url/issuer
+ISSUER = os.getenv("MOCK_OAUTH_ISSUER", "http://mock_oauth2_server:6000")
+signing_key = RSAKey.generate_key(2048, parameters={"kid": "mock-key-1", "use": "sig", "alg": "RS256"}, private=True)
+
 # Mock user database
 users = {
     "testuser": {"password": "password123", "email": "testuser@example.com", "name": "Test User"}
@@ -19,6 +27,10 @@ class Client:
         self.client_secret = client_info["client_secret"]
         self.grant_types = client_info.get("grant_types", [])
         self.allowed_scopes = client_info.get("scope", "")
+        self.redirect_uris = client_info.get("redirect_uris", [])
+
+    def get_client_id(self):
+        return self.client_id
 
     def check_client_secret(self, secret):
         return secret == self.client_secret
@@ -30,26 +42,52 @@ class Client:
         # For simplicity, just return True
         return True
 
+    def check_response_type(self, response_type):
+        return response_type == "code" and "authorization_code" in self.grant_types
+
+    def check_redirect_uri(self, redirect_uri):
+        # Any redirect URI is accepted unless the client lists some
+        return not self.redirect_uris or redirect_uri in self.redirect_uris
+
+    def get_default_redirect_uri(self):
+        return self.redirect_uris[0] if self.redirect_uris else None
+
     def get_allowed_scope(self, scope):
             # For testing, simply return the requested scope unchanged.
             # In a real scenario, you'd filter to ensure the scope is a subset of allowed scopes.
             # Here, we assume the requested scope is allowed.
             return scope
 
-# Pre-register a mock OAuth client that supports password grant
+class AuthorizationCode:
+    def __init__(self, code, client_id, redirect_uri, scope, user_id):
+        self.code = code
+        self.client_id = client_id
+        self.redirect_uri = redirect_uri
+        self.scope = scope
+        self.user_id = user_id
+
+    def get_redirect_uri(self):
+        return self.redirect_uri
+
+    def get_scope(self):
+        return self.scope
+
+# Pre-register a mock OAuth client that supports the password and
+# authorization code grants
 clients = {
     "mock_client_id": {
         "client_id": "mock_client_id",
         "client_secret": "mock_client_secret",
         "redirect_uris": [],
         "token_endpoint_auth_method": "client_secret_basic",
-        "grant_types": ["password"],
+        "grant_types": ["password", "authorization_code"],
         "response_types": [],
         "scope": "read write"
     }
 }
 
 tokens = {}
+authorization_codes = {}
 
 def current_time():
     return datetime.utcnow()
@@ -88,8 +126,29 @@ class PasswordGrant(grants.ResourceOwnerPasswordCredentialsGrant):
         request = self.request
         save_token(token, request)
 
+class AuthorizationCodeGrant(grants.AuthorizationCodeGrant):
+    TOKEN_ENDPOINT_AUTH_METHODS = ["client_secret_basic", "client_secret_post"]
+
+    def save_authorization_code(self, code, request):
+        authorization_codes[code] = AuthorizationCode(
+            code, request.client.client_id, request.payload.redirect_uri, request.scope, request.user
+        )
+
+    def query_authorization_code(self, code, client):
+        item = authorization_codes.get(code)
+        if item and item.client_id == client.client_id:
+            return item
+        return None
+
+    def delete_authorization_code(self, authorization_code):
+        authorization_codes.pop(authorization_code.code, None)
+
+    def authenticate_user(self, authorization_code):
+        return authorization_code.user_id
+
 authorization = AuthorizationServer(app, query_client=query_client, save_token=save_token)
 authorization.register_grant(PasswordGrant)
+authorization.register_grant(AuthorizationCodeGrant)
 
 @app.route("/health")
 def health():
@@ -122,9 +181,41 @@ def register_client():
     # This just returns random client creds, not stored.
     return jsonify({"client_id": client_id, "client_secret": client_secret})
 
+def cacheable_json(document, max_age=300):
+    """JSON response with Cache-Control/ETag that honours If-None-Match."""
+    body = json.dumps(document, sort_keys=True)
+    etag = '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:16] + '"'
+    headers = {"Cache-Control": f"public, max-age={max_age}", "ETag": etag}
+    if request.headers.get("If-None-Match") == etag:
+        return "", 304, headers
+    return body, 200, dict(headers, **{"Content-Type": "application/json"})
+
+@app.route("/.well-known/openid-configuration")
+def openid_configuration():
+    return cacheable_json({
+        "issuer": ISSUER,
+        "authorization_endpoint": f"{ISSUER}/oauth/authorize",
+        "token_endpoint": f"{ISSUER}/oauth/token",
+        "userinfo_endpoint": f"{ISSUER}/oauth/userinfo",
+        "jwks_uri": f"{ISSUER}/oauth/jwks",
+        "id_token_signing_alg_values_supported": ["RS256"],
+        "response_types_supported": ["code"],
+        "subject_types_supported": ["public"],
+    })
+
+@app.route("/oauth/jwks")
+def jwks():
+    return cacheable_json({"keys": [signing_key.as_dict(private=False)]})
+
 @app.route("/oauth/authorize", methods=["GET", "POST"])
 def mock_authorize():
-    return jsonify({"message": "Authorization endpoint not implemented. Use the password grant instead."}), 400
+    # No login page: the request is approved at once for `login_hint`
+    # (default testuser) and redirected back with a code.
+    user_id = request.values.get("login_hint", "testuser")
+    if user_id not in users:
+        return jsonify({"error": "unknown_user"}), 400
+    grant = authorization.get_consent_grant(end_user=user_id)
+    return authorization.create_authorization_response(grant_user=user_id, grant=grant)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=6000, debug=True)
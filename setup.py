@@ -24,4 +24,10 @@ setup(
         "coverage",
         "pytest-cov",
     ],
+    entry_points={
+        "console_scripts": [
+            "avauth-render=avauth_proxy.cli:main",
+            "avauth-proxies=avauth_proxy.cli:proxies_main",
+        ],
+    },
 )
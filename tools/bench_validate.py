@@ -0,0 +1,110 @@
+"""
+Micro-benchmark for /auth/validate: Flask-routed view vs. the bare WSGI fast path.
+
+Both variants are called in-process with the same WSGI environ, so the numbers
+measure per-request CPU cost inside one worker (no network, no gunicorn).
+
+    python tools/bench_validate.py --services 1000 --requests 20000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    "CONFIG_TOML_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "avauth_proxy", "tests", "config_test.toml"),
+)
+
+from werkzeug.test import EnvironBuilder
+from avauth_proxy import app
+from avauth_proxy.config import Config
+from avauth_proxy.utils.file_utils import save_proxies
+from avauth_proxy.utils.session_utils import ServerSideSessionInterface, new_session_id
+
+
+def make_proxies(count, emails_per_service):
+    return [
+        {
+            "service_name": f"svc{i}",
+            "url": f"10.0.{i // 256 % 256}.{i % 256}",
+            "port": "8080",
+            "auth_required": True,
+            "allowed_emails": [f"user{j}@example.com" for j in range(emails_per_service)],
+            "allowed_domains": ["example.org"],
+        }
+        for i in range(count)
+    ]
+
+
+def session_cookie(user):
+    data = {"user": user, "sid": "bench-session"}
+    interface = app.session_interface
+    if isinstance(interface, ServerSideSessionInterface):
+        session_id = new_session_id()
+        interface.store.set(session_id, data, Config.SESSION_TTL)
+        return session_id
+    return interface.get_signing_serializer(app).dumps(data)
+
+
+def run(wsgi_app, environ, requests):
+    latencies = []
+    def start_response(status, headers):
+        pass
+    for _ in range(requests):
+        env = dict(environ)
+        start = time.perf_counter()
+        for _chunk in wsgi_app(env, start_response):
+            pass
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "requests": requests,
+        "rps": round(requests / total, 1),
+        "p50_us": round(latencies[len(latencies) // 2] * 1e6, 1),
+        "p99_us": round(latencies[int(len(latencies) * 0.99)] * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--services", type=int, default=1000)
+    parser.add_argument("--emails", type=int, default=100, help="allowed_emails per service")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.PROXIES_CONFIG_FILE = os.path.join(tmp, "proxies_config.toml")
+        save_proxies(make_proxies(args.services, args.emails))
+
+        cookie = session_cookie({"email": f"user{args.emails - 1}@example.com"})
+        path = f"/auth/validate/svc{args.services - 1}"
+        environ = EnvironBuilder(
+            path=path,
+            headers={"Cookie": f"{app.config['SESSION_COOKIE_NAME']}={cookie}"},
+        ).get_environ()
+
+        dispatcher = app.wsgi_app
+        results = {
+            "services": args.services,
+            "flask": run(dispatcher.app, environ, args.requests),
+            "fast_path": run(dispatcher, environ, args.requests),
+        }
+        results["speedup"] = round(results["fast_path"]["rps"] / results["flask"]["rps"], 2)
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        for name in ("flask", "fast_path"):
+            r = results[name]
+            print(f"{name:>10}: {r['rps']:>10} req/s  p50 {r['p50_us']}us  p99 {r['p99_us']}us")
+        print(f"   speedup: {results['speedup']}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+"""
+Benchmark suite for the hot paths of avauth_proxy, with JSON output.
+
+Everything runs in one process against throw-away files: a synthetic
+proxies_config.toml per size, a temporary Nginx config directory (the
+`nginx -s reload` call is skipped) and mock_oauth2_server.py serving on a
+local port.
+
+    validate  /auth/validate through the full WSGI stack (requests/s, percentiles)
+    login     /auth/login -> provider authorize -> /auth/authorize round trips
+    generate  generate_nginx_configs() cold, unchanged and with one edit
+    startup   worker start to first /auth/validate answer, in fresh processes:
+              import only, cold create_app(), and fork() after warm_app()
+              (gunicorn preload); run against the last --services size
+
+    python tools/benchmark.py --services 10,1000,50000 --output bench.json
+    python tools/benchmark.py --only validate --compare bench.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SUITES = ("validate", "login", "generate", "startup")
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+
+    def pick(q):
+        return samples[min(len(samples) - 1, int(q * len(samples)))] * 1e6
+
+    return {
+        "p50_us": round(pick(0.50), 1),
+        "p90_us": round(pick(0.90), 1),
+        "p99_us": round(pick(0.99), 1),
+        "p999_us": round(pick(0.999), 1),
+        "max_us": round(samples[-1] * 1e6, 1),
+    }
+
+
+def make_proxies(count, emails, domains):
+    """Synthetic proxies: every service allows user0..user{emails-1}@example.com."""
+    allowed_emails = [f"user{j}@example.com" for j in range(emails)]
+    allowed_domains = [f"dept{j}.example.org" for j in range(domains)]
+    return [
+        {
+            "service_name": f"svc{i}",
+            "url": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+            "port": "8080",
+            "auth_required": i % 10 != 0,
+            "allowed_emails": allowed_emails,
+            "allowed_domains": allowed_domains,
+        }
+        for i in range(count)
+    ]
+
+
+def start_mock_provider():
+    from werkzeug.serving import make_server
+    import mock_oauth2_server
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, mock_oauth2_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def write_app_config(path, provider_url, session_backend):
+    with open(path, "w") as f:
+        f.write(f"""[app]
+secret_key = "benchmark-secret"
+session_cookie_secure = false
+session_backend = "{session_backend}"
+
+[auth]
+use_oauth2_proxy = false
+
+[[oauth_providers]]
+name = "mock_provider"
+client_id = "mock_client_id"
+client_secret = "mock_client_secret"
+authorize_url = "{provider_url}/oauth/authorize"
+access_token_url = "{provider_url}/oauth/token"
+api_base_url = "{provider_url}/oauth/"
+userinfo_endpoint = "{provider_url}/oauth/userinfo"
+client_kwargs = {{ scope = "read" }}
+""")
+
+
+def bench_validate(app, count, args, rng):
+    from avauth_proxy.utils.session_utils import ServerSideSessionInterface, new_session_id
+    from avauth_proxy.utils.cache_utils import decision_cache
+    from werkzeug.test import EnvironBuilder
+
+    cookie_name = app.config["SESSION_COOKIE_NAME"]
+    interface = app.session_interface
+
+    def cookie_for(email):
+        data = {"user": {"email": email}, "sid": new_session_id()}
+        if isinstance(interface, ServerSideSessionInterface):
+            session_id = new_session_id()
+            interface.store.set(session_id, data, 3600)
+            return session_id
+        return interface.get_signing_serializer(app).dumps(data)
+
+    allowed = [cookie_for(f"user{rng.randrange(args.emails)}@example.com") for _ in range(args.users)]
+    denied = [cookie_for(f"mallory{j}@evil.test") for j in range(max(1, args.users // 10))]
+
+    environs = []
+    for _ in range(min(args.requests, 10000)):
+        roll = rng.random()
+        headers = {}
+        if roll < 0.80:
+            headers["Cookie"] = f"{cookie_name}={rng.choice(allowed)}"
+        elif roll < 0.95:
+            headers["Cookie"] = f"{cookie_name}={rng.choice(denied)}"
+        environs.append(EnvironBuilder(path=f"/auth/validate/svc{rng.randrange(count)}", headers=headers).get_environ())
+
+    statuses = {}
+
+    def start_response(status, headers):
+        code = status[:3]
+        statuses[code] = statuses.get(code, 0) + 1
+
+    wsgi_app = app.wsgi_app
+    for environ in environs[:1000]:  # warm up policy index and caches
+        list(wsgi_app(dict(environ), start_response))
+    statuses.clear()
+    hits_before = decision_cache.hits
+
+    latencies = []
+    started = time.perf_counter()
+    for i in range(args.requests):
+        environ = dict(environs[i % len(environs)])
+        t0 = time.perf_counter()
+        for _chunk in wsgi_app(environ, start_response):
+            pass
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "services": count,
+        "requests": args.requests,
+        "rps": round(args.requests / elapsed, 1),
+        "statuses": statuses,
+        "decision_cache_hit_ratio": round((decision_cache.hits - hits_before) / args.requests, 3),
+    }
+    result.update(percentiles(latencies))
+    return result
+
+
+def bench_login(app, provider_url, args):
+    import requests
+
+    provider = requests.Session()
+    provider_host = urlsplit(provider_url).netloc
+    steps = {"login": [], "provider": [], "callback": []}
+    totals = []
+    failures = 0
+
+    for _ in range(args.logins):
+        client = app.test_client()
+        t0 = time.perf_counter()
+        response = client.get("/auth/login/mock_provider")
+        t1 = time.perf_counter()
+        location = response.headers.get("Location", "")
+        if urlsplit(location).netloc != provider_host:
+            failures += 1
+            continue
+        response = provider.get(location, allow_redirects=False)
+        t2 = time.perf_counter()
+        callback = urlsplit(response.headers.get("Location", ""))
+        response = client.get(f"{callback.path}?{callback.query}")
+        t3 = time.perf_counter()
+        if response.status_code != 302 or "/proxy/dashboard" not in response.headers.get("Location", ""):
+            failures += 1
+            continue
+        steps["login"].append(t1 - t0)
+        steps["provider"].append(t2 - t1)
+        steps["callback"].append(t3 - t2)
+        totals.append(t3 - t0)
+
+    result = {
+        "logins": args.logins,
+        "failures": failures,
+        "logins_per_s": round(len(totals) / sum(totals), 1) if totals else 0.0,
+        "steps": {name: percentiles(samples) for name, samples in steps.items()},
+    }
+    result.update(percentiles(totals))
+    return result
+
+
+def bench_generate(proxies):
+    from avauth_proxy.utils import nginx_utils
+
+    def timed(items):
+        t0 = time.perf_counter()
+        result = nginx_utils.generate_nginx_configs(items)
+        return round(time.perf_counter() - t0, 4), result
+
+    cold, cold_result = timed(proxies)
+    unchanged, _ = timed(proxies)
+    edited = list(proxies)
+    edited[0] = dict(edited[0], port="9090")
+    one_edit, edit_result = timed(edited)
+    return {
+        "services": len(proxies),
+        "cold_s": cold,
+        "unchanged_s": unchanged,
+        "one_edit_s": one_edit,
+        "cold_written": len(cold_result.written),
+        "one_edit_written": len(edit_result.written),
+        "per_service_cold_us": round(cold / max(1, len(proxies)) * 1e6, 1),
+    }
+
+
+def startup_probe(mode, proxies_file, runs):
+    """
+    Run in a fresh interpreter (see bench_startup); prints milliseconds.
+    Timing starts before avauth_proxy is imported.
+    """
+    t0 = time.perf_counter()
+    if mode == "import":
+        import avauth_proxy.utils.nginx_utils  # noqa: F401
+        print(json.dumps([round((time.perf_counter() - t0) * 1000, 2)]))
+        return
+
+    from avauth_proxy import create_app, warm_app
+    from avauth_proxy.config import Config
+    Config.PROXIES_CONFIG_FILE = proxies_file
+    app = create_app()
+    client = app.test_client()
+    if mode == "cold":
+        client.get("/auth/validate/svc0")
+        print(json.dumps([round((time.perf_counter() - t0) * 1000, 2)]))
+        return
+
+    warm_app(app)
+    samples = []
+    for _ in range(runs):
+        read_fd, write_fd = os.pipe()
+        forked_at = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            client.get("/auth/validate/svc0")
+            os.write(write_fd, str(time.perf_counter() - forked_at).encode())
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as f:
+            samples.append(round(float(f.read()) * 1000, 2))
+        os.waitpid(pid, 0)
+    print(json.dumps(samples))
+
+
+def bench_startup(workdir, runs):
+    def probe(mode):
+        samples = []
+        for _ in range(1 if mode == "preload" else runs):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--startup-probe", mode,
+                 "--startup-runs", str(runs), "--proxies-file", os.path.join(workdir, "proxies_config.toml")],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            samples += json.loads(out.strip().splitlines()[-1])
+        samples.sort()
+        return {"min_ms": samples[0], "p50_ms": samples[len(samples) // 2], "max_ms": samples[-1]}
+
+    return {"runs": runs, "import": probe("import"), "cold": probe("cold"), "preload": probe("preload")}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print ratios against a previous run; >1 means faster for rates, slower for times."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    rows = []
+    for suite, key, metric in (
+        ("validate", "services", "rps"), ("validate", "services", "p99_us"),
+        ("generate", "services", "cold_s"), ("generate", "services", "one_edit_s"),
+    ):
+        old = {entry[key]: entry for entry in baseline.get(suite, [])}
+        for entry in results.get(suite, []):
+            if entry[key] in old and old[entry[key]].get(metric):
+                rows.append((suite, entry[key], metric, old[entry[key]][metric], entry[metric]))
+    for mode in ("import", "cold", "preload"):
+        if mode in results.get("startup", {}) and mode in baseline.get("startup", {}):
+            rows.append(("startup", mode, "p50_ms", baseline["startup"][mode]["p50_ms"], results["startup"][mode]["p50_ms"]))
+    if "login" in results and "login" in baseline:
+        rows.append(("login", "-", "p50_us", baseline["login"].get("p50_us"), results["login"].get("p50_us")))
+    for suite, size, metric, old, new in rows:
+        if old and new:
+            print(f"{suite:>9} {size!s:>7} {metric:>11}: {old:>12} -> {new:>12}  ({new / old:.2f}x)", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", default="10,1000,10000", help="comma separated proxy counts")
+    parser.add_argument("--emails", type=int, default=100, help="allowed emails per service")
+    parser.add_argument("--domains", type=int, default=5, help="allowed domains per service")
+    parser.add_argument("--users", type=int, default=500, help="distinct logged-in users in the validate mix")
+    parser.add_argument("--requests", type=int, default=20000, help="validate requests per size")
+    parser.add_argument("--logins", type=int, default=200, help="login round trips")
+    parser.add_argument("--session-backend", default="memory", choices=["cookie", "memory", "sqlite"])
+    parser.add_argument("--only", default=",".join(SUITES), help="comma separated suites to run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON here (default: stdout)")
+    parser.add_argument("--compare", help="previous JSON results to compare with")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary work directory")
+    parser.add_argument("--startup-runs", type=int, default=10, help="process starts per startup measurement")
+    parser.add_argument("--startup-probe", choices=["import", "cold", "preload"], help=argparse.SUPPRESS)
+    parser.add_argument("--proxies-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_probe:
+        # Child process of bench_startup
+        startup_probe(args.startup_probe, args.proxies_file, args.startup_runs)
+        return
+
+    sizes = [int(size) for size in args.services.split(",") if size]
+    suites = [suite for suite in args.only.split(",") if suite]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="avauth-bench-")
+    server = start_mock_provider()
+    provider_url = f"http://127.0.0.1:{server.server_port}"
+    config_path = os.path.join(workdir, "config.toml")
+    write_app_config(config_path, provider_url, args.session_backend)
+    os.environ["CONFIG_TOML_FILE"] = config_path
+    os.environ["SESSION_SQLITE_FILE"] = os.path.join(workdir, "sessions.db")
+    os.environ["OIDC_CACHE_DIR"] = os.path.join(workdir, "oidc_cache")
+
+    from avauth_proxy import app
+    from avauth_proxy.config import Config
+    from avauth_proxy.utils import nginx_utils
+    from avauth_proxy.utils.file_utils import save_proxies
+
+    Config.EVENTS_LOG_FILE = os.path.join(workdir, "logs", "events.log")
+    Config.PROXIES_CONFIG_FILE = os.path.join(workdir, "proxies_config.toml")
+    nginx_utils.reload_nginx = lambda: None
+    app.config["TESTING"] = True
+
+    rng = random.Random(args.seed)
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "args": vars(args),
+        }
+    }
+
+    for count in sizes:
+        proxies = make_proxies(count, args.emails, args.domains)
+        t0 = time.perf_counter()
+        save_proxies(proxies)
+        print(f"[{count} services] stored proxies in {time.perf_counter() - t0:.2f}s", file=sys.stderr)
+        if "validate" in suites:
+            entry = bench_validate(app, count, args, rng)
+            results.setdefault("validate", []).append(entry)
+            print(f"  validate: {entry['rps']} req/s p50 {entry['p50_us']}us p99 {entry['p99_us']}us", file=sys.stderr)
+        if "generate" in suites:
+            Config.NGINX_CONFIG_DIR = os.path.join(workdir, f"nginx-{count}")
+            entry = bench_generate(proxies)
+            results.setdefault("generate", []).append(entry)
+            print(f"  generate: cold {entry['cold_s']}s unchanged {entry['unchanged_s']}s one edit {entry['one_edit_s']}s", file=sys.stderr)
+
+    if "startup" in suites:
+        results["startup"] = bench_startup(workdir, args.startup_runs)
+        print("startup: " + ", ".join(
+            f"{mode} p50 {results['startup'][mode]['p50_ms']}ms" for mode in ("import", "cold", "preload")
+        ), file=sys.stderr)
+
+    if "login" in suites:
+        results["login"] = bench_login(app, provider_url, args)
+        print(f"login: {results['login']['logins_per_s']} logins/s p50 {results['login'].get('p50_us')}us "
+              f"({results['login']['failures']} failures)", file=sys.stderr)
+
+    server.shutdown()
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
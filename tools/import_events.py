@@ -0,0 +1,26 @@
+"""
+Import an existing events log (JSON or legacy Python-repr lines) into the
+indexed event store at Config.EVENTS_LOG_FILE. Stop the app first.
+
+    CONFIG_TOML_FILE=config.toml python tools/import_events.py old-events.log
+"""
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avauth_proxy.utils.event_utils import import_event_log
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import an events log into the event store")
+    parser.add_argument("source", nargs="+", help="log file(s) to import")
+    args = parser.parse_args()
+    for source in args.source:
+        imported = import_event_log(source)
+        print(f"{source}: imported {imported} events")
+
+
+if __name__ == "__main__":
+    main()